@@ -23,7 +23,49 @@ class Config:
     
     # LM Studio
     LM_STUDIO_URL = os.getenv('LM_STUDIO_URL', 'http://localhost:1234/v1')
-    LM_STUDIO_TIMEOUT = 30
+    LM_STUDIO_TIMEOUT = 30  # read timeout (seconds)
+    LM_STUDIO_CONNECT_TIMEOUT = 5
+    LM_STUDIO_POOL_SIZE = 10  # max keep-alive connections to LM Studio
+    # Comma-separated LM Studio hosts to balance across
+    LM_STUDIO_URLS = [url.strip() for url in os.getenv('LM_STUDIO_URLS', LM_STUDIO_URL).split(',') if url.strip()]
+    LM_STUDIO_RETRIES = 2  # other backends tried before the first token
+    LM_STUDIO_MAX_FAILURES = 3  # consecutive failures before a backend is ejected
+    LM_STUDIO_EJECT_SECONDS = 30  # first ejection; doubles on repeats
+    LM_STUDIO_HEALTH_INTERVAL = 10  # seconds between active health checks; 0 disables
+    
+    # Model per LLM task; unset tasks use whatever model LM Studio has loaded
+    LM_STUDIO_MODELS = {
+        'chat': os.getenv('LM_STUDIO_CHAT_MODEL'),  # conversational replies
+        'sql': os.getenv('LM_STUDIO_SQL_MODEL'),  # NL-to-SQL; a small fast model
+        'format': os.getenv('LM_STUDIO_FORMAT_MODEL'),  # music result summaries
+        'summary': os.getenv('LM_STUDIO_SUMMARY_MODEL'),  # background chat summaries
+    }
+    # Concurrent requests per model name, or per task while its model is unset
+    LM_STUDIO_MODEL_CONCURRENCY = {'chat': 4, 'sql': 8, 'format': 4, 'summary': 1}
+    LM_STUDIO_MODEL_DEFAULT_CONCURRENCY = 4
+    
+    # LLM completion cache (exact match; sampled requests bypass it)
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'false').lower() == 'true'
+    LLM_CACHE_MAX_ENTRIES = 512
+    LLM_CACHE_TTL = 3600
+    
+    # Music NL-to-SQL translation cache
+    MUSIC_SQL_CACHE_SIZE = 1024
+    MUSIC_SQL_CACHE_TTL = 24 * 3600
+    MUSIC_TEMPLATE_MIN_SUPPORT = 2  # distinct literals before a shape is trusted
+    MUSIC_SQL_CANDIDATES = int(os.getenv('MUSIC_SQL_CANDIDATES', '1'))  # >1 races that many LLM candidates
+    
+    # Music database
+    MUSIC_DB_PATH = os.getenv('MUSIC_DB_PATH', 'music.db')
+    MUSIC_DB_POOL_SIZE = 4  # pooled read-only connections
+    MUSIC_QUERY_TIMEOUT = 2.0  # seconds before a query is interrupted
+    MUSIC_QUERY_MAX_ROWS = 10000  # hard cap on rows any query returns
+    # Usernames allowed to import over HTTP; empty disables the endpoint
+    MUSIC_IMPORT_ADMINS = [name.strip() for name in os.getenv('MUSIC_IMPORT_ADMINS', '').split(',') if name.strip()]
+    
+    # Music query results
+    MUSIC_RESULTS_MAX_ROWS = 200  # rows sent to the client as a table
+    MUSIC_PROMPT_MAX_ROWS = 30  # rows given to the LLM to summarize
     
     # Session
     SESSION_TYPE = 'filesystem'
@@ -43,6 +85,9 @@ class Config:
     # Cache
     CACHE_TYPE = "simple"
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_LOCAL_MAX_ENTRIES = 4096  # per-process tier in front of CACHE_TYPE
+    CACHE_LOCAL_TTL = 5  # seconds other processes may serve a stale entry
+    CACHE_LOCK_TIMEOUT = 10  # seconds a loader holds a key against a stampede
     
     # WebSocket
     SOCKETIO_MESSAGE_QUEUE = None
@@ -50,6 +95,47 @@ class Config:
     SOCKETIO_PING_TIMEOUT = 10
     SOCKETIO_PING_INTERVAL = 25
     
+    # Generation scheduling
+    GENERATION_MAX_CONCURRENT = 4  # simultaneous LM Studio generations, all lanes
+    GENERATION_LANE_LIMITS = {'chat': 3}  # lower caps per lane; keeps a slot for music
+    GENERATION_MAX_QUEUE = 100  # waiting generations across all users
+    GENERATION_MAX_QUEUE_PER_USER = 10
+    GENERATION_REGISTRY_URL = None  # shared cancel registry; None = in-process
+    # Usernames allowed to read /api/generation/queue; empty disables it
+    GENERATION_STATS_ADMINS = [name.strip() for name in os.getenv('GENERATION_STATS_ADMINS', '').split(',') if name.strip()]
+    
+    # Streamed message persistence
+    STREAM_FLUSH_INTERVAL = 1.0  # max seconds of a reply lost on a crash
+    STREAM_FLUSH_CHARS = 2048
+    
+    # Streamed chunk coalescing (0 window sends one frame per token)
+    STREAM_COALESCE_WINDOW = 0.04  # seconds
+    STREAM_COALESCE_BYTES = 1024
+    
+    # Conversation context sent to the LLM
+    CONTEXT_TOKEN_BUDGET = 3000  # estimated prompt tokens per turn
+    CONTEXT_STRATEGY = 'truncate'  # 'truncate' or 'summary'
+    CONTEXT_SYSTEM_PROMPT = None
+    
+    # Background LLM summaries for the 'summary' context strategy
+    SUMMARY_BACKGROUND = True
+    SUMMARY_THRESHOLD_MESSAGES = 30  # unsummarized messages that trigger a fold
+    SUMMARY_KEEP_RECENT = 10  # newest messages never folded
+    SUMMARY_BATCH_SIZE = 50  # messages folded per LLM call
+    SUMMARY_MAX_TOKENS = 300
+    
+    # Chat history pagination
+    MESSAGE_PAGE_SIZE = 50
+    MESSAGE_PAGE_MAX = 200
+    CHAT_PAGE_SIZE = 30  # sidebar chats per page
+    CHAT_PAGE_MAX = 100
+    
+    # Full-text message search
+    SEARCH_INDEX_BATCH_SIZE = 200  # pending messages that trigger a reindex
+    SEARCH_INDEX_FLUSH_INTERVAL = 2.0  # seconds
+    SEARCH_PAGE_SIZE = 20
+    SEARCH_PAGE_MAX = 50
+    
     # File Upload
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max file size
     UPLOAD_FOLDER = 'uploads'
@@ -58,7 +144,20 @@ class Config:
     # Logging
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     LOG_LEVEL = 'INFO'
-    LOG_FILE = 'app.log'
+    LOG_FILE = os.getenv('LOG_FILE', 'app.log')  # empty disables the log file
+    LOG_MAX_BYTES = 10 * 1024 * 1024  # rotate the log file at this size
+    LOG_BACKUP_COUNT = 5
+    
+    # Metrics, scraped from /metrics in the Prometheus text format
+    METRICS_ENABLED = True
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # bearer token required when set
+    
+    # Request tracing
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))  # fraction of requests traced
+    TRACE_EXPORTER = os.getenv('TRACE_EXPORTER', 'jsonl')  # 'jsonl', 'otlp' or empty to disable
+    TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+    TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACE_SERVICE_NAME = 'lmstudio-web-wrapper'
 
 class ProductionConfig(Config):
     """Production configuration"""
@@ -83,6 +182,9 @@ class ProductionConfig(Config):
     
     # Use Redis for WebSocket message queue
     SOCKETIO_MESSAGE_QUEUE = os.getenv('REDIS_URL', 'redis://localhost:6379/2')
+    
+    # Share generation ownership so any worker can stop a generation
+    GENERATION_REGISTRY_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/3')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -109,6 +211,7 @@ class TestingConfig(Config):
     
     # Use in-memory SQLite database
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}  # pool sizing does not apply to :memory:
     
     # Disable CSRF for testing
     WTF_CSRF_ENABLED = False
@@ -124,6 +227,15 @@ class TestingConfig(Config):
     
     # Disable WebSocket message queue for testing
     SOCKETIO_MESSAGE_QUEUE = None
+    
+    # No background LM Studio health checks in tests
+    LM_STUDIO_HEALTH_INTERVAL = 0
+    
+    # Keep test runs out of the application log
+    LOG_FILE = None
+    
+    # No trace files from test runs
+    TRACE_EXPORTER = None
 
 # Configuration dictionary
 config = {
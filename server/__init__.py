@@ -1,5 +1,8 @@
 # server/__init__.py
 
+import logging
+import os
+from logging.handlers import RotatingFileHandler
 from flask import Flask
 from flask_socketio import SocketIO
 from flask_login import LoginManager
@@ -8,10 +11,37 @@ from config import get_config
 socketio = SocketIO()
 login_manager = LoginManager()
 
+def init_logging(app):
+    """
+    Write application logs to LOG_FILE in LOG_FORMAT at LOG_LEVEL.
+    
+    Args:
+        app: Flask application; nothing is written when LOG_FILE is unset
+    """
+    log_file = app.config.get('LOG_FILE')
+    if not log_file:
+        return
+    path = os.path.abspath(log_file)
+    root = logging.getLogger()
+    # create_app may run more than once per process
+    if any(getattr(handler, 'baseFilename', None) == path for handler in root.handlers):
+        return
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=app.config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+        backupCount=app.config.get('LOG_BACKUP_COUNT', 5)
+    )
+    handler.setFormatter(logging.Formatter(app.config.get('LOG_FORMAT')))
+    handler.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+    root.addHandler(handler)
+    if root.getEffectiveLevel() > handler.level:
+        root.setLevel(handler.level)
+
 def create_app(config_name='default'):
     """Application factory function"""
     app = Flask(__name__)
     app.config.from_object(get_config(config_name))
+    init_logging(app)
 
     # Initialize Flask-Login
     login_manager.init_app(app)
@@ -19,9 +49,26 @@ def create_app(config_name='default'):
 
     # Initialize extensions
     from .database import init_db, User  # Import User model
+    from .cache import init_cache
+    from .llm import init_llm
+    from .metrics import init_metrics
+    from .tracing import init_tracing, trace_cli
+    from .migrations import db_cli
+    from .music_index import music_cli
     init_db(app)
+    init_cache(app)
+    init_llm(app)
+    init_metrics(app)
+    init_tracing(app)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(music_cli)
+    app.cli.add_command(trace_cli)
     socketio.init_app(app)
 
+    # Register Socket.IO event handlers
+    from .websocket import WebSocketHandler
+    app.extensions['websocket_handler'] = WebSocketHandler(socketio, app)
+
     # User loader for Flask-Login
     @login_manager.user_loader
     def load_user(user_id):
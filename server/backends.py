@@ -0,0 +1,211 @@
+# server/backends.py
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+import requests
+
+logger = logging.getLogger(__name__)
+
+class NoBackendAvailable(Exception):
+    """Raised when every LM Studio backend has been tried"""
+    pass
+
+class Backend:
+    """One LM Studio server and its routing and health state"""
+    
+    def __init__(self, url: str):
+        """
+        Initialize the backend.
+        
+        Args:
+            url (str): Base URL, e.g. http://host:1234/v1
+        """
+        self.url = url.rstrip('/')
+        self.completion_url = f"{self.url}/chat/completions"
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+    
+    @property
+    def ejected(self) -> bool:
+        """Whether the backend is currently out of rotation"""
+        return self.ejected_until > time.monotonic()
+    
+    def __repr__(self):
+        return f"<Backend {self.url}>"
+
+class BackendPool:
+    """
+    Routes LLM requests across several LM Studio servers.
+    
+    Each request goes to the available backend with the fewest requests in
+    flight. Backends that fail max_failures times in a row (passive check)
+    or fail an active health probe are ejected for eject_seconds, doubling
+    on each repeat ejection. They are readmitted when the ejection lapses
+    and a request or probe succeeds. If every backend is ejected, requests
+    still go to the least recently ejected one rather than failing outright.
+    """
+    
+    def __init__(self, urls: Iterable[str], max_failures: int = 3,
+                 eject_seconds: float = 30, max_eject_seconds: float = 300):
+        """
+        Initialize the pool.
+        
+        Args:
+            urls (Iterable[str]): Base URLs of the LM Studio servers
+            max_failures (int): Consecutive failures before ejection
+            eject_seconds (float): First ejection period
+            max_eject_seconds (float): Longest ejection period
+        """
+        self.backends = [Backend(url) for url in urls]
+        if not self.backends:
+            raise ValueError("At least one LM Studio backend is required")
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self._next = 0
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+    
+    def acquire(self, exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        Pick a backend for a request and count it as in flight.
+        
+        Args:
+            exclude (Iterable[Backend]): Backends already tried
+        
+        Returns:
+            Backend: Backend to send the request to; pass it to release()
+        
+        Raises:
+            NoBackendAvailable: If every backend is excluded
+        """
+        excluded = set(exclude)
+        with self._lock:
+            candidates = [b for b in self.backends if b not in excluded]
+            if not candidates:
+                raise NoBackendAvailable("All LM Studio backends failed")
+            healthy = [b for b in candidates if not b.ejected]
+            if healthy:
+                # Rotate the starting point so ties spread evenly
+                start = self._next % len(self.backends)
+                self._next += 1
+                order = {b: (i - start) % len(self.backends) for i, b in enumerate(self.backends)}
+                backend = min(healthy, key=lambda b: (b.outstanding, order[b]))
+            else:
+                backend = min(candidates, key=lambda b: b.ejected_until)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+    
+    def release(self, backend: Backend, ok: bool = True):
+        """
+        Finish a request and record its outcome.
+        
+        Args:
+            backend (Backend): Backend returned by acquire()
+            ok (bool): Whether the backend handled the request; client
+                errors and cancellations count as handled
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                self._mark_healthy(backend)
+            else:
+                backend.errors += 1
+                backend.failures += 1
+                if backend.failures >= self.max_failures:
+                    self._eject(backend)
+    
+    def _mark_healthy(self, backend: Backend):
+        if backend.ejected_until:
+            logger.info("Readmitting LM Studio backend %s", backend.url)
+        backend.failures = 0
+        backend.ejections = 0
+        backend.ejected_until = 0.0
+    
+    def _eject(self, backend: Backend):
+        period = min(self.eject_seconds * (2 ** backend.ejections), self.max_eject_seconds)
+        backend.ejections += 1
+        backend.failures = 0
+        backend.ejected_until = time.monotonic() + period
+        logger.warning("Ejecting LM Studio backend %s for %.0fs", backend.url, period)
+    
+    def check(self, backend: Backend, timeout: float = 2.0) -> bool:
+        """
+        Actively probe a backend and update its health.
+        
+        Args:
+            backend (Backend): Backend to probe
+            timeout (float): Probe timeout in seconds
+        
+        Returns:
+            bool: Whether the backend answered
+        """
+        try:
+            requests.get(f"{backend.url}/models", timeout=timeout).raise_for_status()
+            healthy = True
+        except requests.exceptions.RequestException:
+            healthy = False
+        with self._lock:
+            if healthy:
+                self._mark_healthy(backend)
+            elif not backend.ejected:
+                self._eject(backend)
+        return healthy
+    
+    def check_all(self, timeout: float = 2.0) -> Dict[str, bool]:
+        """Probe every backend; returns health by URL"""
+        return {backend.url: self.check(backend, timeout) for backend in self.backends}
+    
+    def start_health_checks(self, interval: float, timeout: float = 2.0):
+        """
+        Probe every backend in a background thread every interval seconds.
+        
+        Args:
+            interval (float): Seconds between probe rounds
+            timeout (float): Probe timeout in seconds
+        """
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        
+        def run():
+            while not self._stop.wait(interval):
+                self.check_all(timeout)
+        
+        self._stop.clear()
+        self._health_thread = threading.Thread(target=run, name='llm-health', daemon=True)
+        self._health_thread.start()
+    
+    def stop_health_checks(self):
+        """Stop the background health checks"""
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+            self._health_thread = None
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        Get routing and health state per backend.
+        
+        Returns:
+            List[Dict[str, Any]]: URL, in-flight and total requests, errors
+            and whether the backend is ejected
+        """
+        with self._lock:
+            return [
+                {
+                    'url': b.url,
+                    'outstanding': b.outstanding,
+                    'requests': b.requests,
+                    'errors': b.errors,
+                    'ejected': b.ejected
+                }
+                for b in self.backends
+            ]
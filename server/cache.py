@@ -2,8 +2,13 @@
 
 from flask_caching import Cache
 from functools import wraps
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
 import hashlib
 import json
+import threading
+import time
+from config.settings import Config
 
 cache = Cache(config={
     'CACHE_TYPE': 'simple',
@@ -22,36 +27,311 @@ def init_cache(app):
         cache_config['CACHE_REDIS_URL'] = app.config['CACHE_REDIS_URL']
     
     cache.init_app(app, config=cache_config)
+    # The local tier must not outlive the shared tier it fronts
+    tiered_cache.local.clear()
+
+class LRUCache:
+    """Thread-safe in-process cache with per-entry TTL and LRU eviction"""
+    
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries (int): Entries kept before the least recently used
+                one is evicted
+            ttl (float): Default seconds an entry stays valid
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a value, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, key: str, value: Any, ttl: float = None):
+        """Store a value, evicting the least recently used entry if full"""
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str):
+        """Remove a value if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        """Remove every value"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups served from the cache"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+class CompletionCache(LRUCache):
+    """
+    Exact-match cache for LLM completions.
+    
+    Entries are keyed on the whitespace-normalized messages plus the sampling
+    parameters. Sampled (temperature > 0) requests are not cacheable unless
+    the caller forces it, since identical prompts are expected to differ.
+    """
+    
+    KEY_PARAMS = ('model', 'temperature', 'max_tokens', 'top_p')
+    
+    def make_key(self, payload: Dict[str, Any], force: bool = False) -> Optional[str]:
+        """
+        Build the cache key for a completion request.
+        
+        Args:
+            payload (Dict[str, Any]): Chat completion request body
+            force (bool): Cache even when temperature > 0
+        
+        Returns:
+            Optional[str]: Cache key, or None if the request must bypass
+        """
+        if payload.get('temperature', 0) > 0 and not force:
+            return None
+        
+        key_dict = {
+            'messages': [
+                (message['role'], ' '.join(message['content'].split()))
+                for message in payload['messages']
+            ],
+            'params': {name: payload.get(name) for name in self.KEY_PARAMS},
+            'stream': payload.get('stream', False)
+        }
+        return hashlib.sha256(json.dumps(key_dict, sort_keys=True).encode()).hexdigest()
+
+completion_cache = CompletionCache(
+    max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+    ttl=Config.LLM_CACHE_TTL
+)
+
+class TieredCache:
+    """
+    Two-tier cache: a per-process LRU in front of the shared Flask-Caching
+    backend (Redis in production).
+    
+    Reads are served from the local tier when possible and fall through to
+    the shared tier, which refills the local one. Local entries live only
+    briefly, so other processes see invalidations within local_ttl seconds.
+    Misses are loaded once: concurrent callers for the same key wait for
+    the first loader instead of all hitting the database.
+    """
+    
+    def __init__(self, backend: Cache, local: LRUCache, lock_timeout: float = 10,
+                 lock_stripes: int = 64):
+        """
+        Initialize the cache.
+        
+        Args:
+            backend (Cache): Shared tier
+            local (LRUCache): Per-process tier
+            lock_timeout (float): Seconds a loader may hold a key's lock
+                before other processes load it themselves
+            lock_stripes (int): In-process locks keys are spread over
+        """
+        self.backend = backend
+        self.local = local
+        self.lock_timeout = lock_timeout
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+        self.counts = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'loads': 0, 'waits': 0}
+        self._counts_lock = threading.Lock()
+    
+    def _count(self, name: str):
+        """Increment a statistics counter; request threads share them"""
+        with self._counts_lock:
+            self.counts[name] += 1
+    
+    def _lookup(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+        value = self.backend.get(key)
+        if value is not None:
+            self._count('shared_hits')
+            self.local.set(key, value)
+        return value
+    
+    def get(self, key: str) -> Any:
+        """Get a value from the nearest tier that has it, or None"""
+        value = self._lookup(key)
+        if value is None:
+            self._count('misses')
+        return value
+    
+    def set(self, key: str, value: Any, timeout: Optional[int] = None):
+        """Store a value in both tiers"""
+        self.backend.set(key, value, timeout=timeout)
+        self.local.set(key, value)
+    
+    def delete(self, key: str):
+        """Remove a value from both tiers"""
+        self.local.delete(key)
+        self.backend.delete(key)
+    
+    def get_or_set(self, key: str, loader: Callable[[], Any], timeout: Optional[int] = None) -> Any:
+        """
+        Get a value, loading and storing it on a miss.
+        
+        Args:
+            key (str): Cache key
+            loader (Callable[[], Any]): Produces the value; must not
+                return None
+            timeout (int, optional): Seconds the shared tier keeps it
+        
+        Returns:
+            Any: Cached or freshly loaded value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        
+        # One loader per key in this process...
+        with self._locks[hash(key) % len(self._locks)]:
+            value = self._lookup(key)
+            if value is not None:
+                return value
+            
+            # ...and across processes, via an add-if-absent lock
+            lock_key = f"lock:{key}"
+            locked = self.backend.add(lock_key, 1, timeout=int(self.lock_timeout))
+            if not locked:
+                self._count('waits')
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    value = self.backend.get(key)
+                    if value is not None:
+                        self.local.set(key, value)
+                        return value
+            try:
+                self._count('loads')
+                value = loader()
+                self.set(key, value, timeout)
+            finally:
+                # A caller that gave up waiting loads without the lock and
+                # must not release the one another process holds
+                if locked:
+                    self.backend.delete(lock_key)
+            return value
+    
+    def namespace_key(self, namespace: str, suffix: str) -> str:
+        """
+        Build a key inside a namespace that can be invalidated as a whole.
+        
+        Args:
+            namespace (str): Group of related keys, e.g. one user's chats
+            suffix (str): Key within the namespace
+        
+        Returns:
+            str: Key including the namespace's current version
+        """
+        version_key = f"version:{namespace}"
+        version = self.local.get(version_key)
+        if version is None:
+            version = self.backend.get(version_key)
+            if version is None:
+                # Start from the clock, so a version lost from the shared
+                # tier never restarts at a number that was used before
+                self.backend.add(version_key, int(time.time() * 1000), timeout=0)
+                version = self.backend.get(version_key)
+            self.local.set(version_key, version)
+        return f"{namespace}:v{version}:{suffix}"
+    
+    def invalidate_namespace(self, namespace: str):
+        """Make every key in a namespace stale"""
+        version_key = f"version:{namespace}"
+        self.local.delete(version_key)
+        # Stale entries are never read again and expire on their own
+        version = self.backend.cache.inc(version_key)
+        if version is not None:
+            self.local.set(version_key, version)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+        
+        Returns:
+            Dict[str, Any]: Hits per tier, misses, loads, waits on another
+            loader, and the overall and local hit ratios
+        """
+        with self._counts_lock:
+            counts = dict(self.counts)
+        lookups = counts['local_hits'] + counts['shared_hits'] + counts['misses']
+        hits = counts['local_hits'] + counts['shared_hits']
+        counts['hit_ratio'] = hits / lookups if lookups else 0.0
+        counts['local_hit_ratio'] = counts['local_hits'] / lookups if lookups else 0.0
+        counts['local_entries'] = len(self.local)
+        return counts
+
+tiered_cache = TieredCache(
+    cache,
+    LRUCache(max_entries=Config.CACHE_LOCAL_MAX_ENTRIES, ttl=Config.CACHE_LOCAL_TTL),
+    lock_timeout=Config.CACHE_LOCK_TIMEOUT
+)
 
 def cache_key(*args, **kwargs):
     """Generate a cache key from function arguments"""
     key_dict = {'args': args, 'kwargs': kwargs}
-    return hashlib.md5(json.dumps(key_dict, sort_keys=True).encode()).hexdigest()
+    return hashlib.md5(json.dumps(key_dict, sort_keys=True, default=str).encode()).hexdigest()
 
-def cached_with_key(*cache_args, **cache_kwargs):
-    """Custom caching decorator with key generation"""
+def cached_with_key(timeout: Optional[int] = None):
+    """
+    Cache a function's results in the tiered cache.
+    
+    The function must return plain serializable data, not ORM objects, and
+    never None.
+    
+    Args:
+        timeout (int, optional): Seconds the shared tier keeps results
+    """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            cache_value = cache.get(cache_key(args, kwargs))
-            if cache_value is not None:
-                return cache_value
-            value = f(*args, **kwargs)
-            cache.set(cache_key(args, kwargs), value, *cache_args, **cache_kwargs)
-            return value
+            key = f"{f.__module__}.{f.__qualname__}:{cache_key(*args, **kwargs)}"
+            return tiered_cache.get_or_set(key, lambda: f(*args, **kwargs), timeout)
         return decorated_function
     return decorator
 
-# Example cached functions that might be useful
-@cache.memoize(300)
-def get_user_chats(user_id):
-    """Cache user chats for 5 minutes"""
-    from .database import Chat
-    return Chat.query.filter_by(user_id=user_id).all()
-
-@cache.memoize(3600)
-def get_user_preferences(user_id):
-    """Cache user preferences for 1 hour"""
-    from .database import User
-    user = User.query.get(user_id)
-    return user.preferences if user else None
+def cache_stats() -> Dict[str, Any]:
+    """
+    Get hit ratios for the application's caches.
+    
+    Returns:
+        Dict[str, Any]: Tiered cache statistics and LLM completion cache
+        hits, misses and hit ratio
+    """
+    return {
+        'tiered': tiered_cache.stats(),
+        'completions': {
+            'hits': completion_cache.hits,
+            'misses': completion_cache.misses,
+            'hit_ratio': completion_cache.hit_ratio,
+            'entries': len(completion_cache)
+        }
+    }
@@ -1,20 +1,48 @@
 # server/chat.py
 
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, current_app
 from flask_login import login_required, current_user
 from flask_socketio import emit, join_room, leave_room
+import logging
+import time
 from datetime import datetime
+from sqlalchemy import func, tuple_
+from .cache import cache_stats, tiered_cache
+from .context import invalidate_history
 from .database import db, Chat, Message
-from .llm import LMStudioClient
-from .music import MusicQueryProcessor
+from .llm import get_backend_pool, get_model_router
+from .metrics import DB_COMMIT_DURATION
+from .search import search_index
+
+logger = logging.getLogger(__name__)
 
 chat_bp = Blueprint('chat', __name__)
-lm_client = LMStudioClient()
-music_processor = MusicQueryProcessor()
 
 class ChatManager:
     """Manages chat operations and message handling"""
     
+    @staticmethod
+    def _chats_namespace(user_id):
+        return f"chats:{user_id}"
+    
+    @staticmethod
+    def invalidate_user_chats(user_id):
+        """Drop a user's cached chat list"""
+        tiered_cache.invalidate_namespace(ChatManager._chats_namespace(user_id))
+    
+    @staticmethod
+    def _owner(chat_id):
+        """Get the ID of the user who owns a chat"""
+        # Owners never change, so add_message can find whose chat list to
+        # invalidate without a query per message
+        key = f"owner:{chat_id}"
+        user_id = tiered_cache.local.get(key)
+        if user_id is None:
+            user_id = db.session.query(Chat.user_id).filter_by(id=chat_id).scalar()
+            if user_id is not None:
+                tiered_cache.local.set(key, user_id, ttl=3600)
+        return user_id
+    
     @staticmethod
     def create_chat(user_id, title=None, chat_type='general'):
         """
@@ -24,13 +52,13 @@ class ChatManager:
             user_id (int): ID of the user creating the chat
             title (str, optional): Title of the chat
             chat_type (str): Type of chat ('general' or 'music')
-            
+        
         Returns:
             Chat: Created chat instance
         """
         if not title:
             title = f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            
+        
         chat = Chat(
             title=title,
             user_id=user_id,
@@ -38,6 +66,7 @@ class ChatManager:
         )
         db.session.add(chat)
         db.session.commit()
+        ChatManager.invalidate_user_chats(user_id)
         return chat
     
     @staticmethod
@@ -45,11 +74,106 @@ class ChatManager:
         """Get all chats for a user"""
         return Chat.query.filter_by(user_id=user_id).order_by(Chat.created_at.desc()).all()
     
+    @staticmethod
+    def get_chat_summaries(user_id, before_id=None, limit=30):
+        """
+        Get one page of a user's chats as lightweight summaries.
+        
+        Only the columns the sidebar needs are selected, plus the time of the
+        chat's latest message. Pages follow the (created_at, id) order of the
+        chat index, newest first, so renames never reorder the list.
+        
+        Args:
+            user_id (int): ID of the user
+            before_id (int, optional): Return chats created before this one;
+                None returns the newest page
+            limit (int): Maximum number of chats to return
+        
+        Returns:
+            tuple: (list of summary dicts, whether older chats exist)
+        """
+        last_activity = (
+            db.session.query(func.max(Message.timestamp))
+            .filter(Message.chat_id == Chat.id)
+            .correlate(Chat)
+            .scalar_subquery()
+        )
+        query = db.session.query(
+            Chat.id, Chat.title, Chat.chat_type, Chat.created_at,
+            last_activity.label('last_activity')
+        ).filter(Chat.user_id == user_id)
+        
+        if before_id is not None:
+            cursor = db.session.query(Chat.created_at, Chat.id).filter_by(
+                id=before_id, user_id=user_id).first()
+            if cursor is None:
+                return [], False
+            query = query.filter(tuple_(Chat.created_at, Chat.id) < tuple_(*cursor))
+        
+        rows = query.order_by(Chat.created_at.desc(), Chat.id.desc()).limit(limit + 1).all()
+        summaries = [
+            {
+                'id': row.id,
+                'title': row.title,
+                'type': row.chat_type,
+                'created_at': row.created_at.isoformat(),
+                'last_activity': (row.last_activity or row.created_at).isoformat()
+            }
+            for row in rows[:limit]
+        ]
+        return summaries, len(rows) > limit
+    
+    @staticmethod
+    def get_recent_chats(user_id, limit=30):
+        """
+        Get the newest page of a user's chat summaries through the cache.
+        
+        Args:
+            user_id (int): ID of the user
+            limit (int): Maximum number of chats to return
+        
+        Returns:
+            tuple: (list of summary dicts, whether older chats exist)
+        """
+        key = tiered_cache.namespace_key(ChatManager._chats_namespace(user_id), f"first:{limit}")
+        page = tiered_cache.get_or_set(key, lambda: dict(zip(
+            ('chats', 'has_more'), ChatManager.get_chat_summaries(user_id, limit=limit))))
+        return page['chats'], page['has_more']
+    
     @staticmethod
     def get_chat(chat_id, user_id):
         """Get a specific chat if it belongs to the user"""
         return Chat.query.filter_by(id=chat_id, user_id=user_id).first()
     
+    @staticmethod
+    def get_messages(chat_id, before_id=None, limit=50):
+        """
+        Get one page of a chat's messages, newest page first.
+        
+        Pages are keyed on (timestamp, id), the order the message index
+        keeps, so each page is an index range scan however long the chat is.
+        
+        Args:
+            chat_id (int): ID of the chat
+            before_id (int, optional): Return messages older than this one;
+                None returns the latest page
+            limit (int): Maximum number of messages to return
+        
+        Returns:
+            tuple: (messages oldest-first, whether older messages exist)
+        """
+        query = Message.query.filter(Message.chat_id == chat_id)
+        if before_id is not None:
+            cursor = Message.query.with_entities(Message.timestamp, Message.id).filter_by(
+                id=before_id, chat_id=chat_id).first()
+            if cursor is None:
+                return [], False
+            query = query.filter(tuple_(Message.timestamp, Message.id) < tuple_(*cursor))
+        
+        rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        return list(reversed(rows[:limit])), has_more
+    
     @staticmethod
     def rename_chat(chat_id, user_id, new_title):
         """Rename a chat"""
@@ -57,6 +181,7 @@ class ChatManager:
         if chat:
             chat.title = new_title
             db.session.commit()
+            ChatManager.invalidate_user_chats(user_id)
             return True
         return False
     
@@ -65,8 +190,15 @@ class ChatManager:
         """Delete a chat and its messages"""
         chat = ChatManager.get_chat(chat_id, user_id)
         if chat:
+            messages = Message.query.filter_by(chat_id=chat_id)
+            search_index.remove(row.id for row in messages.with_entities(Message.id))
+            messages.delete(synchronize_session=False)
             db.session.delete(chat)
             db.session.commit()
+            # SQLite may reuse the ID of a deleted chat
+            tiered_cache.local.delete(f"owner:{chat_id}")
+            invalidate_history(chat_id)
+            ChatManager.invalidate_user_chats(user_id)
             return True
         return False
     
@@ -79,15 +211,58 @@ class ChatManager:
             is_user=is_user
         )
         db.session.add(message)
+        started = time.perf_counter()
         db.session.commit()
+        DB_COMMIT_DURATION.labels('add_message').observe(time.perf_counter() - started)
+        if content:
+            search_index.mark(message.id)
+        # The chat's last activity changed
+        user_id = ChatManager._owner(chat_id)
+        if user_id is not None:
+            ChatManager.invalidate_user_chats(user_id)
         return message
+    
+    @staticmethod
+    def update_message(message_id, content):
+        """Replace the content of an existing message"""
+        Message.query.filter_by(id=message_id).update({'content': content})
+        started = time.perf_counter()
+        db.session.commit()
+        DB_COMMIT_DURATION.labels('update_message').observe(time.perf_counter() - started)
+        chat_id = db.session.query(Message.chat_id).filter(Message.id == message_id).scalar()
+        if chat_id is not None:
+            invalidate_history(chat_id, message_id)
 
 @chat_bp.route('/chat')
 @login_required
 def index():
     """Render the main chat interface"""
-    chats = ChatManager.get_user_chats(current_user.id)
-    return render_template('chat/index.html', chats=chats)
+    chats, has_more = ChatManager.get_recent_chats(
+        current_user.id, limit=current_app.config.get('CHAT_PAGE_SIZE', 30))
+    next_before_id = chats[-1]['id'] if has_more else None
+    return render_template('chat/index.html', chats=chats, next_before_id=next_before_id)
+
+@chat_bp.route('/api/chats')
+@login_required
+def list_chats():
+    """API endpoint to get a page of the user's chats"""
+    page_size = current_app.config.get('CHAT_PAGE_SIZE', 30)
+    limit = min(request.args.get('limit', page_size, type=int),
+                current_app.config.get('CHAT_PAGE_MAX', 100))
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    before_id = request.args.get('before_id', type=int)
+    if before_id is None:
+        chats, has_more = ChatManager.get_recent_chats(current_user.id, limit=limit)
+    else:
+        chats, has_more = ChatManager.get_chat_summaries(
+            current_user.id, before_id=before_id, limit=limit)
+    return jsonify({
+        'chats': chats,
+        'has_more': has_more,
+        'next_before_id': chats[-1]['id'] if has_more else None
+    })
 
 @chat_bp.route('/api/chats', methods=['POST'])
 @login_required
@@ -99,6 +274,7 @@ def create_chat():
     return jsonify({
         'id': chat.id,
         'title': chat.title,
+        'type': chat.chat_type,
         'created_at': chat.created_at.isoformat()
     })
 
@@ -110,7 +286,7 @@ def rename_chat(chat_id):
     new_title = data.get('title')
     if not new_title:
         return jsonify({'error': 'Title is required'}), 400
-        
+    
     success = ChatManager.rename_chat(chat_id, current_user.id, new_title)
     if success:
         return jsonify({'message': 'Chat renamed successfully'})
@@ -128,11 +304,24 @@ def delete_chat(chat_id):
 @chat_bp.route('/api/chats/<int:chat_id>/messages')
 @login_required
 def get_messages(chat_id):
-    """API endpoint to get chat messages"""
+    """
+    API endpoint to get chat messages.
+    
+    Returns the latest page, or the page before the before_id message, so
+    clients can load older history on demand.
+    """
     chat = ChatManager.get_chat(chat_id, current_user.id)
     if not chat:
         return jsonify({'error': 'Chat not found'}), 404
-        
+    
+    page_size = current_app.config.get('MESSAGE_PAGE_SIZE', 50)
+    limit = min(request.args.get('limit', page_size, type=int),
+                current_app.config.get('MESSAGE_PAGE_MAX', 200))
+    before_id = request.args.get('before_id', type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    page, has_more = ChatManager.get_messages(chat_id, before_id=before_id, limit=limit)
     messages = [
         {
             'id': msg.id,
@@ -140,6 +329,110 @@ def get_messages(chat_id):
             'timestamp': msg.timestamp.isoformat(),
             'is_user': msg.is_user
         }
-        for msg in chat.messages
+        for msg in page
     ]
-    return jsonify(messages)
+    return jsonify({
+        'messages': messages,
+        'has_more': has_more,
+        'next_before_id': messages[0]['id'] if has_more else None
+    })
+
+@chat_bp.route('/api/search')
+@login_required
+def search_messages():
+    """API endpoint to search the user's messages, best matches first"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    page_size = current_app.config.get('SEARCH_PAGE_SIZE', 20)
+    limit = min(request.args.get('limit', page_size, type=int),
+                current_app.config.get('SEARCH_PAGE_MAX', 50))
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    try:
+        results = search_index.search(current_user.id, query, limit=limit)
+    except Exception:
+        logger.exception("Search failed for user %s", current_user.id)
+        return jsonify({'error': 'Search is unavailable, please try again later'}), 503
+    for result in results:
+        result['timestamp'] = result['timestamp'].isoformat()
+    return jsonify({'results': results})
+
+@chat_bp.route('/api/music/search')
+@login_required
+def search_music():
+    """API endpoint to look up catalogue entries by text, genre and year"""
+    catalog = current_app.extensions['websocket_handler'].music_processor.catalog
+    limit = min(request.args.get('limit', 50, type=int),
+                current_app.config.get('MUSIC_RESULTS_MAX_ROWS', 200))
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    if not catalog.available():
+        return jsonify({'error': 'Music catalogue is not indexed'}), 503
+    
+    rows = catalog.search(
+        request.args.get('q', ''),
+        genre=request.args.get('genre'),
+        year=request.args.get('year', type=int),
+        limit=limit
+    )
+    return jsonify({'results': rows})
+
+@chat_bp.route('/api/music/facets/<facet>')
+@login_required
+def music_facets(facet):
+    """API endpoint to get catalogue counts per genre, year, artist or composer"""
+    catalog = current_app.extensions['websocket_handler'].music_processor.catalog
+    if not catalog.available():
+        return jsonify({'error': 'Music catalogue is not indexed'}), 503
+    try:
+        values = catalog.facets(facet, limit=min(request.args.get('limit', 50, type=int), 500))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    return jsonify({'facet': facet, 'values': values})
+
+@chat_bp.route('/api/music/import', methods=['POST'])
+@login_required
+def import_music():
+    """
+    API endpoint to import catalogue rows.
+    
+    Accepts a multipart 'file' upload, or the CSV / JSON-lines data as the
+    raw request body with ?format=csv|jsonl, which is read as a stream.
+    Only users listed in MUSIC_IMPORT_ADMINS may import.
+    """
+    if current_user.username not in current_app.config.get('MUSIC_IMPORT_ADMINS', []):
+        return jsonify({'error': 'Importing requires admin rights'}), 403
+    from .music_import import MusicImporter, detect_format
+    importer = MusicImporter(current_app.config['MUSIC_DB_PATH'])
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            fmt = request.args.get('format') or detect_format(upload.filename or '')
+            stats = importer.import_binary(upload.stream, fmt)
+        else:
+            stats = importer.import_binary(request.stream, request.args.get('format', 'csv'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(stats)
+
+@chat_bp.route('/api/generation/queue')
+@login_required
+def generation_queue():
+    """
+    API endpoint to get generation queue statistics.
+    
+    The stats cover every user and name the LM Studio backends, so only
+    users listed in GENERATION_STATS_ADMINS may read them.
+    """
+    if current_user.username not in current_app.config.get('GENERATION_STATS_ADMINS', []):
+        return jsonify({'error': 'Queue statistics require admin rights'}), 403
+    handler = current_app.extensions['websocket_handler']
+    stats = handler.scheduler.stats()
+    stats['live_generations'] = len(handler.registry.live())
+    stats['music_translation'] = handler.music_processor.translation_stats()
+    stats['cache'] = cache_stats()
+    stats['backends'] = get_backend_pool().stats()
+    stats['models'] = get_model_router().stats()
+    return jsonify(stats)
@@ -0,0 +1,254 @@
+# server/context.py
+
+import re
+import threading
+import weakref
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from .cache import LRUCache
+from .database import Chat, Message
+
+# Tokens added per message for role tags and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate the token count of a piece of text.
+    
+    Uses the common ~4 characters per token rule for English, which is
+    close enough for budgeting and costs nothing compared to a tokenizer.
+    
+    Args:
+        text (str): Text to measure
+    
+    Returns:
+        int: Estimated token count
+    """
+    return (len(text) + 3) // 4
+
+# Every live ContextBuilder, so chat changes reach all of their caches
+_builders = weakref.WeakSet()
+
+def invalidate_history(chat_id: int, message_id: Optional[int] = None):
+    """
+    Drop cached history after a chat's messages changed.
+    
+    Args:
+        chat_id (int): ID of the chat
+        message_id (int, optional): The message that was edited; the next
+            build re-reads the newest cached message and anything after it,
+            so only edits to older messages drop the cache. None always
+            drops it.
+    """
+    for builder in list(_builders):
+        builder.invalidate(chat_id, message_id)
+
+class _ChatContext:
+    """Cached, budget-trimmed history for one chat"""
+    
+    def __init__(self, owner: Optional[Tuple] = None):
+        # (user_id, created_at) of the chat, so a reused chat ID never
+        # sees the history of the chat it replaced
+        self.owner = owner
+        self.last_id = 0
+        # (message id, role, content, tokens), oldest first
+        self.window: Deque[Tuple[int, str, str, int]] = deque()
+        self.window_tokens = 0
+        self.summary_lines: Deque[str] = deque()
+        self.summary_tokens = 0
+        self.has_older = False
+    
+    def append(self, message_id: int, role: str, content: str):
+        """Add a message, replacing it if it is already the newest one"""
+        if self.window and self.window[-1][0] == message_id:
+            self.window_tokens -= self.window.pop()[3]
+        tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        self.window.append((message_id, role, content, tokens))
+        self.window_tokens += tokens
+        self.last_id = max(self.last_id, message_id)
+
+class ContextBuilder:
+    """
+    Assembles the role-tagged message list sent to the LLM for a chat turn.
+    
+    History is taken newest-first until the token budget is spent. Older
+    turns are either dropped ('truncate') or folded into a rolling summary
+    ('summary'). The assembled history is cached per chat, so later turns
+    only read the messages added since, and the prompt size stays bounded
+    however long the conversation gets.
+    """
+    
+    STRATEGIES = ('truncate', 'summary')
+    
+    def __init__(self, token_budget: int = 3000, strategy: str = 'truncate',
+                 system_prompt: Optional[str] = None, summary_ratio: float = 0.25,
+                 summary_provider: Callable[[int], Optional[Tuple[str, int]]] = None,
+                 cache_size: int = 256):
+        """
+        Initialize the builder.
+        
+        Args:
+            token_budget (int): Maximum estimated prompt tokens
+            strategy (str): 'truncate' or 'summary'
+            system_prompt (str, optional): System message placed first
+            summary_ratio (float): Share of the budget the rolling summary
+                may use
+            summary_provider (Callable, optional): Returns a chat's stored
+                summary and the ID of the newest message it covers, or None;
+                a stored summary replaces the built-in rolling summary
+            cache_size (int): Chats whose assembled history is cached
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown context strategy: {strategy}")
+        self.token_budget = token_budget
+        self.strategy = strategy
+        self.system_prompt = system_prompt
+        self.summary_budget = int(token_budget * summary_ratio)
+        self.summary_provider = summary_provider
+        self._cache = LRUCache(max_entries=cache_size, ttl=24 * 3600)
+        # Builds run on executor threads and update cached entries in place
+        self._lock = threading.Lock()
+        _builders.add(self)
+    
+    def invalidate(self, chat_id: int, message_id: Optional[int] = None):
+        """
+        Drop the cached history for a chat.
+        
+        Args:
+            chat_id (int): ID of the chat
+            message_id (int, optional): Edited message; the cache is kept
+                when builds re-read it anyway (the newest cached message or
+                a later one)
+        """
+        if message_id is not None:
+            entry = self._cache.get(str(chat_id))
+            if entry is None or message_id >= entry.last_id:
+                return
+        self._cache.delete(str(chat_id))
+    
+    @staticmethod
+    def _chat_owner(chat_id: int) -> Optional[Tuple]:
+        """The (user_id, created_at) identifying a chat, None if deleted"""
+        row = (Chat.query.with_entities(Chat.user_id, Chat.created_at)
+               .filter(Chat.id == chat_id).first())
+        return tuple(row) if row is not None else None
+    
+    def build(self, chat_id: int) -> List[Dict[str, str]]:
+        """
+        Build the message list for the next completion in a chat.
+        
+        Args:
+            chat_id (int): ID of the chat; its latest user message must
+                already be stored
+        
+        Returns:
+            List[Dict[str, str]]: Messages with 'role' and 'content'
+        """
+        with self._lock:
+            return self._build(chat_id)
+    
+    def _build(self, chat_id: int) -> List[Dict[str, str]]:
+        owner = self._chat_owner(chat_id)
+        entry = self._cache.get(str(chat_id))
+        if entry is None or entry.owner != owner:
+            entry = self._load_recent(chat_id, owner)
+        else:
+            self._load_delta(chat_id, entry)
+        self._cache.set(str(chat_id), entry)
+        
+        messages = []
+        budget = self.token_budget
+        if self.system_prompt:
+            messages.append({'role': 'system', 'content': self.system_prompt})
+            budget -= estimate_tokens(self.system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        
+        # Reserve room for the summary before trimming, since trimming is
+        # what adds to the rolling summary
+        stored = None
+        if self.strategy == 'summary' and self.summary_provider is not None:
+            stored = self.summary_provider(chat_id)
+        if stored:
+            summary, through_id = stored
+            # Turns the stored summary covers are not sent again
+            while len(entry.window) > 1 and entry.window[0][0] <= through_id:
+                entry.window_tokens -= entry.window.popleft()[3]
+                entry.has_older = True
+            budget -= estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+        elif self.strategy == 'summary':
+            budget -= self.summary_budget + MESSAGE_OVERHEAD_TOKENS
+        
+        self._trim(entry, budget, fold=self.strategy == 'summary' and not stored)
+        if not stored:
+            summary = '\n'.join(entry.summary_lines) if self.strategy == 'summary' else None
+        if summary:
+            messages.append({
+                'role': 'system',
+                'content': f"Summary of the earlier conversation:\n{summary}"
+            })
+        messages.extend(
+            {'role': role, 'content': content}
+            for _, role, content, _ in entry.window
+        )
+        return messages
+    
+    def _trim(self, entry: _ChatContext, budget: int, fold: bool = False):
+        """Drop the oldest turns until the window fits the budget"""
+        # Always keep the newest message, even if it alone is over budget
+        while entry.window_tokens > budget and len(entry.window) > 1:
+            _, role, content, tokens = entry.window.popleft()
+            entry.window_tokens -= tokens
+            entry.has_older = True
+            if fold:
+                self._fold(entry, role, content)
+    
+    def _fold(self, entry: _ChatContext, role: str, content: str):
+        """Add a dropped turn's gist to the rolling summary"""
+        gist = _SENTENCE_END.split(content.strip(), 1)[0][:200]
+        if not gist:
+            return
+        line = f"{'User' if role == 'user' else 'Assistant'}: {gist}"
+        entry.summary_lines.append(line)
+        entry.summary_tokens += estimate_tokens(line) + 1
+        while entry.summary_tokens > self.summary_budget and len(entry.summary_lines) > 1:
+            entry.summary_tokens -= estimate_tokens(entry.summary_lines.popleft()) + 1
+    
+    @staticmethod
+    def _role(message: Message) -> str:
+        return 'user' if message.is_user else 'assistant'
+    
+    def _load_recent(self, chat_id: int, owner: Optional[Tuple] = None,
+                     batch_size: int = 50) -> _ChatContext:
+        """Read the newest messages that fit the budget, newest first"""
+        entry = _ChatContext(owner)
+        newest_first = []
+        tokens = 0
+        query = (Message.query.filter(Message.chat_id == chat_id)
+                 .order_by(Message.timestamp.desc(), Message.id.desc()))
+        for message in query.yield_per(batch_size):
+            if not message.content:
+                continue
+            newest_first.append(message)
+            tokens += estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+            if tokens > self.token_budget:
+                entry.has_older = True
+                break
+        
+        # The oldest loaded message may be over budget; _trim decides, and
+        # folds it into the summary if needed
+        for message in reversed(newest_first):
+            entry.append(message.id, self._role(message), message.content)
+        return entry
+    
+    def _load_delta(self, chat_id: int, entry: _ChatContext):
+        """Read messages added since the last build"""
+        # Re-read the newest cached message too: an assistant reply may have
+        # still been streaming when it was cached
+        new_messages = (Message.query
+                        .filter(Message.chat_id == chat_id, Message.id >= entry.last_id)
+                        .order_by(Message.timestamp, Message.id)
+                        .all())
+        for message in new_messages:
+            if message.content:
+                entry.append(message.id, self._role(message), message.content)
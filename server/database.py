@@ -12,6 +12,9 @@ def init_db(app):
     db.init_app(app)
     with app.app_context():
         db.create_all()
+        # Bring databases created by older versions up to date
+        from .migrations import upgrade
+        upgrade(db.engine)
 
 class User(UserMixin, db.Model):
     """User model for authentication and session management"""
@@ -32,8 +35,17 @@ class Chat(db.Model):
     title = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    messages = db.relationship('Message', backref='chat', lazy=True)
+    messages = db.relationship('Message', backref='chat', lazy=True,
+                               order_by='(Message.timestamp, Message.id)')
     chat_type = db.Column(db.String(20), default='general')  # 'general' or 'music'
+    summary = db.relationship('ChatSummary', backref='chat', uselist=False,
+                              cascade='all, delete-orphan')
+    
+    # Sidebar listing: a user's chats, newest first. The user_id prefix
+    # also serves plain lookups by user.
+    __table_args__ = (
+        db.Index('ix_chat_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     def rename(self, new_title):
         self.title = new_title
@@ -46,6 +58,19 @@ class Message(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     is_user = db.Column(db.Boolean, default=True)
     chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), nullable=False)
+    
+    # Message history: a chat's messages in order
+    __table_args__ = (
+        db.Index('ix_message_chat_id_timestamp', 'chat_id', 'timestamp'),
+    )
+
+class ChatSummary(db.Model):
+    """Rolling summary of a chat's older messages"""
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), primary_key=True)
+    content = db.Column(db.Text, nullable=False, default='')
+    # Newest message folded into the summary; later messages are not in it
+    through_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class MusicDatabase(db.Model):
     """Music database model for storing music information"""
@@ -0,0 +1,115 @@
+# server/engine.py
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Future
+from typing import Callable, Coroutine, Optional
+
+class AsyncEngine:
+    """
+    Runs coroutines on a single dedicated asyncio event loop.
+    
+    Socket.IO handlers are synchronous, so they hand generation work to this
+    engine instead of spawning a thread per request. The loop runs in one
+    background thread with the Flask application context pushed, which lets
+    coroutines use the database and emit Socket.IO events.
+    """
+    
+    def __init__(self, app=None):
+        """
+        Initialize the engine.
+        
+        Args:
+            app: Flask application instance, optional
+        """
+        self.app = app
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._context: Optional[contextvars.Context] = None
+    
+    def init_app(self, app):
+        """Bind the engine to a Flask application"""
+        self.app = app
+    
+    @property
+    def running(self) -> bool:
+        """Whether the event loop thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """Start the event loop thread if it is not already running"""
+        with self._lock:
+            if self.running:
+                return
+            self._ready.clear()
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._run,
+                name='async-engine',
+                daemon=True
+            )
+            self._thread.start()
+        self._ready.wait()
+    
+    def _run(self):
+        """Event loop thread body"""
+        asyncio.set_event_loop(self.loop)
+        # Push the application context once for the whole loop and snapshot
+        # it; every task is created inside that snapshot so coroutines share
+        # the context without pushing (and tearing down) their own.
+        ctx = self.app.app_context() if self.app is not None else None
+        if ctx is not None:
+            ctx.push()
+        self._context = contextvars.copy_context()
+        try:
+            self.loop.call_soon(self._ready.set)
+            self.loop.run_forever()
+        finally:
+            if ctx is not None:
+                ctx.pop()
+            self.loop.close()
+    
+    def submit(self, coro: Coroutine) -> Future:
+        """
+        Schedule a coroutine on the engine loop from any thread.
+        
+        Args:
+            coro (Coroutine): Coroutine to run
+            
+        Returns:
+            Future: Thread-safe future for the coroutine's result
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._in_context(coro), self.loop)
+    
+    def call_soon(self, callback: Callable, *args):
+        """
+        Schedule a plain callback on the engine loop from any thread.
+        
+        Args:
+            callback (Callable): Function to call on the loop
+            *args: Positional arguments for the callback
+        """
+        self.start()
+        self.loop.call_soon_threadsafe(self._context.run, callback, *args)
+    
+    async def _in_context(self, coro: Coroutine):
+        """Run a coroutine as a task created inside the engine's context"""
+        return await self._context.run(asyncio.ensure_future, coro)
+    
+    def stop(self, timeout: float = 5):
+        """
+        Stop the event loop and wait for its thread to exit.
+        
+        Args:
+            timeout (float): Seconds to wait for the thread to finish
+        """
+        with self._lock:
+            if not self.running:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            self._thread = None
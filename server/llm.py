@@ -1,75 +1,426 @@
 # server/llm.py
 
 import requests
-from typing import Generator, Optional
+from requests.adapters import HTTPAdapter
+from typing import Generator, AsyncGenerator, Optional, Dict, Any, Tuple
+import asyncio
 import json
+import threading
+import time
+import aiohttp
+from config.settings import Config
+from .backends import Backend, BackendPool
+from .cache import CompletionCache, completion_cache
+from .metrics import LLM_REQUEST_DURATION, LLM_TIME_TO_FIRST_TOKEN, LLM_TOKENS_PER_SECOND
+from .model_router import ModelRouter
+from .tracing import tracer
+
+# Process-wide LM Studio backends, shared by every client that is not
+# given its own base_url
+backend_pool: Optional[BackendPool] = None
+model_router: Optional[ModelRouter] = None
+_backend_pool_lock = threading.Lock()
+
+def get_backend_pool() -> BackendPool:
+    """
+    Get the shared backend pool, building it from Config on first use.
+    
+    Returns:
+        BackendPool: Pool over the LM_STUDIO_URLS backends
+    """
+    global backend_pool
+    with _backend_pool_lock:
+        if backend_pool is None:
+            backend_pool = BackendPool(
+                Config.LM_STUDIO_URLS,
+                max_failures=Config.LM_STUDIO_MAX_FAILURES,
+                eject_seconds=Config.LM_STUDIO_EJECT_SECONDS
+            )
+        return backend_pool
+
+def get_model_router() -> ModelRouter:
+    """
+    Get the shared model router, building it from Config on first use.
+    
+    Returns:
+        ModelRouter: Router over the LM_STUDIO_MODELS task models
+    """
+    global model_router
+    with _backend_pool_lock:
+        if model_router is None:
+            model_router = ModelRouter(
+                Config.LM_STUDIO_MODELS,
+                limits=Config.LM_STUDIO_MODEL_CONCURRENCY,
+                default_limit=Config.LM_STUDIO_MODEL_DEFAULT_CONCURRENCY
+            )
+        return model_router
+
+def init_llm(app):
+    """
+    Build the shared backend pool and model router from the application
+    config and start the pool's active health checks.
+    
+    Args:
+        app: Flask application
+    """
+    global backend_pool, model_router
+    with _backend_pool_lock:
+        model_router = ModelRouter(
+            app.config.get('LM_STUDIO_MODELS'),
+            limits=app.config.get('LM_STUDIO_MODEL_CONCURRENCY'),
+            default_limit=app.config.get('LM_STUDIO_MODEL_DEFAULT_CONCURRENCY', 4)
+        )
+        if backend_pool is not None:
+            backend_pool.stop_health_checks()
+        backend_pool = BackendPool(
+            app.config.get('LM_STUDIO_URLS') or [app.config['LM_STUDIO_URL']],
+            max_failures=app.config.get('LM_STUDIO_MAX_FAILURES', 3),
+            eject_seconds=app.config.get('LM_STUDIO_EJECT_SECONDS', 30)
+        )
+        interval = app.config.get('LM_STUDIO_HEALTH_INTERVAL', 0)
+        if interval:
+            backend_pool.start_health_checks(interval, timeout=app.config.get('LM_STUDIO_CONNECT_TIMEOUT', 5))
+
+# Per-host connection pools the shared session keeps, one per backend
+_MAX_BACKEND_HOSTS = 16
+
+def _is_backend_failure(error: requests.exceptions.RequestException) -> bool:
+    """
+    Whether a request error means the backend, not the request, is at fault.
+    
+    Args:
+        error (requests.exceptions.RequestException): Error from requests
+    
+    Returns:
+        bool: True for connection errors, timeouts and 5xx responses
+    """
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def _is_async_backend_failure(error: Exception) -> bool:
+    """aiohttp counterpart of _is_backend_failure"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+def _record_token_rate(task: str, first_token: Optional[float], tokens: int):
+    """Record streamed tokens per second after the first token"""
+    if first_token is None or tokens < 2:
+        return
+    elapsed = time.perf_counter() - first_token
+    if elapsed > 0:
+        LLM_TOKENS_PER_SECOND.labels(task).observe((tokens - 1) / elapsed)
+
+def _parse_sse_line(line: bytes) -> Tuple[Optional[str], bool]:
+    """
+    Parse one server-sent-events line from a streamed completion.
+    
+    Args:
+        line (bytes): Raw line from the response body
+    
+    Returns:
+        Tuple[Optional[str], bool]: The delta text (None if the line carries
+        no content) and whether the stream signalled [DONE]
+    """
+    json_str = line.decode('utf-8').strip().removeprefix('data: ')
+    if not json_str:
+        return None, False
+    if json_str == '[DONE]':
+        return None, True
+    
+    try:
+        json_data = json.loads(json_str)
+    except json.JSONDecodeError:
+        return None, False
+    
+    chunk = json_data['choices'][0].get('delta', {}).get('content', '')
+    return chunk or None, False
 
 class LMStudioClient:
-    """Client for interacting with LM Studio Server"""
+    """
+    Client for interacting with LM Studio Server.
+    
+    Requests are routed across the shared backend pool. A request that
+    fails on one backend with a connection error, timeout or 5xx response
+    is retried on another, as long as no text has been streamed yet.
+    
+    Each call names its task (task='chat', 'sql', 'format' or 'summary');
+    the model router picks the model for it and holds one of that model's
+    concurrency slots for the whole request, queueing when none is free.
+    """
+    
+    # One pooled session per process, shared by every client instance so
+    # the chat, websocket and music paths all reuse the same keep-alive
+    # connections to LM Studio.
+    _session = None
+    _session_lock = threading.Lock()
     
-    def __init__(self, base_url: str = "http://localhost:1234/v1"):
+    def __init__(self, base_url: str = None, timeout: float = None,
+                 connect_timeout: float = None, pool_size: int = None,
+                 cache: CompletionCache = None, backends: BackendPool = None,
+                 retries: int = None, model_router: ModelRouter = None):
         """
         Initialize the LM Studio client.
         
         Args:
-            base_url (str): Base URL for the LM Studio Server
+            base_url (str, optional): Base URL of a single LM Studio Server
+                to use instead of the shared backend pool
+            timeout (float, optional): Read timeout in seconds. Defaults to
+                LM_STUDIO_TIMEOUT from config.
+            connect_timeout (float, optional): Connect timeout in seconds.
+                Defaults to LM_STUDIO_CONNECT_TIMEOUT from config.
+            pool_size (int, optional): Maximum number of pooled keep-alive
+                connections. Defaults to LM_STUDIO_POOL_SIZE from config.
+            cache (CompletionCache, optional): Completion cache to use.
+                Defaults to the shared cache when LLM_CACHE_ENABLED is set.
+            backends (BackendPool, optional): Backends to route across.
+                Defaults to the shared pool.
+            retries (int, optional): Other backends to try when one fails.
+                Defaults to LM_STUDIO_RETRIES from config.
+            model_router (ModelRouter, optional): Task model routing and
+                per-model limits. Defaults to the shared router.
         """
-        self.base_url = base_url
-        self.completion_url = f"{base_url}/chat/completions"
+        if backends is None and base_url:
+            backends = BackendPool([base_url])
+        self._backends = backends
+        self._model_router = model_router
+        self.retries = Config.LM_STUDIO_RETRIES if retries is None else retries
+        self.timeout = timeout or Config.LM_STUDIO_TIMEOUT
+        self.connect_timeout = connect_timeout or Config.LM_STUDIO_CONNECT_TIMEOUT
+        self.pool_size = pool_size or Config.LM_STUDIO_POOL_SIZE
+        if cache is None and Config.LLM_CACHE_ENABLED:
+            cache = completion_cache
+        self.cache = cache
+        self.session = self._create_session()
     
-    def generate_stream(self, prompt: str, **kwargs) -> Generator[str, None, None]:
+    def _create_session(self):
+        """Get the HTTP session this client sends requests with"""
+        return self._get_session(self.pool_size)
+    
+    @property
+    def backends(self) -> BackendPool:
+        """Backend pool this client routes across"""
+        return self._backends or get_backend_pool()
+    
+    @property
+    def model_router(self) -> ModelRouter:
+        """Router that picks the model and limits requests per model"""
+        return self._model_router or get_model_router()
+    
+    def _acquire(self, tried: list) -> Backend:
         """
-        Generate streaming response from LM Studio.
+        Pick the next backend for a request.
         
         Args:
-            prompt (str): The input prompt
-            **kwargs: Additional parameters for the API
-            
-        Yields:
-            str: Text chunks from the response
-            
-        Raises:
-            Exception: If the API request fails
+            tried (list): Backends already tried for this request; the
+                chosen one is appended
+        
+        Returns:
+            Backend: Backend to send the request to
         """
-        headers = {
-            "Content-Type": "application/json"
-        }
+        backend = self.backends.acquire(exclude=tried)
+        tried.append(backend)
+        return backend
+    
+    def _can_retry(self, tried: list) -> bool:
+        """Whether another backend may be tried after a failure"""
+        return len(tried) <= self.retries and len(tried) < len(self.backends.backends)
+    
+    @staticmethod
+    def _start_span(task: str, data: Dict[str, Any]):
+        """
+        Start the span covering one LLM call, child of the current span.
+        
+        It is not made current: a streamed call yields to its caller, and
+        the caller's spans must not nest under it.
+        """
+        return tracer.start_span(f"lm_studio.{task}", attributes={
+            'llm.task': task,
+            'llm.model': data.get('model', ''),
+            'llm.stream': data['stream'],
+        })
+    
+    @staticmethod
+    def _start_attempt_span(span, backend: Backend, tried: list):
+        """Start the span for one HTTP attempt, sent as its traceparent"""
+        return tracer.start_span('lm_studio.request', parent=span, attributes={
+            'llm.backend': backend.url,
+            'llm.attempt': len(tried),
+        })
+    
+    @classmethod
+    def _get_session(cls, pool_size: int) -> requests.Session:
+        """
+        Get the process-wide pooled HTTP session, creating it on first use.
+        
+        Args:
+            pool_size (int): Maximum number of connections kept in the pool
+        
+        Returns:
+            requests.Session: Shared session with a bounded keep-alive pool
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                # pool_block makes callers wait for a free connection instead
+                # of opening unbounded extra sockets under load.
+                adapter = HTTPAdapter(
+                    pool_connections=_MAX_BACKEND_HOSTS,
+                    pool_maxsize=pool_size,
+                    pool_block=True,
+                    max_retries=0
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "Connection": "keep-alive"
+                })
+                cls._session = session
+            return cls._session
+    
+    @classmethod
+    def close_session(cls):
+        """Close the shared session and release its pooled connections"""
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+    
+    @property
+    def request_timeout(self) -> Tuple[float, float]:
+        """(connect, read) timeout tuple passed to every request"""
+        return (self.connect_timeout, self.timeout)
+    
+    def _build_payload(self, prompt: str, stream: bool, **kwargs) -> Dict[str, Any]:
+        """
+        Build the chat completion request body.
+        
+        Args:
+            prompt (str): The input prompt
+            stream (bool): Whether to request a streamed response
+            **kwargs: Additional parameters for the API; messages, a full
+                role-tagged conversation, is sent instead of the prompt, and
+                task selects the model
         
+        Returns:
+            Dict[str, Any]: JSON-serializable request body
+        """
         data = {
-            "messages": [
+            "messages": kwargs.get("messages") or [
                 {"role": "user", "content": prompt}
             ],
-            "stream": True,
+            "stream": stream,
             "temperature": kwargs.get("temperature", 0.7),
             "max_tokens": kwargs.get("max_tokens", 2000),
             "top_p": kwargs.get("top_p", 0.95),
         }
+        model = self.model_router.model_for(kwargs.get("task", "chat"))
+        if model:
+            data["model"] = model
+        return data
+    
+    def _cache_key(self, data: Dict[str, Any], **kwargs) -> Optional[str]:
+        """
+        Get the completion cache key for a request body.
         
-        try:
-            response = requests.post(
-                self.completion_url,
-                headers=headers,
-                json=data,
-                stream=True
-            )
-            response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        json_str = line.decode('utf-8').removeprefix('data: ')
-                        if json_str.strip() == '[DONE]':
-                            break
-                        
-                        json_data = json.loads(json_str)
-                        chunk = json_data['choices'][0].get('delta', {}).get('content', '')
-                        if chunk:
-                            yield chunk
-                    except json.JSONDecodeError:
-                        continue
+        Args:
+            data (Dict[str, Any]): Request body from _build_payload
+            **kwargs: Call parameters; force_cache=True caches sampled
+                (temperature > 0) requests as well
+        
+        Returns:
+            Optional[str]: Cache key, or None when caching does not apply
+        """
+        if self.cache is None:
+            return None
+        return self.cache.make_key(data, force=kwargs.get("force_cache", False))
+    
+    def generate_stream(self, prompt: str, **kwargs) -> Generator[str, None, None]:
+        """
+        Generate streaming response from LM Studio.
+        
+        Args:
+            prompt (str): The input prompt
+            **kwargs: Additional parameters for the API
+        
+        Yields:
+            str: Text chunks from the response
+        
+        Raises:
+            Exception: If the API request fails
+        """
+        data = self._build_payload(prompt, stream=True, **kwargs)
+        cache_key = self._cache_key(data, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                # Replay chunk by chunk so callers see the same stream shape
+                yield from cached
+                return
+        task = kwargs.get('task', 'chat')
+        started = time.perf_counter()
+        first_token = None
+        chunks = []
+        tried = []
+        span = self._start_span(task, data)
+        
+        with span, self.model_router.slots(task):
+            span.add_event('slot_acquired')
+            while True:
+                backend = self._acquire(tried)
+                ok = True
+                outcome = 'cancelled'
+                attempt_started = time.perf_counter()
+                attempt = self._start_attempt_span(span, backend, tried)
+                try:
+                    # The context manager returns the connection to the pool even
+                    # when the caller stops consuming the generator early.
+                    with self.session.post(
+                        backend.completion_url,
+                        json=data,
+                        stream=True,
+                        timeout=self.request_timeout,
+                        headers=attempt.headers()
+                    ) as response:
+                        response.raise_for_status()
                         
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"LM Studio API error: {str(e)}")
+                        for line in response.iter_lines():
+                            if not line:
+                                continue
+                            chunk, done = _parse_sse_line(line)
+                            if done:
+                                break
+                            if chunk:
+                                if not chunks:
+                                    first_token = time.perf_counter()
+                                    LLM_TIME_TO_FIRST_TOKEN.labels(task).observe(first_token - started)
+                                    span.add_event('first_token')
+                                chunks.append(chunk)
+                                yield chunk
+                    outcome = 'ok'
+                    break
+                
+                except requests.exceptions.RequestException as e:
+                    ok = not _is_backend_failure(e)
+                    outcome = 'error'
+                    attempt.record_exception(e)
+                    # Once text has been streamed the reply cannot be restarted
+                    if ok or chunks or not self._can_retry(tried):
+                        raise Exception(f"LM Studio API error: {str(e)}")
+                finally:
+                    self.backends.release(backend, ok)
+                    LLM_REQUEST_DURATION.labels(backend.url, outcome).observe(
+                        time.perf_counter() - attempt_started)
+                    attempt.set_attribute('outcome', outcome)
+                    attempt.end()
+                    span.set_attribute('llm.tokens', len(chunks))
+        
+        _record_token_rate(task, first_token, len(chunks))
+        # Only complete streams are cached
+        if cache_key is not None:
+            self.cache.set(cache_key, chunks)
     
     def generate(self, prompt: str, **kwargs) -> Optional[str]:
         """
@@ -78,37 +429,240 @@ class LMStudioClient:
         Args:
             prompt (str): The input prompt
             **kwargs: Additional parameters for the API
-            
+        
         Returns:
             Optional[str]: The complete response text
-            
+        
         Raises:
             Exception: If the API request fails
         """
-        headers = {
-            "Content-Type": "application/json"
-        }
+        data = self._build_payload(prompt, stream=False, **kwargs)
+        cache_key = self._cache_key(data, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        data = {
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "stream": True,
-            "temperature": kwargs.get("temperature", 0.7),
-            "max_tokens": kwargs.get("max_tokens", 2000),
-            "top_p": kwargs.get("top_p", 0.95),
-        }
+        task = kwargs.get('task', 'chat')
+        tried = []
+        span = self._start_span(task, data)
+        with span, self.model_router.slots(task):
+            span.add_event('slot_acquired')
+            while True:
+                backend = self._acquire(tried)
+                ok = True
+                outcome = 'cancelled'
+                attempt_started = time.perf_counter()
+                attempt = self._start_attempt_span(span, backend, tried)
+                try:
+                    response = self.session.post(
+                        backend.completion_url,
+                        json=data,
+                        timeout=self.request_timeout,
+                        headers=attempt.headers()
+                    )
+                    response.raise_for_status()
+                    
+                    json_response = response.json()
+                    content = json_response['choices'][0]['message']['content']
+                    outcome = 'ok'
+                    break
+                
+                except requests.exceptions.RequestException as e:
+                    ok = not _is_backend_failure(e)
+                    outcome = 'error'
+                    attempt.record_exception(e)
+                    if ok or not self._can_retry(tried):
+                        raise Exception(f"LM Studio API error: {str(e)}")
+                finally:
+                    self.backends.release(backend, ok)
+                    LLM_REQUEST_DURATION.labels(backend.url, outcome).observe(
+                        time.perf_counter() - attempt_started)
+                    attempt.set_attribute('outcome', outcome)
+                    attempt.end()
         
-        try:
-            response = requests.post(
-                self.completion_url,
-                headers=headers,
-                json=data
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
+
+
+class AsyncLMStudioClient(LMStudioClient):
+    """
+    asyncio client for LM Studio Server.
+    
+    Shares request building and SSE parsing with LMStudioClient but streams
+    over aiohttp, so an in-flight generation costs a coroutine rather than
+    a blocked thread. The aiohttp session is bound to the event loop it was
+    created on; use one client per loop.
+    """
+    
+    def _create_session(self):
+        """The aiohttp session is created on first use, on the running loop"""
+        return None
+    
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """
+        Get the aiohttp session for the running loop, creating it on first use.
+        
+        Returns:
+            aiohttp.ClientSession: Session with a bounded keep-alive pool
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.connect_timeout,
+                    sock_read=self.timeout
+                )
             )
-            response.raise_for_status()
-            
-            json_response = response.json()
-            return json_response['choices'][0]['message']['content']
-            
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"LM Studio API error: {str(e)}")
+        return self.session
+    
+    async def close(self):
+        """Close the aiohttp session and its pooled connections"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+    
+    async def generate_stream(self, prompt: str, **kwargs) -> AsyncGenerator[str, None]:
+        """
+        Generate streaming response from LM Studio.
+        
+        Args:
+            prompt (str): The input prompt
+            **kwargs: Additional parameters for the API
+        
+        Yields:
+            str: Text chunks from the response
+        
+        Raises:
+            Exception: If the API request fails
+        """
+        data = self._build_payload(prompt, stream=True, **kwargs)
+        cache_key = self._cache_key(data, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                for chunk in cached:
+                    yield chunk
+                return
+        task = kwargs.get('task', 'chat')
+        started = time.perf_counter()
+        first_token = None
+        chunks = []
+        session = self._get_async_session()
+        tried = []
+        span = self._start_span(task, data)
+        
+        async with span, self.model_router.slots(task):
+            span.add_event('slot_acquired')
+            while True:
+                backend = self._acquire(tried)
+                ok = True
+                outcome = 'cancelled'
+                attempt_started = time.perf_counter()
+                attempt = self._start_attempt_span(span, backend, tried)
+                try:
+                    async with session.post(backend.completion_url, json=data,
+                                            headers=attempt.headers()) as response:
+                        response.raise_for_status()
+                        completed = False
+                        
+                        try:
+                            async for line in response.content:
+                                chunk, done = _parse_sse_line(line)
+                                if done:
+                                    break
+                                if chunk:
+                                    if not chunks:
+                                        first_token = time.perf_counter()
+                                        LLM_TIME_TO_FIRST_TOKEN.labels(task).observe(first_token - started)
+                                        span.add_event('first_token')
+                                    chunks.append(chunk)
+                                    yield chunk
+                            completed = True
+                        finally:
+                            if not completed:
+                                # Drop the connection rather than pooling it so LM
+                                # Studio sees the client go away and stops generating
+                                response.close()
+                    outcome = 'ok'
+                    break
+                
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    ok = not _is_async_backend_failure(e)
+                    outcome = 'error'
+                    attempt.record_exception(e)
+                    if ok or chunks or not self._can_retry(tried):
+                        raise Exception(f"LM Studio API error: {str(e)}")
+                finally:
+                    self.backends.release(backend, ok)
+                    LLM_REQUEST_DURATION.labels(backend.url, outcome).observe(
+                        time.perf_counter() - attempt_started)
+                    attempt.set_attribute('outcome', outcome)
+                    attempt.end()
+                    span.set_attribute('llm.tokens', len(chunks))
+        
+        _record_token_rate(task, first_token, len(chunks))
+        if cache_key is not None:
+            self.cache.set(cache_key, chunks)
+    
+    async def generate(self, prompt: str, **kwargs) -> Optional[str]:
+        """
+        Generate a complete response from LM Studio.
+        
+        Args:
+            prompt (str): The input prompt
+            **kwargs: Additional parameters for the API
+        
+        Returns:
+            Optional[str]: The complete response text
+        
+        Raises:
+            Exception: If the API request fails
+        """
+        data = self._build_payload(prompt, stream=False, **kwargs)
+        cache_key = self._cache_key(data, **kwargs)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        session = self._get_async_session()
+        task = kwargs.get('task', 'chat')
+        tried = []
+        span = self._start_span(task, data)
+        
+        async with span, self.model_router.slots(task):
+            span.add_event('slot_acquired')
+            while True:
+                backend = self._acquire(tried)
+                ok = True
+                outcome = 'cancelled'
+                attempt_started = time.perf_counter()
+                attempt = self._start_attempt_span(span, backend, tried)
+                try:
+                    async with session.post(backend.completion_url, json=data,
+                                            headers=attempt.headers()) as response:
+                        response.raise_for_status()
+                        json_response = await response.json()
+                        content = json_response['choices'][0]['message']['content']
+                    outcome = 'ok'
+                    break
+                
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    ok = not _is_async_backend_failure(e)
+                    outcome = 'error'
+                    attempt.record_exception(e)
+                    if ok or not self._can_retry(tried):
+                        raise Exception(f"LM Studio API error: {str(e)}")
+                finally:
+                    self.backends.release(backend, ok)
+                    LLM_REQUEST_DURATION.labels(backend.url, outcome).observe(
+                        time.perf_counter() - attempt_started)
+                    attempt.set_attribute('outcome', outcome)
+                    attempt.end()
+        
+        if cache_key is not None:
+            self.cache.set(cache_key, content)
+        return content
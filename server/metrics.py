@@ -0,0 +1,323 @@
+# server/metrics.py
+
+import abc
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from flask import Blueprint, Response, current_app, request
+
+# Latency buckets in seconds, from cache hits to long generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + '}'
+
+class _Metric(abc.ABC):
+    """Base for metrics with optional labels"""
+    
+    TYPE = 'untyped'
+    
+    def __init__(self, registry: 'MetricsRegistry', name: str, documentation: str,
+                 labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+    
+    def labels(self, *values) -> object:
+        """
+        Get the child metric for a set of label values.
+        
+        Args:
+            *values: One value per label name, in order
+        
+        Returns:
+            The child metric; keep a reference to it on hot paths
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    @abc.abstractmethod
+    def _new_child(self):
+        """Create the value held for one set of label values"""
+    
+    def _default(self):
+        """The child of a metric without labels"""
+        return self.labels()
+    
+    def render(self) -> List[str]:
+        """Render the metric in the Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+    
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+class _Value:
+    """A single counter or gauge value"""
+    
+    __slots__ = ('value', '_lock', '_registry')
+    
+    def __init__(self, registry: 'MetricsRegistry'):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._registry = registry
+    
+    def inc(self, amount: float = 1):
+        if self._registry.enabled:
+            with self._lock:
+                self.value += amount
+    
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+    
+    def set(self, value: float):
+        if self._registry.enabled:
+            self.value = value
+
+class Counter(_Metric):
+    """A value that only goes up"""
+    
+    TYPE = 'counter'
+    
+    def _new_child(self):
+        return _Value(self.registry)
+    
+    def inc(self, amount: float = 1):
+        """Increment the unlabelled counter"""
+        self._default().inc(amount)
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down.
+    
+    A gauge can also be computed at scrape time by a function returning
+    either a number or, for labelled gauges, a dict of label value
+    tuples to numbers, so nothing is measured between scrapes.
+    """
+    
+    TYPE = 'gauge'
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable] = None
+    
+    def _new_child(self):
+        return _Value(self.registry)
+    
+    def inc(self, amount: float = 1):
+        """Increment the unlabelled gauge"""
+        self._default().inc(amount)
+    
+    def dec(self, amount: float = 1):
+        """Decrement the unlabelled gauge"""
+        self._default().dec(amount)
+    
+    def set(self, value: float):
+        """Set the unlabelled gauge"""
+        self._default().set(value)
+    
+    def set_function(self, function: Callable[[], Union[float, Dict[Tuple, float]]]):
+        """
+        Compute the gauge at scrape time.
+        
+        Args:
+            function (Callable): Returns the value, or values by label
+                value tuple for a labelled gauge
+        """
+        self._function = function
+    
+    def render(self) -> List[str]:
+        if self._function is None:
+            return super().render()
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        try:
+            values = self._function()
+        except Exception:
+            # A failing source must not break the whole scrape
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class _HistogramValue:
+    """Bucket counts and sum for one histogram child"""
+    
+    __slots__ = ('buckets', 'counts', 'sum', '_lock', '_registry')
+    
+    def __init__(self, registry: 'MetricsRegistry', buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+        self._registry = registry
+    
+    def observe(self, value: float):
+        """Record one observation"""
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+    
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets"""
+    
+    TYPE = 'histogram'
+    
+    def __init__(self, registry, name, documentation, labelnames=(), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+    
+    def _new_child(self):
+        return _HistogramValue(self.registry, self.buckets)
+    
+    def observe(self, value: float):
+        """Record an observation in the unlabelled histogram"""
+        self._default().observe(value)
+    
+    def _render_child(self, key, child) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    In-process metrics rendered in the Prometheus text exposition format.
+    
+    Recording is a lock-protected add on a child metric looked up once,
+    so it is cheap enough for hot paths; rendering happens only when
+    /metrics is scraped. Setting enabled to False turns every recording
+    call into a no-op.
+    """
+    
+    def __init__(self):
+        """Initialize an empty registry"""
+        self.enabled = True
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create or get a counter"""
+        return self._register(Counter(self, name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Create or get a gauge"""
+        return self._register(Gauge(self, name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        """Create or get a histogram"""
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+    
+    def render(self) -> str:
+        """
+        Render every metric.
+        
+        Returns:
+            str: Prometheus text exposition format, version 0.0.4
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+# LLM generations; tokens are counted as streamed deltas, which LM Studio
+# sends one token at a time
+LLM_TIME_TO_FIRST_TOKEN = metrics.histogram(
+    'llm_time_to_first_token_seconds', 'Time from sending a generation to its first token', ('task',))
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    'llm_tokens_per_second', 'Streamed tokens per second after the first token', ('task',),
+    buckets=RATE_BUCKETS)
+LLM_REQUEST_DURATION = metrics.histogram(
+    'llm_request_duration_seconds', 'LM Studio request latency per backend and outcome',
+    ('backend', 'outcome'))
+
+# Music pipeline
+MUSIC_STAGE_DURATION = metrics.histogram(
+    'music_stage_duration_seconds', 'Music pipeline stage latency (direct, sql_gen, execute, format, stream)',
+    ('stage',))
+
+# Chat persistence; the histogram count is the number of commits
+DB_COMMIT_DURATION = metrics.histogram(
+    'db_commit_duration_seconds', 'Database commit latency', ('operation',))
+
+# Live state, computed at scrape time where possible
+WEBSOCKET_CONNECTIONS = metrics.gauge('websocket_connections', 'Open authenticated Socket.IO connections')
+ACTIVE_GENERATIONS = metrics.gauge('active_generations', 'Generations running on this worker')
+CACHE_HIT_RATIO = metrics.gauge('cache_hit_ratio', 'Hit ratio per cache since start', ('cache',))
+
+def init_metrics(app):
+    """
+    Configure metrics from the application config.
+    
+    Args:
+        app: Flask application
+    """
+    metrics.enabled = app.config.get('METRICS_ENABLED', True)
+    if metrics.enabled:
+        app.register_blueprint(metrics_bp)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('/metrics')
+def metrics_endpoint():
+    """Expose metrics for Prometheus to scrape"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
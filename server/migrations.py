@@ -0,0 +1,162 @@
+# server/migrations.py
+
+import logging
+from datetime import datetime
+from typing import Callable, List, Tuple
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# (version, description, function) in the order they must run
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+def migration(version: int, description: str):
+    """
+    Register a schema migration.
+    
+    Args:
+        version (int): Unique, increasing migration number
+        description (str): Short summary shown when it is applied
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return decorator
+
+def _ensure_version_table(conn):
+    """Create the table that records applied migrations"""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200), "
+        "applied_at DATETIME)"
+    ))
+
+def current_version(engine) -> int:
+    """
+    Get the latest applied migration.
+    
+    Args:
+        engine: SQLAlchemy engine
+    
+    Returns:
+        int: Highest applied version, 0 if none
+    """
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        version = conn.execute(text("SELECT MAX(version) FROM schema_migrations")).scalar()
+    return version or 0
+
+def upgrade(engine) -> List[int]:
+    """
+    Apply every pending migration, each in its own transaction.
+    
+    Args:
+        engine: SQLAlchemy engine
+    
+    Returns:
+        List[int]: Versions applied by this call
+    """
+    applied = []
+    start = current_version(engine)
+    for version, description, func in MIGRATIONS:
+        if version <= start:
+            continue
+        logger.info("Applying migration %s: %s", version, description)
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+            )
+        applied.append(version)
+    ensure_search_index(engine)
+    return applied
+
+def ensure_search_index(engine) -> bool:
+    """
+    Create the message search index if the database supports it but lacks it.
+    
+    Migration 3 skips the index on SQLite builds without FTS5 and is still
+    recorded as applied, so this runs on every upgrade; moving to a build
+    with FTS5 then creates the index.
+    
+    Args:
+        engine: SQLAlchemy engine
+    
+    Returns:
+        bool: True if the index was created
+    """
+    from .search import SearchIndex
+    if not SearchIndex.available(engine):
+        return False
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SearchIndex.TABLE}
+        ).first()
+        if exists:
+            return False
+        logger.info("Creating the full-text message search index")
+        SearchIndex.create_table(conn)
+    return True
+
+@migration(1, "Index chats by user and messages by chat")
+def _index_chat_and_message(conn):
+    """Add the hot-path indexes to databases created before they existed"""
+    from .database import Chat, Message
+    for index in list(Chat.__table__.indexes) + list(Message.__table__.indexes):
+        index.create(conn, checkfirst=True)
+
+@migration(2, "Add rolling chat summaries")
+def _add_chat_summary(conn):
+    """Create the chat summary table on databases that predate it"""
+    from .database import ChatSummary
+    ChatSummary.__table__.create(conn, checkfirst=True)
+
+@migration(3, "Add full-text message search")
+def _add_message_search(conn):
+    """Create the FTS5 message index and fill it from existing messages"""
+    from .search import SearchIndex
+    if SearchIndex.available(conn):
+        SearchIndex.create_table(conn)
+
+@click.group('db')
+def db_cli():
+    """Database schema commands"""
+    pass
+
+@db_cli.command('upgrade')
+@with_appcontext
+def upgrade_command():
+    """Apply pending schema migrations"""
+    from .database import db
+    db.create_all()
+    applied = upgrade(db.engine)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        click.echo("Database is up to date")
+
+@db_cli.command('version')
+@with_appcontext
+def version_command():
+    """Show the current schema version"""
+    from .database import db
+    click.echo(current_version(db.engine))
+
+@db_cli.command('reindex-search')
+@with_appcontext
+def reindex_search_command():
+    """Rebuild the full-text message search index"""
+    from .database import db
+    from .search import SearchIndex
+    if not SearchIndex.available(db.engine):
+        raise click.ClickException("Full-text search requires SQLite with FTS5")
+    with db.engine.begin() as conn:
+        SearchIndex.rebuild(conn)
+    click.echo("Search index rebuilt")
@@ -0,0 +1,213 @@
+# server/model_router.py
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# LLM task types; each can be sent to its own model
+TASKS = ('chat', 'sql', 'format', 'summary')
+
+class ModelSlots:
+    """
+    Concurrency limit and FIFO queue for one model.
+    
+    Usable from threads (with) and from coroutines (async with); waiters
+    of both kinds share one queue and are served in arrival order.
+    """
+    
+    def __init__(self, name: str, limit: int):
+        """
+        Initialize the slots.
+        
+        Args:
+            name (str): Model name, or task name when no model is set
+            limit (int): Maximum requests to the model at once
+        """
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.served = 0
+        self.queued = 0
+        self._waiters = deque()
+        self._wait_times = deque(maxlen=1000)
+        self._lock = threading.Lock()
+    
+    @property
+    def waiting(self) -> int:
+        """Number of requests waiting for a slot"""
+        return len(self._waiters)
+    
+    def _try_take(self) -> bool:
+        """Take a free slot if nobody is ahead in line; caller holds the lock"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.served += 1
+            return True
+        return False
+    
+    def _record_wait(self, started: float):
+        with self._lock:
+            self.served += 1
+            self.queued += 1
+            self._wait_times.append(time.monotonic() - started)
+    
+    def acquire(self):
+        """Wait for a slot, blocking the calling thread"""
+        with self._lock:
+            if self._try_take():
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        started = time.monotonic()
+        event.wait()
+        self._record_wait(started)
+    
+    async def acquire_async(self):
+        """Wait for a slot without blocking the event loop"""
+        with self._lock:
+            if self._try_take():
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    raise
+            # The slot was handed over as the waiter was cancelled
+            if not future.cancelled():
+                self.release()
+            raise
+        self._record_wait(started)
+    
+    def release(self):
+        """Free a slot, handing it straight to the next waiter if any"""
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                if isinstance(waiter, threading.Event):
+                    waiter.set()
+                else:
+                    waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+                return
+            self.active -= 1
+    
+    def _wake(self, future: asyncio.Future):
+        """Hand a slot to an async waiter; runs on the waiter's loop"""
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release()
+    
+    async def __aenter__(self):
+        await self.acquire_async()
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.release()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get usage statistics.
+        
+        Returns:
+            Dict[str, Any]: Limit, active and waiting requests, requests
+            served and queued, and wait times in seconds
+        """
+        with self._lock:
+            waits = list(self._wait_times)
+            return {
+                'limit': self.limit,
+                'active': self.active,
+                'waiting': len(self._waiters),
+                'served': self.served,
+                'queued': self.queued,
+                'avg_wait_seconds': sum(waits) / len(waits) if waits else 0.0,
+                'max_wait_seconds': max(waits) if waits else 0.0,
+            }
+
+class ModelRouter:
+    """
+    Picks the model for each LLM task and limits requests per model.
+    
+    Tasks mapped to the same model share its slots; a task with no model
+    configured gets slots of its own and leaves the model choice to LM
+    Studio. Limits are looked up by model name, then by task.
+    """
+    
+    def __init__(self, models: Dict[str, Optional[str]] = None,
+                 limits: Dict[str, int] = None, default_limit: int = 4):
+        """
+        Initialize the router.
+        
+        Args:
+            models (Dict[str, Optional[str]]): Model name per task
+            limits (Dict[str, int]): Concurrent requests per model name
+                or task
+            default_limit (int): Limit for models and tasks not in limits
+        """
+        self.models = {task: model for task, model in (models or {}).items() if model}
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self._slots: Dict[str, ModelSlots] = {}
+        self._tasks: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+    
+    def model_for(self, task: str) -> Optional[str]:
+        """
+        Get the model a task should use.
+        
+        Args:
+            task (str): Task type, e.g. 'chat' or 'sql'
+        
+        Returns:
+            Optional[str]: Model name, or None for LM Studio's loaded model
+        """
+        return self.models.get(task)
+    
+    def slots(self, task: str) -> ModelSlots:
+        """
+        Get the concurrency slots that requests for a task take.
+        
+        Args:
+            task (str): Task type
+        
+        Returns:
+            ModelSlots: Slots of the task's model
+        """
+        name = self.model_for(task) or task
+        with self._lock:
+            slots = self._slots.get(name)
+            if slots is None:
+                sharing = [t for t in set(TASKS) | {task} if (self.model_for(t) or t) == name]
+                limit = self.limits.get(name) or max(
+                    self.limits.get(t, self.default_limit) for t in sharing)
+                slots = self._slots[name] = ModelSlots(name, limit)
+                self._tasks[name] = sorted(sharing)
+            return slots
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get per-model statistics for the models used so far.
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Slot statistics and tasks by model
+        """
+        with self._lock:
+            slots = dict(self._slots)
+        return {
+            name: {**s.stats(), 'tasks': self._tasks[name]}
+            for name, s in slots.items()
+        }
@@ -1,22 +1,79 @@
 # server/music.py
 
 import sqlite3
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import logging
 import re
+from config.settings import Config
 from .llm import LMStudioClient
+from .music_cache import SQLTranslationCache, QueryTemplateIndex
+from .music_db import MusicDataSource, QueryTimeoutError
+from .music_index import MusicCatalogIndex
+from .music_intent import IntentRouter
+from .tracing import propagate, tracer
+
+logger = logging.getLogger(__name__)
+
+# Extra instructions given to speculative SQL candidates after the first,
+# so the candidates do not all make the same mistake
+_SQL_PROMPT_HINTS = [
+    "",
+    "Use LIKE with % wildcards when matching names and titles.",
+    "Use only the listed columns and write a single SELECT statement.",
+    "Match text case-insensitively with LOWER() on both sides.",
+]
 
 class MusicQueryProcessor:
     """Processes natural language queries for music database"""
     
-    def __init__(self, db_path: str = "music.db"):
+    def __init__(self, db_path: str = None, sql_candidates: int = None):
         """
         Initialize the Music Query Processor.
         
         Args:
-            db_path (str): Path to the SQLite database file
+            db_path (str, optional): Path to the SQLite database file.
+                Defaults to MUSIC_DB_PATH from config.
+            sql_candidates (int, optional): SQL candidates to generate
+                concurrently when the LLM is needed; 1 makes a single call.
+                Defaults to MUSIC_SQL_CANDIDATES from config.
         """
-        self.db_path = db_path
+        self.db_path = db_path or Config.MUSIC_DB_PATH
+        self.data_source = MusicDataSource(
+            self.db_path,
+            pool_size=Config.MUSIC_DB_POOL_SIZE,
+            timeout=Config.MUSIC_QUERY_TIMEOUT,
+            max_rows=Config.MUSIC_QUERY_MAX_ROWS
+        )
+        self.catalog = MusicCatalogIndex(self.data_source)
+        self.router = IntentRouter(self.catalog)
         self.llm_client = LMStudioClient()
+        self.sql_cache = SQLTranslationCache(
+            max_entries=Config.MUSIC_SQL_CACHE_SIZE,
+            ttl=Config.MUSIC_SQL_CACHE_TTL
+        )
+        self.templates = QueryTemplateIndex(
+            min_support=Config.MUSIC_TEMPLATE_MIN_SUPPORT
+        )
+        self.translation_counts = {
+            'cache_hits': 0,
+            'template_hits': 0,
+            'llm_calls': 0
+        }
+        self.sql_candidates = sql_candidates or Config.MUSIC_SQL_CANDIDATES
+        self.speculation_counts = {
+            'runs': 0,
+            'winner_not_first': 0,
+            'first_finished_rejected': 0,
+            'failed': 0
+        }
+        self._candidate_executor = None
+        if self.sql_candidates > 1:
+            self._candidate_executor = ThreadPoolExecutor(
+                max_workers=self.sql_candidates * 2,
+                thread_name_prefix='sql-candidate'
+            )
     
     def generate_sql(self, query: str) -> str:
         """
@@ -24,22 +81,213 @@ class MusicQueryProcessor:
         
         Args:
             query (str): Natural language query
-            
+        
         Returns:
             str: Generated SQL query
         """
-        prompt = f"""
+        with tracer.span('music.generate_sql') as span:
+            # Same question as before: reuse its validated SQL
+            sql = self.sql_cache.get_sql(query)
+            if sql is not None:
+                self.translation_counts['cache_hits'] += 1
+                span.set_attribute('music.sql_source', 'cache')
+                return sql
+            
+            # Known question shape with a new literal: bind it without the LLM
+            sql = self.templates.bind(query)
+            if sql is not None:
+                try:
+                    sql = self._validate_and_clean_sql(sql)
+                except Exception:
+                    sql = None
+            if sql is not None:
+                self.translation_counts['template_hits'] += 1
+                span.set_attribute('music.sql_source', 'template')
+                sql = self.catalog.optimize_sql(sql)
+                self.sql_cache.set_sql(query, sql)
+                return sql
+            
+            self.translation_counts['llm_calls'] += 1
+            span.set_attribute('music.sql_source', 'llm')
+            if self._candidate_executor is not None:
+                sql = self._generate_speculative(query)
+            else:
+                # Deterministic, so repeats can come from the completion cache
+                sql = self._validate_and_clean_sql(
+                    self.llm_client.generate(self._sql_prompt(query), task='sql', temperature=0))
+            # Templates learn the literals of the SQL as written; the cache
+            # keeps the index-friendly rewrite
+            self.templates.learn(query, sql)
+            sql = self.catalog.optimize_sql(sql)
+            self.sql_cache.set_sql(query, sql)
+            return sql
+    
+    @staticmethod
+    def _sql_prompt(query: str, hint: str = "") -> str:
+        """Build the NL-to-SQL prompt, with an optional extra instruction"""
+        return f"""
         Convert the following natural language query to a SQL query for a music database.
         The database has a table 'music' with columns: album, artist, composer, year, genre.
         Make the search case-insensitive and use proper SQL syntax.
-        
+        {hint}
         Query: {query}
         
         Response should only contain the SQL query, nothing else.
         """
+    
+    def _generate_speculative(self, query: str) -> str:
+        """
+        Race several LLM SQL candidates and keep the first valid one.
+        
+        The first candidate is the plain prompt a single call would send,
+        at temperature 0 so it can be served from the completion cache;
+        the others add a prompt hint and rising sampling temperature. They
+        run concurrently, so the backend pool spreads them across LM
+        Studio hosts. The first to pass validation and an EXPLAIN dry-run
+        against the catalogue wins, and the rest are cancelled: queued ones
+        never start and streaming ones drop their connection.
+        
+        Args:
+            query (str): Natural language query
+        
+        Returns:
+            str: Validated SQL of the winning candidate
+        
+        Raises:
+            Exception: If no candidate produces valid SQL
+        """
+        cancelled = threading.Event()
+        futures = {}
+        for index in range(self.sql_candidates):
+            hint = _SQL_PROMPT_HINTS[index % len(_SQL_PROMPT_HINTS)]
+            future = self._candidate_executor.submit(
+                propagate(self._sql_candidate), self._sql_prompt(query, hint), cancelled, index,
+                temperature=min(0.2 * index, 1.0))
+            futures[future] = index
+        
+        errors = []
+        winner = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    sql = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                winner = futures[future]
+                return sql
+        finally:
+            cancelled.set()
+            for future in futures:
+                future.cancel()
+            self._record_speculation(winner, rejected_first=bool(errors))
+        
+        raise Exception(f"Invalid SQL query: none of {len(futures)} candidates "
+                        f"passed validation ({errors[0]})")
+    
+    def _sql_candidate(self, prompt: str, cancelled: threading.Event, index: int = 0,
+                       **kwargs) -> Optional[str]:
+        """
+        Generate one SQL candidate and check it.
+        
+        Args:
+            prompt (str): NL-to-SQL prompt
+            cancelled (threading.Event): Set once another candidate has won
+            index (int): Position of the candidate in the race
+            **kwargs: Additional parameters for the API
+        
+        Returns:
+            Optional[str]: Validated SQL, or None if cancelled
+        
+        Raises:
+            Exception: If the SQL is invalid or does not compile
+        """
+        if cancelled.is_set():
+            return None
+        with tracer.span('music.sql_candidate', attributes={'music.candidate': index}) as span:
+            parts = []
+            stream = self.llm_client.generate_stream(prompt, task='sql', **kwargs)
+            try:
+                for chunk in stream:
+                    if cancelled.is_set():
+                        span.set_attribute('cancelled', True)
+                        return None
+                    parts.append(chunk)
+            finally:
+                # Closing mid-stream drops the connection so LM Studio stops
+                stream.close()
+            
+            sql = self._validate_and_clean_sql(''.join(parts))
+            try:
+                self.data_source.explain(self.catalog.optimize_sql(sql))
+            except sqlite3.Error as e:
+                raise Exception(f"Invalid SQL query: {str(e)}")
+            return sql
+    
+    def _record_speculation(self, winner: Optional[int], rejected_first: bool):
+        """Count the outcome of a speculative SQL race"""
+        counts = self.speculation_counts
+        counts['runs'] += 1
+        if winner is None:
+            counts['failed'] += 1
+            return
+        if winner != 0:
+            counts['winner_not_first'] += 1
+        if rejected_first:
+            counts['first_finished_rejected'] += 1
+    
+    def translation_stats(self) -> Dict[str, Any]:
+        """
+        Get NL-to-SQL translation statistics.
+        
+        Returns:
+            Dict[str, Any]: Cache and template hits, LLM calls made and saved,
+            and the number of learned templates
+        """
+        counts = dict(self.translation_counts)
+        saved = counts['cache_hits'] + counts['template_hits']
+        total = saved + counts['llm_calls']
+        counts['llm_calls_saved'] = saved
+        counts['hit_ratio'] = saved / total if total else 0.0
+        counts['templates'] = len(self.templates)
+        counts.update(self.router.stats())
+        if self._candidate_executor is not None:
+            speculative = dict(self.speculation_counts)
+            won = speculative['runs'] - speculative['failed']
+            speculative['candidates'] = self.sql_candidates
+            speculative['winner_not_first_ratio'] = speculative['winner_not_first'] / won if won else 0.0
+            counts['speculative'] = speculative
+        return counts
+    
+    def answer_directly(self, question: str, max_rows: int) -> Optional[Tuple[List[Dict[str, Any]], bool, str]]:
+        """
+        Answer a simple question without the LLM, if the router knows it.
+        
+        Args:
+            question (str): Natural language question
+            max_rows (int): Row cap for the results
+        
+        Returns:
+            Optional[Tuple[List[Dict[str, Any]], bool, str]]: Results,
+            whether they were capped, and the reply text; None if the
+            question needs the LLM
         
-        sql = self.llm_client.generate(prompt)
-        return self._validate_and_clean_sql(sql)
+        Raises:
+            Exception: If query execution fails
+        """
+        with tracer.span('music.answer_directly') as span:
+            routed = self.router.route(question)
+            span.set_attribute('music.routed', routed is not None)
+            if routed is None:
+                return None
+            results, truncated = self.fetch_results(routed.sql, max_rows, params=routed.params)
+            if not routed.verified and routed.matched_nothing(results):
+                # Nothing matched a name taken from the question, which may
+                # have been misread; let the LLM write the SQL instead
+                self.router.reject(routed)
+                span.set_attribute('music.routed', False)
+                return None
+            return results, truncated, routed.answer(results, truncated, Config.MUSIC_PROMPT_MAX_ROWS)
     
     def execute_query(self, sql: str) -> List[Dict[str, Any]]:
         """
@@ -47,44 +295,97 @@ class MusicQueryProcessor:
         
         Args:
             sql (str): SQL query to execute
-            
+        
         Returns:
             List[Dict[str, Any]]: Query results
-            
+        
         Raises:
             Exception: If query execution fails
         """
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute(sql)
-                return [dict(row) for row in cursor.fetchall()]
-        except sqlite3.Error as e:
-            raise Exception(f"Database error: {str(e)}")
+        return self.fetch_results(sql)[0]
     
-    def format_results(self, results: List[Dict[str, Any]]) -> str:
+    def fetch_results(self, sql: str, max_rows: Optional[int] = None,
+                      params: Tuple = ()) -> Tuple[List[Dict[str, Any]], bool]:
         """
-        Format query results for LLM processing.
+        Execute SQL query and return at most max_rows rows.
+        
+        Args:
+            sql (str): SQL query to execute
+            max_rows (int, optional): Row cap; None returns up to
+                MUSIC_QUERY_MAX_ROWS rows
+            params (Tuple): Bound query parameters
+        
+        Returns:
+            Tuple[List[Dict[str, Any]], bool]: Query results and whether
+            more rows were available than returned
+        
+        Raises:
+            Exception: If query execution fails
+        """
+        with tracer.span('music.execute') as span:
+            try:
+                if max_rows is None:
+                    rows = list(self.data_source.stream(sql, params))
+                    span.set_attribute('music.rows', len(rows))
+                    return rows, False
+                rows = list(self.data_source.stream(sql, params, max_rows=max_rows + 1))
+                span.set_attribute('music.rows', min(len(rows), max_rows))
+                return rows[:max_rows], len(rows) > max_rows
+            except (QueryTimeoutError, sqlite3.Error) as e:
+                raise Exception(f"Database error: {str(e)}")
+    
+    def iter_results(self, sql: str, max_rows: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Execute SQL query and stream its rows.
+        
+        Args:
+            sql (str): SQL query to execute
+            max_rows (int, optional): Row cap, bounded by MUSIC_QUERY_MAX_ROWS
+        
+        Yields:
+            Dict[str, Any]: One result row
+        """
+        return self.data_source.stream(sql, max_rows=max_rows)
+    
+    def format_results(self, results: List[Dict[str, Any]], question: str = None,
+                       truncated: bool = False) -> str:
+        """
+        Build the prompt that asks the LLM to summarize query results.
+        
+        Only the first MUSIC_PROMPT_MAX_ROWS rows are included, as compact
+        pipe-separated lines, so prompt size stays bounded however many
+        rows the query returned.
         
         Args:
             results (List[Dict[str, Any]]): Query results
-            
+            question (str, optional): The user's original question
+            truncated (bool): Whether results were already capped
+        
         Returns:
-            str: Formatted results
+            str: Prompt for a single streamed summary
         """
         if not results:
             return "No results found matching your query."
-            
-        formatted_results = json.dumps(results, indent=2)
-        prompt = f"""
-        Convert these music database results into a natural language response:
-        {formatted_results}
+        
+        max_rows = Config.MUSIC_PROMPT_MAX_ROWS
+        columns = list(results[0].keys())
+        lines = [' | '.join(columns)]
+        for row in results[:max_rows]:
+            lines.append(' | '.join('' if row[col] is None else str(row[col]) for col in columns))
+        
+        note = ""
+        if truncated or len(results) > max_rows:
+            note = (f"Only the first {min(len(results), max_rows)} rows are shown; "
+                    "there are more. Mention that the list is partial.")
+        asked = f"The user asked: {question}\n" if question else ""
+        
+        return f"""
+        {asked}Convert these music database results into a natural language response:
+        {chr(10).join(lines)}
+        {note}
         
         Make the response conversational and well-formatted.
         """
-        
-        return self.llm_client.generate(prompt)
     
     def _validate_and_clean_sql(self, sql: str) -> str:
         """
@@ -92,10 +393,10 @@ class MusicQueryProcessor:
         
         Args:
             sql (str): SQL query to validate
-            
+        
         Returns:
             str: Cleaned SQL query
-            
+        
         Raises:
             Exception: If SQL query is invalid
         """
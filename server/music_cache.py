@@ -0,0 +1,255 @@
+# server/music_cache.py
+
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from .cache import LRUCache
+
+_QUOTED_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+_NUMERIC_LITERAL = re.compile(r"(?<![\w.'])(\d+)(?![\w.'])")
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a natural language question for cache lookups.
+    
+    Args:
+        question (str): Question as typed by the user
+        
+    Returns:
+        str: Lowercased question with collapsed whitespace and no trailing
+        punctuation
+    """
+    return ' '.join(question.split()).lower().rstrip('?!. ')
+
+class SQLTranslationCache(LRUCache):
+    """Cache of validated SQL keyed by normalized question"""
+    
+    def get_sql(self, question: str) -> Optional[str]:
+        """Get cached SQL for a question"""
+        return self.get(normalize_question(question))
+    
+    def set_sql(self, question: str, sql: str):
+        """Cache validated SQL for a question"""
+        self.set(normalize_question(question), sql)
+
+class QueryTemplate:
+    """A learned question shape and the SQL it translates to"""
+    
+    def __init__(self, pattern: str, sql_template: str, slots: List[Tuple[str, str]]):
+        """
+        Initialize the template.
+        
+        Args:
+            pattern (str): Regex matching the question, one group per slot
+            sql_template (str): SQL with {{slotN}} placeholders
+            slots (List[Tuple[str, str]]): (kind, case) per slot, where kind
+                is 'text' or 'number' and case is 'same', 'lower' or 'upper'
+        """
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.sql_template = sql_template
+        self.slots = slots
+        self.support = 1
+    
+    @property
+    def key(self) -> Tuple:
+        """Identity of the template"""
+        return (self.pattern, self.sql_template, tuple(self.slots))
+    
+    def bind(self, question: str) -> Optional[str]:
+        """
+        Bind a question's literals into the SQL template.
+        
+        Args:
+            question (str): Whitespace-normalized question
+            
+        Returns:
+            Optional[str]: SQL with literals substituted, or None if the
+            question does not have this shape
+        """
+        match = self.regex.match(question)
+        if not match:
+            return None
+        
+        sql = self.sql_template
+        for index, ((kind, case), value) in enumerate(zip(self.slots, match.groups())):
+            if kind == 'number':
+                if not value.isdigit():
+                    return None
+            else:
+                if case == 'lower':
+                    value = value.lower()
+                elif case == 'upper':
+                    value = value.upper()
+                # Bound into a quoted SQL string: escape quotes
+                value = value.replace("'", "''")
+            sql = sql.replace(f"{{{{slot{index}}}}}", value)
+        return sql
+
+class QueryTemplateIndex:
+    """
+    Learns parameterized SQL for recurring question shapes.
+    
+    When the LLM translates a question, literals that appear in both the
+    question and the SQL (quoted strings, LIKE patterns, numbers) become
+    slots. A shape seen with at least min_support different literals and the
+    same SQL is trusted to translate new questions of that shape without
+    calling the LLM.
+    """
+    
+    def __init__(self, max_templates: int = 256, min_support: int = 2):
+        """
+        Initialize the index.
+        
+        Args:
+            max_templates (int): Templates kept before the least recently
+                used one is evicted
+            min_support (int): Times a template must be learned before it
+                is used
+        """
+        self.max_templates = max_templates
+        self.min_support = min_support
+        self._templates: "OrderedDict[Tuple, QueryTemplate]" = OrderedDict()
+        self._seen: Dict[Tuple, set] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self._templates)
+    
+    def learn(self, question: str, sql: str) -> Optional[QueryTemplate]:
+        """
+        Record a validated translation.
+        
+        Args:
+            question (str): Question that was translated
+            sql (str): Validated SQL the LLM produced for it
+            
+        Returns:
+            Optional[QueryTemplate]: The template, or None if the question
+            shares no literal with the SQL
+        """
+        question = ' '.join(question.split())
+        template = self._extract(question, sql)
+        if template is None:
+            return None
+        
+        literals = tuple(template.regex.match(question).groups())
+        with self._lock:
+            seen = self._seen.setdefault(template.key, set())
+            seen.add(tuple(value.lower() for value in literals))
+            existing = self._templates.get(template.key)
+            if existing is None:
+                self._templates[template.key] = template
+                existing = template
+            existing.support = len(seen)
+            self._templates.move_to_end(template.key)
+            while len(self._templates) > self.max_templates:
+                evicted, _ = self._templates.popitem(last=False)
+                self._seen.pop(evicted, None)
+        return existing
+    
+    def bind(self, question: str) -> Optional[str]:
+        """
+        Translate a question using a trusted template.
+        
+        Args:
+            question (str): Question to translate
+            
+        Returns:
+            Optional[str]: SQL, or None if no trusted template matches
+        """
+        question = ' '.join(question.split()).rstrip('?!. ')
+        with self._lock:
+            templates = [t for t in reversed(self._templates.values())
+                         if t.support >= self.min_support]
+        for template in templates:
+            sql = template.bind(question)
+            if sql is not None:
+                return sql
+        return None
+    
+    def _extract(self, question: str, sql: str) -> Optional[QueryTemplate]:
+        """Build a template from a question and its SQL"""
+        question = question.rstrip('?!. ')
+        lowered = question.lower()
+        candidates = []
+        
+        # Quoted literals, ignoring LIKE wildcards around the value
+        for match in _QUOTED_LITERAL.finditer(sql):
+            raw = match.group(1)
+            core = raw.strip('%').replace("''", "'")
+            if len(core) < 2 or '%' in core or '_' in core:
+                continue
+            start = match.start(1) + (len(raw) - len(raw.lstrip('%')))
+            candidates.append(('text', core, start, start + len(raw.strip('%'))))
+        
+        # Bare numbers outside quotes
+        quoted_spans = [m.span() for m in _QUOTED_LITERAL.finditer(sql)]
+        for match in _NUMERIC_LITERAL.finditer(sql):
+            if any(a <= match.start() < b for a, b in quoted_spans):
+                continue
+            candidates.append(('number', match.group(1), match.start(1), match.end(1)))
+        
+        # Keep literals that also occur, as whole words, in the question.
+        # The same literal may appear several times in the SQL (e.g. matched
+        # against both artist and composer); those share one slot.
+        by_position = {}
+        for kind, value, sql_start, sql_end in candidates:
+            position = self._find_word(lowered, value.lower())
+            if position is None:
+                continue
+            question_value = question[position:position + len(value)]
+            if kind == 'number':
+                case = 'same'
+            elif value == question_value.lower():
+                case = 'lower'
+            elif value == question_value.upper():
+                case = 'upper'
+            else:
+                case = 'same'
+            slot = by_position.setdefault(position, [kind, case, len(value), []])
+            if slot[:3] != [kind, case, len(value)]:
+                return None
+            slot[3].append((sql_start, sql_end))
+        
+        if not by_position:
+            return None
+        
+        # Question positions must not overlap
+        positions = sorted(by_position)
+        for previous, current in zip(positions, positions[1:]):
+            if current < previous + by_position[previous][2]:
+                return None
+        
+        pattern_parts = []
+        cursor = 0
+        for position in positions:
+            kind, _, length, _ = by_position[position]
+            pattern_parts.append(re.escape(lowered[cursor:position]))
+            pattern_parts.append(r'(\d+)' if kind == 'number' else r'(.+?)')
+            cursor = position + length
+        pattern_parts.append(re.escape(lowered[cursor:]))
+        pattern = '^' + ''.join(pattern_parts) + '$'
+        
+        # Substitute SQL spans from the end so earlier offsets stay valid
+        spans = [
+            (sql_start, sql_end, index)
+            for index, position in enumerate(positions)
+            for sql_start, sql_end in by_position[position][3]
+        ]
+        sql_template = sql
+        for sql_start, sql_end, index in sorted(spans, reverse=True):
+            sql_template = sql_template[:sql_start] + f"{{{{slot{index}}}}}" + sql_template[sql_end:]
+        
+        return QueryTemplate(
+            pattern,
+            sql_template,
+            [tuple(by_position[position][:2]) for position in positions]
+        )
+    
+    @staticmethod
+    def _find_word(text: str, word: str) -> Optional[int]:
+        """Find word in text at word boundaries"""
+        match = re.search(r'(?<!\w)' + re.escape(word) + r'(?!\w)', text)
+        return match.start() if match else None
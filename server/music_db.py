@@ -0,0 +1,184 @@
+# server/music_db.py
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Generator, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class QueryTimeoutError(Exception):
+    """Raised when a music query runs longer than its time budget"""
+    pass
+
+class MusicDataSource:
+    """
+    Read-only access to the music database through a small connection pool.
+    
+    Connections are opened lazily in read-only mode with query_only set, a
+    larger page cache and memory-mapped I/O, and are reused across queries
+    so their prepared statement caches stay warm. Queries stream rows
+    through a generator, are capped at a row limit, and are aborted by a
+    progress handler once their time budget is spent.
+    """
+    
+    def __init__(self, db_path: str, pool_size: int = 4, timeout: float = 2.0,
+                 max_rows: int = 10000, cache_size_kb: int = 16384,
+                 mmap_size: int = 256 * 1024 * 1024, statement_cache: int = 256):
+        """
+        Initialize the data source.
+        
+        Args:
+            db_path (str): Path to the SQLite music database
+            pool_size (int): Maximum number of open connections
+            timeout (float): Default per-query time budget in seconds
+            max_rows (int): Hard cap on rows any query may return
+            cache_size_kb (int): SQLite page cache per connection, in KiB
+            mmap_size (int): Bytes of the database file to memory-map
+            statement_cache (int): Prepared statements cached per connection
+        """
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.statement_cache = statement_cache
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._wal_checked = False
+        self._lock = threading.Lock()
+    
+    def _enable_wal(self):
+        """Switch the database to WAL so readers never block on a writer"""
+        with self._lock:
+            if self._wal_checked:
+                return
+            if not os.path.exists(self.db_path):
+                # Never create the file here; a wrong MUSIC_DB_PATH must
+                # fail loudly in _connect rather than serve an empty catalogue
+                logger.warning("Music database %s does not exist", self.db_path)
+                return
+            self._wal_checked = True
+            try:
+                conn = sqlite3.connect(f"file:{self.db_path}?mode=rw", uri=True, timeout=1)
+                try:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                # A read-only file keeps its current journal mode
+                logger.debug("Could not enable WAL on %s: %s", self.db_path, e)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a tuned read-only connection"""
+        self._enable_wal()
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.statement_cache
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+    
+    @contextmanager
+    def connection(self) -> Generator[sqlite3.Connection, None, None]:
+        """
+        Borrow a pooled connection.
+        
+        Yields:
+            sqlite3.Connection: Read-only connection, returned to the pool
+            afterwards
+        """
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            yield conn
+        except sqlite3.Error:
+            # Don't return a connection in an unknown state to the pool
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+    
+    def stream(self, sql: str, params: Iterable[Any] = (), max_rows: Optional[int] = None,
+               timeout: Optional[float] = None, batch_size: int = 256) -> Generator[Dict[str, Any], None, None]:
+        """
+        Execute a query and yield rows as dictionaries.
+        
+        Args:
+            sql (str): SQL query to execute
+            params (Iterable[Any]): Bound query parameters
+            max_rows (int, optional): Row cap, never above the hard cap
+            timeout (float, optional): Time budget in seconds
+            batch_size (int): Rows fetched from SQLite per batch
+            
+        Yields:
+            Dict[str, Any]: One result row
+            
+        Raises:
+            QueryTimeoutError: If the query exceeds its time budget
+            sqlite3.Error: If the query fails
+        """
+        limit = self.max_rows if max_rows is None else min(max_rows, self.max_rows)
+        budget = self.timeout if timeout is None else timeout
+        
+        with self.connection() as conn:
+            deadline = time.monotonic() + budget
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, tuple(params))
+                returned = 0
+                while returned < limit:
+                    rows = cursor.fetchmany(min(batch_size, limit - returned))
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(row)
+                    returned += len(rows)
+            except sqlite3.OperationalError as e:
+                if 'interrupted' in str(e):
+                    raise QueryTimeoutError(f"Query exceeded {budget}s time limit")
+                raise
+            finally:
+                cursor.close()
+                conn.set_progress_handler(None, 0)
+    
+    def explain(self, sql: str):
+        """
+        Check that a query compiles against the schema without running it.
+        
+        Args:
+            sql (str): SQL query to check
+            
+        Raises:
+            sqlite3.Error: If the query does not compile, e.g. it names a
+                missing column
+        """
+        with self.connection() as conn:
+            conn.execute(f"EXPLAIN {sql}").close()
+    
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,261 @@
+# server/music_import.py
+
+import csv
+import io
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, IO, Iterator, Optional, Tuple
+from .music_index import MusicCatalogIndex
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('album', 'artist', 'composer', 'year', 'genre')
+FORMATS = ('csv', 'jsonl')
+
+# Secondary indexes dropped during an import and rebuilt once afterwards
+_SECONDARY_INDEXES = ('ix_music_year', 'ix_music_genre', 'ix_music_artist')
+
+def detect_format(filename: str) -> str:
+    """
+    Guess an import format from a file name.
+    
+    Args:
+        filename (str): Name of the file
+    
+    Returns:
+        str: 'csv' or 'jsonl'
+    
+    Raises:
+        ValueError: If the extension is not recognized
+    """
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    raise ValueError(f"Unrecognized import format: {filename}")
+
+def _clean(record: Dict[str, Any]) -> Optional[Tuple]:
+    """Normalize one record to a row tuple, or None if it is unusable"""
+    values = {}
+    for field in FIELDS:
+        value = record.get(field)
+        if isinstance(value, str):
+            value = value.strip() or None
+        values[field] = value
+    if not values['album'] or not values['artist']:
+        return None
+    if values['year'] is not None:
+        try:
+            values['year'] = int(values['year'])
+        except (TypeError, ValueError):
+            values['year'] = None
+    return tuple(values[field] for field in FIELDS)
+
+def iter_rows(stream: IO[str], fmt: str, stats: Dict[str, int]) -> Iterator[Tuple]:
+    """
+    Parse catalogue rows from a text stream one at a time.
+    
+    CSV needs a header row naming the columns; JSON-lines needs one object
+    per line. Records without an album or artist, and malformed lines, are
+    counted as skipped.
+    
+    Args:
+        stream (IO[str]): Text stream to read
+        fmt (str): 'csv' or 'jsonl'
+        stats (Dict[str, int]): Counters; 'skipped' is incremented
+    
+    Yields:
+        Tuple: (album, artist, composer, year, genre)
+    """
+    if fmt == 'csv':
+        records = (
+            {key.strip().lower(): value for key, value in record.items() if key}
+            for record in csv.DictReader(stream)
+        )
+    elif fmt == 'jsonl':
+        records = _iter_json_lines(stream, stats)
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+    
+    for record in records:
+        row = _clean(record)
+        if row is None:
+            stats['skipped'] += 1
+            continue
+        yield row
+
+def _iter_json_lines(stream: IO[str], stats: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """Yield the objects of a JSON-lines stream, skipping bad lines"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            stats['skipped'] += 1
+            continue
+        if isinstance(record, dict):
+            yield {str(key).lower(): value for key, value in record.items()}
+        else:
+            stats['skipped'] += 1
+
+class MusicImporter:
+    """
+    Bulk loads catalogue rows into the music database.
+    
+    Input is parsed as a stream and written in large executemany batches,
+    one transaction per batch, so memory stays constant however big the
+    file is. Rows are upserted on (album, artist): new pairs are inserted,
+    changed ones updated and unchanged ones left alone, so re-importing a
+    catalogue only writes what changed. Secondary and full-text indexes
+    are rebuilt once at the end rather than maintained row by row.
+    """
+    
+    UPSERT_SQL = (
+        "INSERT INTO music (album, artist, composer, year, genre) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (album, artist) DO UPDATE SET "
+        "composer = excluded.composer, year = excluded.year, genre = excluded.genre "
+        "WHERE composer IS NOT excluded.composer OR year IS NOT excluded.year "
+        "OR genre IS NOT excluded.genre"
+    )
+    
+    def __init__(self, db_path: str, batch_size: int = 5000):
+        """
+        Initialize the importer.
+        
+        Args:
+            db_path (str): Path to the music database, created if missing
+            batch_size (int): Rows written per transaction
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open a writable connection tuned for bulk loading"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Under WAL, NORMAL skips the per-commit fsync yet a power loss can
+        # only lose the last batches, which a re-import upserts again; OFF
+        # could corrupt the database
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -65536")
+        return conn
+    
+    def _prepare(self, conn: sqlite3.Connection):
+        """Ensure the schema, the dedupe key, and drop secondary indexes"""
+        MusicCatalogIndex.ensure_schema(conn)
+        conn.execute("BEGIN")
+        has_key = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'ux_music_album_artist'").fetchone()
+        if not has_key:
+            # Catalogues loaded by hand may hold duplicates; keep the newest
+            conn.execute(
+                "DELETE FROM music WHERE rowid NOT IN "
+                "(SELECT max(rowid) FROM music GROUP BY album, artist)"
+            )
+            conn.execute("CREATE UNIQUE INDEX ux_music_album_artist ON music (album, artist)")
+        for index in _SECONDARY_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.execute("COMMIT")
+    
+    def import_stream(self, stream: IO[str], fmt: str, rebuild_indexes: bool = True) -> Dict[str, Any]:
+        """
+        Import catalogue rows from a text stream.
+        
+        Args:
+            stream (IO[str]): CSV or JSON-lines text
+            fmt (str): 'csv' or 'jsonl'
+            rebuild_indexes (bool): Rebuild search indexes and facet counts
+                when done
+        
+        Returns:
+            Dict[str, Any]: Rows read, written (inserted or changed),
+            unchanged and skipped, elapsed seconds and rows per second
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown import format: {fmt}")
+        stats = {'rows': 0, 'written': 0, 'unchanged': 0, 'skipped': 0}
+        started = time.perf_counter()
+        
+        conn = self._connect()
+        try:
+            self._prepare(conn)
+            batch = []
+            try:
+                for row in iter_rows(stream, fmt, stats):
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        self._write(conn, batch, stats)
+                        batch = []
+                if batch:
+                    self._write(conn, batch, stats)
+            finally:
+                # Put the secondary indexes back even if the input was bad
+                MusicCatalogIndex.ensure_schema(conn)
+        finally:
+            conn.close()
+        
+        if rebuild_indexes:
+            MusicCatalogIndex.rebuild(self.db_path)
+        
+        stats['unchanged'] = stats['rows'] - stats['written']
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        stats['rows_per_sec'] = int(stats['rows'] / stats['seconds']) if stats['seconds'] else stats['rows']
+        logger.info("Imported %d music rows (%d written, %d skipped) at %d rows/sec",
+                    stats['rows'], stats['written'], stats['skipped'], stats['rows_per_sec'])
+        return stats
+    
+    def import_file(self, path: str, fmt: Optional[str] = None, rebuild_indexes: bool = True) -> Dict[str, Any]:
+        """
+        Import catalogue rows from a CSV or JSON-lines file.
+        
+        Args:
+            path (str): File to import
+            fmt (str, optional): 'csv' or 'jsonl'; guessed from the
+                extension if omitted
+            rebuild_indexes (bool): Rebuild search indexes when done
+        
+        Returns:
+            Dict[str, Any]: Import statistics, as for import_stream
+        """
+        fmt = fmt or detect_format(path)
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            return self.import_stream(stream, fmt, rebuild_indexes=rebuild_indexes)
+    
+    def import_binary(self, stream: IO[bytes], fmt: str, rebuild_indexes: bool = True) -> Dict[str, Any]:
+        """
+        Import catalogue rows from a UTF-8 byte stream, e.g. a request body.
+        
+        Args:
+            stream (IO[bytes]): CSV or JSON-lines bytes
+            fmt (str): 'csv' or 'jsonl'
+            rebuild_indexes (bool): Rebuild search indexes when done
+        
+        Returns:
+            Dict[str, Any]: Import statistics, as for import_stream
+        """
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            return self.import_stream(text, fmt, rebuild_indexes=rebuild_indexes)
+        finally:
+            # The caller owns the underlying stream
+            text.detach()
+    
+    def _write(self, conn: sqlite3.Connection, batch, stats: Dict[str, int]):
+        """Upsert one batch in a single transaction"""
+        before = conn.total_changes
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(self.UPSERT_SQL, batch)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        stats['rows'] += len(batch)
+        stats['written'] += conn.total_changes - before
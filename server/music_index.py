@@ -0,0 +1,271 @@
+# server/music_index.py
+
+import logging
+import re
+import sqlite3
+from typing import Any, Dict, List, Optional
+import click
+from flask.cli import with_appcontext
+from .music_db import MusicDataSource
+
+logger = logging.getLogger(__name__)
+
+TEXT_COLUMNS = ('album', 'artist', 'composer', 'genre')
+FACETS = ('genre', 'year', 'artist', 'composer')
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+# col LIKE '%text%', optionally wrapped in LOWER()/UPPER()
+_LIKE = re.compile(
+    r"(?:\b(?:lower|upper)\s*\(\s*)?\b(album|artist|composer|genre)\b\s*\)?"
+    r"\s+like\s+'%([^'%_]+)%'",
+    re.IGNORECASE
+)
+# LOWER(col) = 'text'
+_LOWER_EQ = re.compile(
+    r"\b(?:lower|upper)\s*\(\s*(artist|genre)\s*\)\s*=\s*('[^']*')",
+    re.IGNORECASE
+)
+
+def match_expression(text: str, column: Optional[str] = None) -> str:
+    """
+    Build an FTS5 MATCH expression that finds all words of some text.
+    
+    Each word is quoted, so FTS5 syntax in the text is treated as plain
+    words, and the last word matches as a prefix.
+    
+    Args:
+        text (str): Text to find
+        column (str, optional): Restrict matching to this column
+    
+    Returns:
+        str: MATCH expression, or '' if the text has no words
+    """
+    words = _WORD.findall(text.lower())
+    if not words:
+        return ''
+    terms = ' '.join([f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*'])
+    return f"{column}: ({terms})" if column else terms
+
+class MusicCatalogIndex:
+    """
+    Search indexes over the music catalogue.
+    
+    Adds an FTS5 table over the text columns with a tokenizer that folds
+    case and diacritics, B-tree indexes on year, genre and artist, and a
+    table of precomputed facet counts. Lookups by text, genre and year are
+    answered from these directly, and LIKE scans in generated SQL are
+    rewritten to use them.
+    
+    The FTS table uses the music table as external content and has no
+    triggers, so bulk writes stay fast; writers call rebuild() once after
+    changing the catalogue.
+    """
+    
+    FTS_TABLE = 'music_fts'
+    FACET_TABLE = 'music_facets'
+    
+    def __init__(self, data_source: MusicDataSource):
+        """
+        Initialize the index.
+        
+        Args:
+            data_source (MusicDataSource): Read-only catalogue access
+        """
+        self.data_source = data_source
+        self._available = False
+    
+    @classmethod
+    def ensure_schema(cls, conn: sqlite3.Connection):
+        """
+        Create the catalogue table and its indexes if they are missing.
+        
+        Args:
+            conn (sqlite3.Connection): Writable connection
+        """
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS music (
+                id INTEGER PRIMARY KEY,
+                album TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                composer TEXT,
+                year INTEGER,
+                genre TEXT
+            );
+            CREATE INDEX IF NOT EXISTS ix_music_year ON music (year);
+            CREATE INDEX IF NOT EXISTS ix_music_genre ON music (genre COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS ix_music_artist ON music (artist COLLATE NOCASE);
+            CREATE VIRTUAL TABLE IF NOT EXISTS {cls.FTS_TABLE} USING fts5(
+                {', '.join(TEXT_COLUMNS)},
+                content='music',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS {cls.FACET_TABLE} (
+                facet TEXT NOT NULL,
+                value TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (facet, value)
+            ) WITHOUT ROWID;
+        """)
+    
+    @classmethod
+    def rebuild(cls, db_path: str) -> Dict[str, int]:
+        """
+        Rebuild the full-text index and facet counts from the catalogue.
+        
+        Args:
+            db_path (str): Path to the music database
+        
+        Returns:
+            Dict[str, int]: Catalogue rows and facet values indexed
+        """
+        conn = sqlite3.connect(db_path)
+        try:
+            cls.ensure_schema(conn)
+            with conn:
+                conn.execute(f"INSERT INTO {cls.FTS_TABLE} ({cls.FTS_TABLE}) VALUES ('rebuild')")
+                conn.execute(f"DELETE FROM {cls.FACET_TABLE}")
+                for facet in FACETS:
+                    conn.execute(
+                        f"INSERT INTO {cls.FACET_TABLE} (facet, value, count) "
+                        f"SELECT '{facet}', CAST({facet} AS TEXT), count(*) FROM music "
+                        f"WHERE {facet} IS NOT NULL AND {facet} != '' GROUP BY {facet}"
+                    )
+            conn.execute("ANALYZE")
+            rows = conn.execute("SELECT count(*) FROM music").fetchone()[0]
+            facets = conn.execute(f"SELECT count(*) FROM {cls.FACET_TABLE}").fetchone()[0]
+        finally:
+            conn.close()
+        logger.info("Indexed %d catalogue rows and %d facet values", rows, facets)
+        return {'rows': rows, 'facet_values': facets}
+    
+    def available(self) -> bool:
+        """Whether the catalogue has been indexed"""
+        if not self._available:
+            try:
+                rows = list(self.data_source.stream(
+                    "SELECT name FROM sqlite_master WHERE name IN (?, ?)",
+                    (self.FTS_TABLE, self.FACET_TABLE)))
+                self._available = len(rows) == 2
+            except sqlite3.Error:
+                return False
+        return self._available
+    
+    def optimize_sql(self, sql: str) -> str:
+        """
+        Rewrite scans in generated SQL to use the catalogue indexes.
+        
+        Substring LIKE filters on text columns become full-text matches,
+        which find whole words and word prefixes rather than any
+        substring. Case-insensitive equality on artist or genre becomes a
+        NOCASE comparison that can use their indexes.
+        
+        Args:
+            sql (str): Validated SELECT on the music table
+        
+        Returns:
+            str: Equivalent SQL that uses the indexes where possible
+        """
+        if not self.available() or re.search(r'\bjoin\b', sql, re.IGNORECASE):
+            return sql
+        
+        def fts(match):
+            expression = match_expression(match.group(2), match.group(1).lower())
+            if not expression:
+                return match.group(0)
+            return (f"rowid IN (SELECT rowid FROM {self.FTS_TABLE} "
+                    f"WHERE {self.FTS_TABLE} MATCH '{expression}')")
+        
+        sql = _LIKE.sub(fts, sql)
+        return _LOWER_EQ.sub(lambda m: f"{m.group(1)} = {m.group(2)} COLLATE NOCASE", sql)
+    
+    def search(self, text: str = '', genre: Optional[str] = None, year: Optional[int] = None,
+               limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Look up catalogue entries without going through the LLM.
+        
+        Args:
+            text (str): Words to find in album, artist, composer or genre
+            genre (str, optional): Exact genre, case-insensitive
+            year (int, optional): Release year
+            limit (int): Maximum number of rows
+        
+        Returns:
+            List[Dict[str, Any]]: Matching rows, best text matches first
+        """
+        match = match_expression(text)
+        conditions, params = [], []
+        if match:
+            conditions.append(f"{self.FTS_TABLE} MATCH ?")
+            params.append(match)
+        if genre:
+            conditions.append("music.genre = ? COLLATE NOCASE")
+            params.append(genre)
+        if year is not None:
+            conditions.append("music.year = ?")
+            params.append(year)
+        if not conditions:
+            return []
+        
+        if match:
+            sql = (f"SELECT music.album, music.artist, music.composer, music.year, music.genre "
+                   f"FROM {self.FTS_TABLE} JOIN music ON music.rowid = {self.FTS_TABLE}.rowid "
+                   f"WHERE {' AND '.join(conditions)} ORDER BY {self.FTS_TABLE}.rank")
+        else:
+            sql = (f"SELECT album, artist, composer, year, genre FROM music "
+                   f"WHERE {' AND '.join(conditions)} ORDER BY artist, album")
+        return list(self.data_source.stream(sql, params, max_rows=limit))
+    
+    def facets(self, facet: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Get precomputed value counts for a facet, most common first.
+        
+        Args:
+            facet (str): One of genre, year, artist or composer
+            limit (int): Maximum number of values
+        
+        Returns:
+            List[Dict[str, Any]]: Values with their catalogue counts
+        
+        Raises:
+            ValueError: If the facet is unknown
+        """
+        if facet not in FACETS:
+            raise ValueError(f"Unknown facet: {facet}")
+        return list(self.data_source.stream(
+            f"SELECT value, count FROM {self.FACET_TABLE} WHERE facet = ? "
+            f"ORDER BY count DESC, value",
+            (facet,), max_rows=limit))
+
+@click.group('music')
+def music_cli():
+    """Music catalogue commands"""
+    pass
+
+@music_cli.command('index')
+@with_appcontext
+def index_command():
+    """Build the catalogue search indexes and facet counts"""
+    from flask import current_app
+    stats = MusicCatalogIndex.rebuild(current_app.config['MUSIC_DB_PATH'])
+    click.echo(f"Indexed {stats['rows']} rows, {stats['facet_values']} facet values")
+
+@music_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; guessed from the extension if omitted')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows per transaction')
+@click.option('--no-index', is_flag=True, help='Skip rebuilding the search indexes')
+@with_appcontext
+def import_command(path, fmt, batch_size, no_index):
+    """Import catalogue rows from a CSV or JSON-lines file"""
+    from flask import current_app
+    from .music_import import MusicImporter
+    importer = MusicImporter(current_app.config['MUSIC_DB_PATH'], batch_size=batch_size)
+    try:
+        stats = importer.import_file(path, fmt=fmt, rebuild_indexes=not no_index)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Imported {stats['rows']} rows ({stats['written']} written, "
+               f"{stats['unchanged']} unchanged, {stats['skipped']} skipped) "
+               f"in {stats['seconds']}s: {stats['rows_per_sec']} rows/sec")
@@ -0,0 +1,291 @@
+# server/music_intent.py
+
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from .music_cache import normalize_question
+from .music_index import MusicCatalogIndex, match_expression
+
+# Question nouns and the catalogue column they are about; album counts
+# are row counts, since the catalogue holds one row per album
+_NOUNS = {
+    'album': 'album', 'albums': 'album', 'record': 'album', 'records': 'album',
+    'release': 'album', 'releases': 'album',
+    'artist': 'artist', 'artists': 'artist', 'band': 'artist', 'bands': 'artist',
+    'musicians': 'artist',
+    'composer': 'composer', 'composers': 'composer',
+    'genre': 'genre', 'genres': 'genre', 'styles': 'genre',
+    'years': 'year',
+}
+_NOUN = '|'.join(sorted(_NOUNS, key=len, reverse=True))
+_DISTINCT = r"(?:different |distinct |unique )?"
+_TAIL = r"(?: are there| do (?:we|i|you) have| are in the (?:database|catalog|catalogue|collection)| in the (?:database|catalog|catalogue|collection))?"
+
+_COUNT = re.compile(
+    rf"^how many {_DISTINCT}(?:(?P<genre>[\w&' -]+?) )?(?P<noun>{_NOUN})(?P<filter>.*?){_TAIL}$")
+_LIST = re.compile(
+    rf"^(?:(?:list|show|give|display)(?: me)?|what)(?: are)?(?: all)?(?: of)?(?: the)? {_DISTINCT}"
+    rf"(?P<noun>artists|bands|musicians|composers|genres|styles|years){_TAIL}$")
+_FILTER = re.compile(
+    r"^(?:(?:list|show|find|get|give|display)(?: me)?(?: all)?(?: of)?(?: the)? )?"
+    r"(?:(?P<genre>[\w&' -]+?) )?(?:albums|records|releases)(?P<filter>.*?)$")
+
+# Single-field filters, tried in order; a genre filter only applies to
+# genres the catalogue has, so "albums of the beatles" falls through to
+# the artist rule
+_FILTERS = [
+    ('year', re.compile(r"^ (?:from|in|released in|released|of) (?P<value>\d{4})$")),
+    ('composer', re.compile(r"^ (?:composed|written) by (?P<value>.+)$")),
+    ('genre', re.compile(r"^ (?:in|of) (?:the )?(?:genre )?(?P<value>.+?)(?: genre)?$")),
+    ('artist', re.compile(r"^ (?:by|from|of) (?:the (?:artist|band) |artist |band )?(?P<value>.+)$")),
+]
+
+# Another filter inside a filter value ("by the beatles in 1969"); such
+# multi-field questions are left to the LLM
+_NESTED_FILTER = re.compile(r"\b(?:(?:in|from|of) \d{4}|by|composed|written|released)\b")
+
+class RoutedQuery:
+    """A question answered by a prebuilt parameterized query"""
+    
+    def __init__(self, intent: str, sql: str, params: Tuple, noun: str,
+                 field: Optional[str] = None, value: Any = None, verified: bool = True):
+        """
+        Initialize the routed query.
+        
+        Args:
+            intent (str): 'count', 'list' or 'filter'
+            sql (str): Parameterized SQL
+            params (Tuple): Query parameters
+            noun (str): What the question is about, as asked
+            field (str, optional): Filtered column
+            value (Any): Filter value
+            verified (bool): Whether the value is known to be in the
+                catalogue; an unverified value that matches nothing may
+                have been misread, so the LLM gets another look
+        """
+        self.intent = intent
+        self.sql = sql
+        self.params = params
+        self.noun = noun
+        self.field = field
+        self.value = value
+        self.verified = verified
+    
+    def matched_nothing(self, results: List[Dict[str, Any]]) -> bool:
+        """Whether the query found no rows (a count of zero for counts)"""
+        if self.intent == 'count':
+            return not results or not results[0]['count']
+        return not results
+    
+    def describe_filter(self) -> str:
+        """Human-readable filter, e.g. ' by Miles Davis'"""
+        if self.field is None:
+            return ''
+        if self.field == 'year':
+            return f" from {self.value}"
+        if self.field == 'genre':
+            return f" in the {self.value} genre"
+        if self.field == 'composer':
+            return f" composed by {self.value}"
+        return f" by {self.value}"
+    
+    def answer(self, results: List[Dict[str, Any]], truncated: bool, max_listed: int = 30) -> str:
+        """
+        Write the reply for the query's results without the LLM.
+        
+        Args:
+            results (List[Dict[str, Any]]): Rows the query returned
+            truncated (bool): Whether more rows were available
+            max_listed (int): Most items to spell out in the reply
+        
+        Returns:
+            str: Reply text
+        """
+        where = self.describe_filter()
+        if self.intent == 'count':
+            count = results[0]['count'] if results else 0
+            noun = self.noun.rstrip('s') if count == 1 else self.noun
+            verb = 'is' if count == 1 else 'are'
+            return f"There {verb} {count:,} {noun}{where} in the catalogue."
+        
+        if not results:
+            return f"No {self.noun}{where} found in the catalogue."
+        if self.intent == 'list':
+            column = next(iter(results[0]))
+            items = [str(row[column]) for row in results[:max_listed]]
+        else:
+            items = [
+                f"{row['album']} ({', '.join(str(row[col]) for col in ('artist', 'year') if row.get(col))})"
+                for row in results[:max_listed]
+            ]
+        more = len(results) - len(items)
+        count = f"{len(results):,}{'+' if truncated else ''}"
+        noun = self.noun.rstrip('s') if count == '1' else self.noun
+        lines = [f"Found {count} {noun}{where}:"] + [f"- {item}" for item in items]
+        if more > 0 or truncated:
+            lines.append("…and more, see the results table.")
+        return '\n'.join(lines)
+
+class IntentRouter:
+    """
+    Rule-based fast path for simple music questions.
+    
+    Count, list-distinct and single-field filter questions are matched by
+    pattern and answered with prebuilt parameterized queries, so neither
+    SQL generation nor result formatting needs the LLM. Anything else is
+    left to the LLM. The share of questions taking the fast path is
+    tracked.
+    """
+    
+    def __init__(self, catalog: MusicCatalogIndex):
+        """
+        Initialize the router.
+        
+        Args:
+            catalog (MusicCatalogIndex): Catalogue indexes; used for text
+                matches and precomputed facets when they are built
+        """
+        self.catalog = catalog
+        self.counts = {'fast_path': 0, 'fallback': 0}
+        self.by_intent = {'count': 0, 'list': 0, 'filter': 0}
+        self._lock = threading.Lock()
+    
+    def route(self, question: str) -> Optional[RoutedQuery]:
+        """
+        Match a question against the fast-path rules.
+        
+        Args:
+            question (str): Natural language question
+        
+        Returns:
+            Optional[RoutedQuery]: Query that answers it, or None if the
+            LLM is needed
+        """
+        question = normalize_question(question)
+        routed = self._route_count(question) or self._route_list(question) or self._route_filter(question)
+        with self._lock:
+            if routed is None:
+                self.counts['fallback'] += 1
+            else:
+                self.counts['fast_path'] += 1
+                self.by_intent[routed.intent] += 1
+        return routed
+    
+    def reject(self, routed: RoutedQuery):
+        """
+        Count a routed question as a fallback after all.
+        
+        Args:
+            routed (RoutedQuery): Query whose results were not trusted
+        """
+        with self._lock:
+            self.counts['fast_path'] -= 1
+            self.by_intent[routed.intent] -= 1
+            self.counts['fallback'] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get fast-path statistics.
+        
+        Returns:
+            Dict[str, Any]: Fast-path and fallback counts, per-intent counts
+            and the fraction of questions served on the fast path
+        """
+        with self._lock:
+            total = self.counts['fast_path'] + self.counts['fallback']
+            return {
+                **self.counts,
+                'fast_path_by_intent': dict(self.by_intent),
+                'fast_path_ratio': self.counts['fast_path'] / total if total else 0.0
+            }
+    
+    def _route_count(self, question: str) -> Optional[RoutedQuery]:
+        match = _COUNT.match(question)
+        if not match:
+            return None
+        condition = self._condition(match.group('genre'), match.group('filter'))
+        if condition is None:
+            return None
+        column = _NOUNS[match.group('noun')]
+        counted = 'count(*)' if column == 'album' else f'count(DISTINCT {column})'
+        where, params, field, value = condition
+        return RoutedQuery('count', f"SELECT {counted} AS count FROM music{where}", params,
+                           match.group('noun'), field, value, field not in ('artist', 'composer'))
+    
+    def _route_list(self, question: str) -> Optional[RoutedQuery]:
+        match = _LIST.match(question)
+        if not match:
+            return None
+        column = _NOUNS[match.group('noun')]
+        if self.catalog.available():
+            # Precomputed facet counts, most common first
+            sql = (f"SELECT value AS {column}, count AS albums FROM {self.catalog.FACET_TABLE} "
+                   f"WHERE facet = ? ORDER BY count DESC, value")
+            return RoutedQuery('list', sql, (column,), match.group('noun'))
+        sql = (f"SELECT DISTINCT {column} FROM music "
+               f"WHERE {column} IS NOT NULL AND {column} != '' ORDER BY {column}")
+        return RoutedQuery('list', sql, (), match.group('noun'))
+    
+    def _route_filter(self, question: str) -> Optional[RoutedQuery]:
+        match = _FILTER.match(question)
+        if not match or not (match.group('genre') or match.group('filter')):
+            return None
+        condition = self._condition(match.group('genre'), match.group('filter'))
+        if condition is None:
+            return None
+        where, params, field, value = condition
+        sql = f"SELECT album, artist, composer, year, genre FROM music{where} ORDER BY year, album"
+        return RoutedQuery('filter', sql, params, 'albums', field, value,
+                           field not in ('artist', 'composer'))
+    
+    def _condition(self, genre: Optional[str], filter_text: str) -> Optional[Tuple[str, Tuple, Optional[str], Any]]:
+        """
+        Turn an optional leading genre and a filter phrase into a WHERE clause.
+        
+        Returns:
+            Optional[Tuple]: (where clause, params, field, value), or None
+            if the question filters on more than one field or in a way
+            the rules do not cover
+        """
+        filter_text = filter_text or ''
+        if genre and filter_text:
+            return None
+        if genre:
+            # "how many jazz albums": only a genre the catalogue has, so
+            # other adjectives ("great albums") go to the LLM
+            if not self._genre_exists(genre):
+                return None
+            return " WHERE genre = ? COLLATE NOCASE", (genre,), 'genre', genre
+        if not filter_text:
+            return '', (), None, None
+        
+        for field, pattern in _FILTERS:
+            match = pattern.match(filter_text)
+            if not match:
+                continue
+            value = match.group('value').strip()
+            if field == 'year':
+                return " WHERE year = ?", (int(value),), field, value
+            if _NESTED_FILTER.search(value):
+                return None
+            if field == 'genre':
+                if not self._genre_exists(value):
+                    continue
+                return " WHERE genre = ? COLLATE NOCASE", (value,), field, value
+            # Artist and composer match words, like the LLM's LIKE filters
+            expression = match_expression(value, field)
+            if not expression:
+                return None
+            if self.catalog.available():
+                return (f" WHERE rowid IN (SELECT rowid FROM {self.catalog.FTS_TABLE} "
+                        f"WHERE {self.catalog.FTS_TABLE} MATCH ?)"), (expression,), field, value
+            return f" WHERE {field} LIKE ?", (f"%{value}%",), field, value
+        return None
+    
+    def _genre_exists(self, genre: str) -> bool:
+        try:
+            return bool(list(self.catalog.data_source.stream(
+                "SELECT 1 FROM music WHERE genre = ? COLLATE NOCASE LIMIT 1", (genre,))))
+        except sqlite3.Error:
+            return False
@@ -0,0 +1,236 @@
+# server/registry.py
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Callable, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class LocalRegistryBackend:
+    """
+    In-process registry backend.
+    
+    Used when no shared store is configured. Several GenerationRegistry
+    instances can share one backend to emulate multiple workers in tests.
+    """
+    
+    def __init__(self):
+        self._live: Dict[Tuple[str, str], str] = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+    
+    def add(self, chat_id: str, job_id: str, owner: str):
+        """Record that owner is running job_id for chat_id"""
+        with self._lock:
+            self._live[(chat_id, job_id)] = owner
+    
+    def remove(self, chat_id: str, job_id: str, owner: str):
+        """Forget a job if it is still owned by owner"""
+        with self._lock:
+            if self._live.get((chat_id, job_id)) == owner:
+                del self._live[(chat_id, job_id)]
+    
+    def live(self) -> Dict[str, str]:
+        """Get all live generations as {chat_id: owner}"""
+        with self._lock:
+            return {chat_id: owner for (chat_id, _), owner in self._live.items()}
+    
+    def publish_cancel(self, chat_id: str):
+        """Deliver a cancel request to every subscriber"""
+        for callback in list(self._subscribers):
+            callback(chat_id)
+    
+    def subscribe(self, callback: Callable[[str], None]):
+        """Register a callback for cancel requests"""
+        self._subscribers.append(callback)
+
+class RedisRegistryBackend:
+    """
+    Redis-backed registry shared by every worker.
+    
+    Live generations are stored as expiring keys, one per job, so entries
+    left behind by a crashed worker disappear on their own; cancel requests
+    are broadcast on a pub/sub channel.
+    """
+    
+    # Delete a key only if it still holds the expected owner, atomically
+    _COMPARE_AND_DELETE = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+    
+    def __init__(self, url: str, prefix: str = 'generation:', ttl: int = 3600):
+        """
+        Initialize the backend.
+        
+        Args:
+            url (str): Redis connection URL
+            prefix (str): Key prefix for live generation entries
+            ttl (int): Seconds before an entry expires if never removed
+        """
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.channel = f"{prefix}cancel"
+        self.ttl = ttl
+        self._pubsub_thread = None
+        self._compare_and_delete = self.client.register_script(self._COMPARE_AND_DELETE)
+    
+    def add(self, chat_id: str, job_id: str, owner: str):
+        """Record that owner is running job_id for chat_id"""
+        self.client.set(f"{self.prefix}live:{chat_id}:{job_id}", owner, ex=self.ttl)
+    
+    def remove(self, chat_id: str, job_id: str, owner: str):
+        """Forget a job if it is still owned by owner"""
+        self._compare_and_delete(keys=[f"{self.prefix}live:{chat_id}:{job_id}"], args=[owner])
+    
+    def live(self) -> Dict[str, str]:
+        """Get all live generations as {chat_id: owner}"""
+        live = {}
+        start = len(f"{self.prefix}live:")
+        for key in self.client.scan_iter(match=f"{self.prefix}live:*"):
+            owner = self.client.get(key)
+            if owner is not None:
+                live[key.decode()[start:].rsplit(':', 1)[0]] = owner.decode()
+        return live
+    
+    def publish_cancel(self, chat_id: str):
+        """Broadcast a cancel request to every worker"""
+        self.client.publish(self.channel, chat_id)
+    
+    def subscribe(self, callback: Callable[[str], None]):
+        """Listen for cancel requests on a background thread"""
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{
+            self.channel: lambda message: callback(message['data'].decode())
+        })
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+
+def create_registry_backend(url: Optional[str] = None):
+    """
+    Create the registry backend for a configured URL.
+    
+    Args:
+        url (str, optional): Redis URL; None selects the in-process backend
+    
+    Returns:
+        Backend instance
+    """
+    if url:
+        return RedisRegistryBackend(url)
+    return LocalRegistryBackend()
+
+class GenerationRegistry:
+    """
+    Tracks which worker owns each in-flight generation.
+    
+    Each worker registers its running generations with a cancel callback.
+    A chat can have several generations in flight, each registered under
+    its own job ID, and a stop request cancels all of them. A stop request handled by any worker reaches the owner through the
+    shared backend, and the owner's callback aborts the generation, closing
+    the upstream LM Studio stream.
+    """
+    
+    def __init__(self, backend=None, instance_id: str = None,
+                 on_cancel: Callable[[str], None] = None):
+        """
+        Initialize the registry.
+        
+        Args:
+            backend: Shared backend; defaults to LocalRegistryBackend
+            instance_id (str, optional): Unique name of this worker
+            on_cancel (Callable, optional): Called with every chat_id this
+                worker is asked to cancel, e.g. to drop queued requests
+        """
+        self.backend = backend or LocalRegistryBackend()
+        self.instance_id = instance_id or (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.on_cancel = on_cancel
+        # chat_id -> {job_id: cancel}
+        self._local: Dict[str, Dict[str, Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+        self.backend.subscribe(self._handle_cancel)
+    
+    def register(self, chat_id, cancel: Callable[[], None]) -> str:
+        """
+        Register a generation running on this worker.
+        
+        Args:
+            chat_id: ID of the chat being generated into
+            cancel (Callable): Aborts the generation; must be thread-safe
+        
+        Returns:
+            str: Job ID to pass to unregister
+        """
+        chat_id = str(chat_id)
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._local.setdefault(chat_id, {})[job_id] = cancel
+        self.backend.add(chat_id, job_id, self.instance_id)
+        return job_id
+    
+    def unregister(self, chat_id, job_id: str):
+        """
+        Remove a finished generation.
+        
+        Args:
+            chat_id: ID of the chat
+            job_id (str): ID returned by register
+        """
+        chat_id = str(chat_id)
+        with self._lock:
+            jobs = self._local.get(chat_id, {})
+            jobs.pop(job_id, None)
+            if not jobs:
+                self._local.pop(chat_id, None)
+        self.backend.remove(chat_id, job_id, self.instance_id)
+    
+    def cancel(self, chat_id):
+        """
+        Cancel a generation wherever it is running.
+        
+        Generations owned by this worker are cancelled directly; otherwise
+        the request is broadcast to the other workers.
+        
+        Args:
+            chat_id: ID of the chat whose generation should stop
+        """
+        chat_id = str(chat_id)
+        if not self._cancel_local(chat_id):
+            self.backend.publish_cancel(chat_id)
+    
+    def is_active(self, chat_id) -> bool:
+        """Whether this worker is generating for chat_id"""
+        return str(chat_id) in self._local
+    
+    def local_generations(self) -> Set[str]:
+        """Chat IDs with a generation running on this worker"""
+        with self._lock:
+            return set(self._local)
+    
+    def live(self) -> Dict[str, str]:
+        """All live generations across workers as {chat_id: instance_id}"""
+        return self.backend.live()
+    
+    def _cancel_local(self, chat_id: str) -> bool:
+        """Cancel a generation owned by this worker, if any"""
+        if self.on_cancel:
+            self.on_cancel(chat_id)
+        with self._lock:
+            cancels = list(self._local.get(chat_id, {}).values())
+        if not cancels:
+            return False
+        logger.debug("Cancelling %d generation(s) for chat %s", len(cancels), chat_id)
+        for cancel in cancels:
+            cancel()
+        return True
+    
+    def _handle_cancel(self, chat_id: str):
+        """Handle a broadcast cancel request"""
+        self._cancel_local(chat_id)
@@ -0,0 +1,290 @@
+# server/scheduler.py
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Coroutine, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when the generation queue cannot accept more work"""
+    pass
+
+class GenerationJob:
+    """A queued generation request"""
+    
+    def __init__(self, user_id, chat_id, coro_factory: Callable[[], Coroutine],
+                 lane: str = 'chat'):
+        """
+        Initialize a job.
+        
+        Args:
+            user_id: ID of the user that owns the job
+            chat_id: ID of the chat the job generates into
+            coro_factory (Callable): Called with no arguments to create the
+                coroutine once the job is admitted
+            lane (str): Kind of work, each with its own concurrency cap
+        """
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.coro_factory = coro_factory
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+    
+    @property
+    def wait_time(self) -> Optional[float]:
+        """Seconds spent queued before starting, None while still queued"""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.enqueued_at
+
+class GenerationScheduler:
+    """
+    Admits generation jobs under a global cap and per-lane caps.
+    
+    Waiting jobs are kept in one FIFO per user and dispatched round-robin
+    across users, so a burst from one user cannot starve the others. The
+    global cap bounds the generations sent to LM Studio at once; a lane
+    (e.g. 'chat' or 'music') can also have a lower cap of its own, so long
+    chat generations cannot take every slot from quick music lookups. The
+    scheduler is not thread-safe: all methods must be called on the event
+    loop that runs the jobs, except stats(), queue_depth and running,
+    which read a snapshot published after every change.
+    """
+    
+    def __init__(self, max_concurrent: int = 4, max_queue_size: int = 100,
+                 max_queue_per_user: int = 10,
+                 on_position: Callable[[GenerationJob, int], None] = None,
+                 lane_limits: Dict[str, int] = None):
+        """
+        Initialize the scheduler.
+        
+        Args:
+            max_concurrent (int): Maximum number of jobs running at once
+                across all lanes
+            max_queue_size (int): Maximum number of jobs waiting in total
+            max_queue_per_user (int): Maximum number of jobs one user may
+                have waiting
+            on_position (Callable, optional): Called with (job, position)
+                whenever a job's place in line changes; position 0 means the
+                job has started
+            lane_limits (Dict[str, int], optional): Maximum number of jobs
+                running at once per lane, within max_concurrent
+        """
+        self.max_concurrent = max_concurrent
+        self.lane_limits = lane_limits or {}
+        self.max_queue_size = max_queue_size
+        self.max_queue_per_user = max_queue_per_user
+        self.on_position = on_position
+        self._queues: "OrderedDict[Any, deque]" = OrderedDict()
+        self._running = set()
+        self._wait_times = deque(maxlen=1000)
+        self.started = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock()
+        self._published: Dict[str, Any] = {}
+        self._publish()
+    
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to start"""
+        with self._stats_lock:
+            return self._published['queue_depth']
+    
+    @property
+    def running(self) -> int:
+        """Number of jobs currently running"""
+        with self._stats_lock:
+            return self._published['running']
+    
+    def submit(self, user_id, chat_id, coro_factory: Callable[[], Coroutine],
+               lane: str = 'chat') -> GenerationJob:
+        """
+        Queue a job and start it immediately if there is capacity.
+        
+        Args:
+            user_id: ID of the user that owns the job
+            chat_id: ID of the chat the job generates into
+            coro_factory (Callable): Creates the job's coroutine
+            lane (str): Lane whose concurrency cap the job counts against
+        
+        Returns:
+            GenerationJob: The queued (or already started) job
+        
+        Raises:
+            QueueFullError: If the global or per-user queue is full
+        """
+        user_queue = self._queues.get(user_id)
+        if self._queue_depth() >= self.max_queue_size:
+            self.rejected += 1
+            self._publish()
+            raise QueueFullError("Server is busy, please try again shortly")
+        if user_queue is not None and len(user_queue) >= self.max_queue_per_user:
+            self.rejected += 1
+            self._publish()
+            raise QueueFullError("Too many pending requests, please wait for them to finish")
+        
+        job = GenerationJob(user_id, chat_id, coro_factory, lane)
+        self._queues.setdefault(user_id, deque()).append(job)
+        # Publishes the new queue depth even when nothing can start
+        self._dispatch()
+        if job.started_at is None:
+            self._notify_positions()
+        return job
+    
+    def cancel(self, chat_id) -> int:
+        """
+        Drop queued (not yet started) jobs for a chat.
+        
+        Args:
+            chat_id: ID of the chat whose queued jobs should be dropped
+        
+        Returns:
+            int: Number of jobs removed
+        """
+        removed = 0
+        for user_id in list(self._queues):
+            queue = self._queues[user_id]
+            kept = deque(job for job in queue if str(job.chat_id) != str(chat_id))
+            removed += len(queue) - len(kept)
+            if kept:
+                self._queues[user_id] = kept
+            else:
+                del self._queues[user_id]
+        if removed:
+            self._publish()
+            self._notify_positions()
+        return removed
+    
+    def positions(self) -> List[Tuple[GenerationJob, int]]:
+        """
+        Compute the order waiting jobs will start in.
+        
+        Returns:
+            List[Tuple[GenerationJob, int]]: (job, 1-based position within
+            its lane) pairs following the round-robin dispatch order
+        """
+        queues = [list(queue) for queue in self._queues.values()]
+        order = []
+        depth = 0
+        while True:
+            for queue in queues:
+                if depth < len(queue):
+                    order.append(queue[depth])
+            depth += 1
+            if all(depth >= len(queue) for queue in queues):
+                break
+        positions = []
+        ahead: Dict[str, int] = {}
+        for job in order:
+            ahead[job.lane] = ahead.get(job.lane, 0) + 1
+            positions.append((job, ahead[job.lane]))
+        return positions
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue statistics; safe to call from any thread.
+        
+        Returns:
+            Dict[str, Any]: Queue depth, running count, counters and wait
+            times (in seconds) over the most recent jobs
+        """
+        with self._stats_lock:
+            stats = dict(self._published)
+        stats['lanes'] = {lane: dict(counts) for lane, counts in stats['lanes'].items()}
+        return stats
+    
+    def _publish(self):
+        """Snapshot the statistics for other threads; runs on the loop"""
+        waits = list(self._wait_times)
+        lanes = {lane: 0 for lane in self.lane_limits}
+        for job in self._running:
+            lanes[job.lane] = lanes.get(job.lane, 0) + 1
+        snapshot = {
+            'queue_depth': self._queue_depth(),
+            'running': len(self._running),
+            'max_concurrent': self.max_concurrent,
+            'max_queue_size': self.max_queue_size,
+            'started': self.started,
+            'rejected': self.rejected,
+            'avg_wait_seconds': sum(waits) / len(waits) if waits else 0.0,
+            'max_wait_seconds': max(waits) if waits else 0.0,
+            'lanes': {
+                lane: {'running': running, 'limit': self._lane_limit(lane)}
+                for lane, running in lanes.items()
+            },
+        }
+        with self._stats_lock:
+            self._published = snapshot
+    
+    def _queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+    
+    def _lane_limit(self, lane: str) -> int:
+        return min(self.lane_limits.get(lane, self.max_concurrent), self.max_concurrent)
+    
+    def _running_in(self, lane: str) -> int:
+        return sum(1 for job in self._running if job.lane == lane)
+    
+    def _next_job(self) -> Optional[GenerationJob]:
+        """
+        Pop the next job whose lane has capacity, rotating the served user
+        to the back; None if the global cap is reached or every waiting
+        job's lane is full.
+        """
+        if len(self._running) >= self.max_concurrent:
+            return None
+        for user_id, queue in self._queues.items():
+            if self._running_in(queue[0].lane) >= self._lane_limit(queue[0].lane):
+                continue
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            return job
+        return None
+    
+    def _dispatch(self):
+        """Start queued jobs while there is capacity"""
+        started = False
+        while self._queues:
+            job = self._next_job()
+            if job is None:
+                break
+            job.started_at = time.monotonic()
+            self._wait_times.append(job.wait_time)
+            self._running.add(job)
+            self.started += 1
+            started = True
+            self._publish()
+            logger.debug("Starting generation for chat %s after %.3fs queued",
+                         job.chat_id, job.wait_time)
+            if self.on_position:
+                self.on_position(job, 0)
+            asyncio.ensure_future(self._run(job))
+        if not started:
+            self._publish()
+        if started and self._queues:
+            self._notify_positions()
+    
+    async def _run(self, job: GenerationJob):
+        """Run a job and hand its slot to the next one"""
+        try:
+            await job.coro_factory()
+        except Exception:
+            logger.exception("Generation job for chat %s failed", job.chat_id)
+        finally:
+            self._running.discard(job)
+            self._dispatch()
+    
+    def _notify_positions(self):
+        """Report the current place in line of every waiting job"""
+        if not self.on_position:
+            return
+        for job, position in self.positions():
+            self.on_position(job, position)
@@ -0,0 +1,296 @@
+# server/search.py
+
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from config.settings import Config
+from .database import db, Chat, Message
+
+# Markers around matched terms in snippets; clients turn them into
+# highlights, so message text never has to be rendered as HTML
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+def build_match_query(query: str, user_id: int) -> str:
+    """
+    Build an FTS5 MATCH expression for a user's search text.
+    
+    The text is split into words, each quoted so FTS5 operators in user
+    input are treated as plain words; all words must match, and the last
+    one matches as a prefix so results appear while typing. The owner
+    term restricts matches to the user's own messages inside the index.
+    
+    Args:
+        query (str): Search text as typed
+        user_id (int): ID of the searching user
+    
+    Returns:
+        str: MATCH expression, or '' if the text has no words
+    """
+    words = _TOKEN.findall(query.lower())
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return f"owner:u{user_id} AND content:({' '.join(terms)})"
+
+class SearchIndex:
+    """
+    FTS5 index over message content.
+    
+    Message IDs are marked as they are written and indexed in batches, so
+    a burst of writes costs one index transaction rather than one per
+    write. Streamed replies are marked once when they complete, not on
+    every persisted chunk. Searches flush pending writes first, so a user
+    always finds their own latest messages.
+    """
+    
+    TABLE = 'message_fts'
+    
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0):
+        """
+        Initialize the index.
+        
+        Args:
+            batch_size (int): Pending messages that trigger a flush
+            flush_interval (float): Seconds after which pending messages
+                are flushed by the next write
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+    
+    # FTS5 support per database URL, probed once
+    _fts5 = {}
+    
+    @classmethod
+    def available(cls, bind) -> bool:
+        """
+        Whether the database supports the index.
+        
+        Only SQLite builds compiled with FTS5 do; the check runs once per
+        database and is cached.
+        
+        Args:
+            bind: Engine or Connection to check
+        
+        Returns:
+            bool: True if FTS5 tables can be used
+        """
+        if bind.dialect.name != 'sqlite':
+            return False
+        key = str(bind.engine.url)
+        if key not in cls._fts5:
+            cls._fts5[key] = cls._probe_fts5(bind)
+        return cls._fts5[key]
+    
+    @staticmethod
+    def _probe_fts5(bind) -> bool:
+        """Ask SQLite whether it was compiled with FTS5"""
+        query = text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        try:
+            if isinstance(bind, Engine):
+                with bind.connect() as conn:
+                    return bool(conn.execute(query).scalar())
+            return bool(bind.execute(query).scalar())
+        except Exception:
+            return False
+    
+    @classmethod
+    def create_table(cls, conn):
+        """Create the FTS5 table and index every existing message"""
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls.TABLE} "
+            "USING fts5(content, owner, chat_id UNINDEXED)"
+        ))
+        cls.rebuild(conn)
+    
+    @classmethod
+    def rebuild(cls, conn):
+        """Reindex all messages from scratch"""
+        conn.execute(text(f"DELETE FROM {cls.TABLE}"))
+        conn.execute(text(
+            f"INSERT INTO {cls.TABLE} (rowid, content, owner, chat_id) "
+            "SELECT message.id, message.content, 'u' || chat.user_id, message.chat_id "
+            "FROM message JOIN chat ON chat.id = message.chat_id "
+            "WHERE message.content != ''"
+        ))
+    
+    @property
+    def pending(self) -> int:
+        """Number of messages waiting to be indexed"""
+        return len(self._pending)
+    
+    def mark(self, message_id: int):
+        """
+        Queue a message for indexing, flushing if a batch is due.
+        
+        Args:
+            message_id (int): ID of a new or changed message
+        """
+        with self._lock:
+            self._pending.add(message_id)
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+    
+    def flush(self) -> int:
+        """
+        Index all pending messages in one transaction.
+        
+        Returns:
+            int: Number of messages reindexed
+        """
+        with self._lock:
+            ids, self._pending = list(self._pending), set()
+            self._last_flush = time.monotonic()
+        if not ids or not self.available(db.engine):
+            return 0
+        try:
+            for start in range(0, len(ids), 500):
+                self._reindex(ids[start:start + 500])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                self._pending.update(ids)
+            raise
+        return len(ids)
+    
+    def _reindex(self, ids: List[int]):
+        """Replace the index rows for a chunk of message IDs"""
+        params = {'ids': ids}
+        db.session.execute(
+            text(f"DELETE FROM {self.TABLE} WHERE rowid IN :ids")
+            .bindparams(bindparam('ids', expanding=True)), params)
+        db.session.execute(
+            text(f"INSERT INTO {self.TABLE} (rowid, content, owner, chat_id) "
+                 "SELECT message.id, message.content, 'u' || chat.user_id, message.chat_id "
+                 "FROM message JOIN chat ON chat.id = message.chat_id "
+                 "WHERE message.id IN :ids AND message.content != ''")
+            .bindparams(bindparam('ids', expanding=True)), params)
+    
+    def remove(self, message_ids: Iterable[int]):
+        """
+        Drop messages from the index in the current transaction.
+        
+        Args:
+            message_ids (Iterable[int]): IDs of messages being deleted
+        """
+        ids = list(message_ids)
+        with self._lock:
+            self._pending.difference_update(ids)
+        if not ids or not self.available(db.engine):
+            return
+        for start in range(0, len(ids), 500):
+            db.session.execute(
+                text(f"DELETE FROM {self.TABLE} WHERE rowid IN :ids")
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': ids[start:start + 500]})
+    
+    def search(self, user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Search a user's messages, best matches first.
+        
+        Args:
+            user_id (int): ID of the searching user
+            query (str): Search text
+            limit (int): Maximum number of results
+        
+        Returns:
+            List[Dict[str, Any]]: Matches with message and chat IDs, chat
+            title, author, timestamp and a highlighted snippet
+        
+        Databases without FTS5 are searched with LIKE instead, newest
+        matches first.
+        """
+        if not self.available(db.engine):
+            return self._search_like(user_id, query, limit)
+        match = build_match_query(query, user_id)
+        if not match:
+            return []
+        if self._pending:
+            self.flush()
+        
+        rows = db.session.execute(text(
+            f"SELECT message.id, message.chat_id, message.is_user, message.timestamp, "
+            f"chat.title, snippet({self.TABLE}, 0, :start, :end, '…', 16) AS snippet "
+            f"FROM {self.TABLE} "
+            f"JOIN message ON message.id = {self.TABLE}.rowid "
+            f"JOIN chat ON chat.id = message.chat_id "
+            f"WHERE {self.TABLE} MATCH :match AND chat.user_id = :user_id "
+            f"ORDER BY {self.TABLE}.rank LIMIT :limit"
+        ).columns(timestamp=db.DateTime), {
+            'start': HIGHLIGHT_START, 'end': HIGHLIGHT_END,
+            'match': match, 'user_id': user_id, 'limit': limit
+        })
+        return [
+            {
+                'message_id': row.id,
+                'chat_id': row.chat_id,
+                'chat_title': row.title,
+                'is_user': bool(row.is_user),
+                'timestamp': row.timestamp,
+                'snippet': row.snippet
+            }
+            for row in rows
+        ]
+    
+    def _search_like(self, user_id: int, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Unindexed search: every word must appear, newest messages first"""
+        words = _TOKEN.findall(query.lower())
+        if not words:
+            return []
+        messages = Message.query.join(Chat).filter(Chat.user_id == user_id)
+        for word in words:
+            messages = messages.filter(Message.content.ilike(f'%{word}%'))
+        rows = (messages.with_entities(Message.id, Message.chat_id, Message.is_user,
+                                       Message.timestamp, Chat.title, Message.content)
+                .order_by(Message.timestamp.desc(), Message.id.desc())
+                .limit(limit))
+        return [
+            {
+                'message_id': row.id,
+                'chat_id': row.chat_id,
+                'chat_title': row.title,
+                'is_user': bool(row.is_user),
+                'timestamp': row.timestamp,
+                'snippet': _highlight(row.content, words)
+            }
+            for row in rows
+        ]
+
+def _highlight(content: str, words: List[str], width: int = 80) -> str:
+    """
+    Build a snippet around the first matched word, marking every match.
+    
+    Args:
+        content (str): Message text
+        words (List[str]): Lowercase search words
+        width (int): Approximate snippet length in characters
+    
+    Returns:
+        str: Snippet with matches between the highlight markers
+    """
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.IGNORECASE)
+    first = pattern.search(content)
+    start = max(0, first.start() - width // 4) if first else 0
+    snippet = content[start:start + width]
+    snippet = pattern.sub(lambda m: f'{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}', snippet)
+    if start > 0:
+        snippet = '…' + snippet
+    if start + width < len(content):
+        snippet += '…'
+    return snippet
+
+search_index = SearchIndex(
+    batch_size=Config.SEARCH_INDEX_BATCH_SIZE,
+    flush_interval=Config.SEARCH_INDEX_FLUSH_INTERVAL
+)
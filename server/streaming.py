@@ -0,0 +1,206 @@
+# server/streaming.py
+
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+class MessageBuffer:
+    """
+    Accumulates a streamed message and persists it in batches.
+    
+    Chunks are kept in a list and joined only when written, and writes happen
+    when enough time has passed or enough text is pending rather than once
+    per chunk. The time threshold bounds how much of a reply can be lost if
+    the process dies mid-stream.
+    """
+    
+    def __init__(self, message_id: int, writer: Callable[[int, str], None],
+                 flush_interval: float = 1.0, flush_chars: int = 2048):
+        """
+        Initialize the buffer.
+        
+        Args:
+            message_id (int): ID of the message being streamed into
+            writer (Callable): Called with (message_id, full_text) to persist
+            flush_interval (float): Maximum seconds between writes while
+                chunks are arriving
+            flush_chars (int): Pending characters that trigger an early write
+        """
+        self.message_id = message_id
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.flush_count = 0
+        self._chunks: List[str] = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+    
+    @property
+    def text(self) -> str:
+        """Full text received so far"""
+        return ''.join(self._chunks)
+    
+    @property
+    def dirty(self) -> bool:
+        """Whether there is text that has not been written yet"""
+        return self._pending_chars > 0
+    
+    def append(self, chunk: str):
+        """
+        Add a chunk, writing the message if a threshold is reached.
+        
+        Args:
+            chunk (str): Text chunk to append
+        """
+        self._chunks.append(chunk)
+        self._pending_chars += len(chunk)
+        
+        if (self._pending_chars >= self.flush_chars or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+    
+    def flush(self, force: bool = False):
+        """
+        Write the accumulated text if anything is pending.
+        
+        Args:
+            force (bool): Write even when nothing new arrived
+        """
+        if not self.dirty and not force:
+            return
+        self.writer(self.message_id, self.text)
+        self.flush_count += 1
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+
+class BackgroundWriter:
+    """
+    Runs a message's writes off the event loop, one at a time, in order.
+    
+    Each write carries the full text, so when writes pile up behind a slow
+    one only the newest is kept. Call wait() at the end of the stream to
+    finish the last write and surface any error.
+    """
+    
+    def __init__(self, write: Callable[[int, str], Awaitable]):
+        """
+        Initialize the writer.
+        
+        Args:
+            write (Callable): Coroutine function called with
+                (message_id, full_text) to persist
+        """
+        self.write = write
+        self.writes = 0
+        self._latest: Optional[Tuple[int, str]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+    
+    def __call__(self, message_id: int, text: str):
+        """
+        Queue a write; usable as a MessageBuffer writer.
+        
+        Args:
+            message_id (int): ID of the message
+            text (str): Full text to store
+        """
+        self._latest = (message_id, text)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+    
+    async def _drain(self):
+        while self._latest is not None:
+            args, self._latest = self._latest, None
+            try:
+                await self.write(*args)
+                self.writes += 1
+            except Exception as e:
+                self._error = e
+    
+    async def wait(self):
+        """
+        Wait for queued writes to finish.
+        
+        Raises:
+            Exception: The last error a write raised
+        """
+        if self._task is not None:
+            await asyncio.shield(self._task)
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+class ChunkCoalescer:
+    """
+    Groups streamed text deltas into fewer, larger Socket.IO frames.
+    
+    The first delta is sent immediately so time-to-first-token is unchanged.
+    After that, deltas are held until the time window elapses or the pending
+    size reaches the byte limit, whichever comes first. When used inside a
+    running event loop a timer flushes the window even if the stream stalls;
+    otherwise the window is checked as deltas arrive.
+    """
+    
+    def __init__(self, send: Callable[[str], None], window: float = 0.04,
+                 max_bytes: int = 1024):
+        """
+        Initialize the coalescer.
+        
+        Args:
+            send (Callable): Called with the coalesced text of each frame
+            window (float): Seconds to hold deltas before sending; 0 sends
+                every delta as its own frame
+            max_bytes (int): Pending UTF-8 size that forces an early send
+        """
+        self.send = send
+        self.window = window
+        self.max_bytes = max_bytes
+        self.chunks_in = 0
+        self.frames_out = 0
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._window_start = None
+        self._timer = None
+    
+    def append(self, chunk: str):
+        """
+        Add a delta, sending a frame if a threshold is reached.
+        
+        Args:
+            chunk (str): Text delta to send
+        """
+        self.chunks_in += 1
+        self._pending.append(chunk)
+        self._pending_bytes += len(chunk.encode('utf-8'))
+        
+        if self.frames_out == 0 or self.window <= 0 or self._pending_bytes >= self.max_bytes:
+            self.flush()
+            return
+        
+        if self._window_start is None:
+            self._window_start = time.monotonic()
+            self._schedule_flush()
+        elif self._timer is None and time.monotonic() - self._window_start >= self.window:
+            self.flush()
+    
+    def flush(self):
+        """Send any pending deltas as one frame"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._window_start = None
+        if not self._pending:
+            return
+        text = ''.join(self._pending)
+        self._pending = []
+        self._pending_bytes = 0
+        self.frames_out += 1
+        self.send(text)
+    
+    def _schedule_flush(self):
+        """Arm a timer that closes the current window on the running loop"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._timer = loop.call_later(self.window, self.flush)
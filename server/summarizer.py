@@ -0,0 +1,184 @@
+# server/summarizer.py
+
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional, Tuple
+from .database import db, ChatSummary, Message
+from .llm import LMStudioClient
+
+logger = logging.getLogger(__name__)
+
+class ConversationSummarizer:
+    """
+    Folds a chat's older messages into a stored rolling summary.
+    
+    Each run sends the previous summary plus only the messages added since
+    it was written, so a summary is extended incrementally and never
+    recomputed from the whole history. The newest keep_recent messages are
+    never folded; they are sent verbatim and may still be streaming.
+    """
+    
+    def __init__(self, llm_client: LMStudioClient = None, threshold: int = 30,
+                 keep_recent: int = 10, batch_size: int = 50, max_tokens: int = 300):
+        """
+        Initialize the summarizer.
+        
+        Args:
+            llm_client (LMStudioClient, optional): Client used to summarize
+            threshold (int): Unsummarized messages, beyond keep_recent, that
+                trigger a fold
+            keep_recent (int): Newest messages left out of the summary
+            batch_size (int): Maximum messages folded per LLM call
+            max_tokens (int): Length limit for the summary
+        """
+        self.llm_client = llm_client or LMStudioClient()
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+    
+    def get_summary(self, chat_id: int) -> Optional[Tuple[str, int]]:
+        """
+        Get a chat's stored summary.
+        
+        Args:
+            chat_id (int): ID of the chat
+            
+        Returns:
+            Optional[Tuple[str, int]]: Summary text and the ID of the newest
+            message it covers, or None if the chat has no summary yet
+        """
+        summary = ChatSummary.query.get(chat_id)
+        if summary is None or not summary.content:
+            return None
+        return summary.content, summary.through_message_id
+    
+    def _foldable(self, chat_id: int, through_id: int):
+        """Query for messages past the summary, oldest first"""
+        return (Message.query
+                .filter(Message.chat_id == chat_id, Message.id > through_id)
+                .order_by(Message.timestamp, Message.id))
+    
+    def needs_summary(self, chat_id: int) -> bool:
+        """Whether enough messages have accumulated to fold"""
+        summary = ChatSummary.query.get(chat_id)
+        through_id = summary.through_message_id if summary else 0
+        pending = self._foldable(chat_id, through_id).count()
+        return pending - self.keep_recent >= self.threshold
+    
+    def summarize(self, chat_id: int) -> bool:
+        """
+        Fold the next batch of older messages into the chat's summary.
+        
+        Args:
+            chat_id (int): ID of the chat
+            
+        Returns:
+            bool: Whether the summary was updated
+        """
+        summary = ChatSummary.query.get(chat_id)
+        through_id = summary.through_message_id if summary else 0
+        
+        pending = self._foldable(chat_id, through_id).all()
+        batch = pending[:max(0, len(pending) - self.keep_recent)][:self.batch_size]
+        batch = [message for message in batch if message.content]
+        if not batch:
+            return False
+        
+        transcript = '\n'.join(
+            f"{'User' if message.is_user else 'Assistant'}: {message.content}"
+            for message in batch
+        )
+        previous = summary.content if summary else ''
+        prompt = f"""
+        Summary of the conversation so far:
+        {previous or '(none yet)'}
+        
+        New messages:
+        {transcript}
+        
+        Rewrite the summary so it also covers the new messages. Keep names,
+        facts, decisions and open questions. Respond with the summary only.
+        """
+        content = self.llm_client.generate(
+            prompt, task='summary', temperature=0, max_tokens=self.max_tokens)
+        if not content:
+            return False
+        
+        if summary is None:
+            summary = ChatSummary(chat_id=chat_id)
+            db.session.add(summary)
+        summary.content = content.strip()
+        summary.through_message_id = batch[-1].id
+        db.session.commit()
+        logger.debug("Folded %d messages into summary for chat %s", len(batch), chat_id)
+        return True
+
+class SummaryWorker:
+    """
+    Background thread that keeps chat summaries up to date.
+    
+    Requests are de-duplicated and processed one at a time, and only while
+    is_idle reports spare capacity, so summarization never competes with
+    live generations for the model.
+    """
+    
+    def __init__(self, app, summarizer: ConversationSummarizer,
+                 is_idle: Callable[[], bool] = None, poll_interval: float = 0.5):
+        """
+        Initialize the worker.
+        
+        Args:
+            app: Flask application, for database access
+            summarizer (ConversationSummarizer): Does the summarizing
+            is_idle (Callable, optional): Returns True when the model has
+                capacity to spare
+            poll_interval (float): Seconds to wait while the model is busy
+        """
+        self.app = app
+        self.summarizer = summarizer
+        self.is_idle = is_idle or (lambda: True)
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def request(self, chat_id: int):
+        """
+        Ask for a chat's summary to be brought up to date. Never blocks.
+        
+        Args:
+            chat_id (int): ID of the chat
+        """
+        with self._lock:
+            if chat_id in self._pending:
+                return
+            self._pending.add(chat_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='summary-worker', daemon=True)
+                self._thread.start()
+        self._queue.put(chat_id)
+    
+    def _run(self):
+        """Worker thread body"""
+        with self.app.app_context():
+            while True:
+                chat_id = self._queue.get()
+                while not self.is_idle():
+                    time.sleep(self.poll_interval)
+                with self._lock:
+                    self._pending.discard(chat_id)
+                try:
+                    if self.summarizer.needs_summary(chat_id) and self.summarizer.summarize(chat_id):
+                        # Fold the rest on a later pass, behind other chats
+                        if self.summarizer.needs_summary(chat_id):
+                            self.request(chat_id)
+                except Exception:
+                    logger.exception("Summarizing chat %s failed", chat_id)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
@@ -0,0 +1,677 @@
+# server/tracing.py
+
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+import click
+import requests
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+class SpanContext(NamedTuple):
+    """Identity of a span, as carried across process boundaries"""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+    
+    @classmethod
+    def from_traceparent(cls, header: Optional[str]) -> Optional['SpanContext']:
+        """
+        Parse a W3C traceparent header.
+        
+        Args:
+            header (str): Header value, e.g. '00-<trace id>-<span id>-01'
+        
+        Returns:
+            Optional[SpanContext]: Remote parent, or None if the header is
+            missing or malformed
+        """
+        match = _TRACEPARENT.match((header or '').strip().lower())
+        if match is None:
+            return None
+        trace_id, span_id, flags = match.groups()
+        return cls(trace_id, span_id, bool(int(flags, 16) & 1))
+    
+    def traceparent(self) -> str:
+        """Format as a W3C traceparent header"""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+class Span:
+    """
+    A timed operation within a trace.
+    
+    Spans are created by a Tracer and exported when ended. Use one as a
+    context manager to end it on exit; an exception escaping the block
+    marks the span as failed.
+    """
+    
+    is_recording = True
+    
+    def __init__(self, tracer: 'Tracer', name: str, context: SpanContext,
+                 parent_id: Optional[str] = None, attributes: Dict[str, Any] = None,
+                 start_time: int = None):
+        """
+        Initialize a span; use Tracer.start_span instead.
+        
+        Args:
+            tracer (Tracer): Tracer that exports the span
+            name (str): Operation name
+            context (SpanContext): Trace and span IDs
+            parent_id (str, optional): Parent span ID; None for a root span
+            attributes (Dict[str, Any], optional): Initial attributes
+            start_time (int, optional): Start in ns since the epoch
+        """
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.events: List[Dict[str, Any]] = []
+        self.status = 'ok'
+        self.start_time = start_time or time.time_ns()
+        self.end_time: Optional[int] = None
+    
+    def set_attribute(self, key: str, value: Any):
+        """Set one attribute"""
+        self.attributes[key] = value
+    
+    def set_attributes(self, attributes: Dict[str, Any]):
+        """Set several attributes"""
+        self.attributes.update(attributes)
+    
+    def add_event(self, name: str, attributes: Dict[str, Any] = None):
+        """Record a point in time within the span, e.g. the first token"""
+        self.events.append({'name': name, 'time': time.time_ns(), 'attributes': attributes or {}})
+    
+    def record_exception(self, error: BaseException):
+        """Mark the span as failed by an exception"""
+        self.status = 'error'
+        self.add_event('exception', {'type': type(error).__name__, 'message': str(error)})
+    
+    def headers(self) -> Dict[str, str]:
+        """Headers that make an outgoing HTTP request a child of this span"""
+        return {'traceparent': self.context.traceparent()}
+    
+    def end(self, end_time: int = None):
+        """End the span and queue it for export; later calls are ignored"""
+        if self.end_time is not None:
+            return
+        self.end_time = end_time or time.time_ns()
+        self.tracer._export(self)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+            # Stopped by the caller, e.g. a closed stream; not a failure
+            self.set_attribute('cancelled', True)
+        elif exc is not None:
+            self.record_exception(exc)
+        self.end()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        self.__exit__(exc_type, exc, tb)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Get the span as a JSON-serializable dict.
+        
+        Returns:
+            Dict[str, Any]: IDs, name, times in ns, duration in ms,
+            status, attributes and events
+        """
+        return {
+            'trace_id': self.context.trace_id,
+            'span_id': self.context.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration_ms': round((self.end_time - self.start_time) / 1e6, 3),
+            'status': self.status,
+            'attributes': self.attributes,
+            'events': self.events,
+        }
+
+class _NonRecordingSpan:
+    """
+    Stand-in for a span that was not sampled.
+    
+    It is still made current, so the operations under it are not sampled
+    again as new traces; every method is a no-op.
+    """
+    
+    is_recording = False
+    context = None
+    
+    def set_attribute(self, key, value):
+        pass
+    
+    def set_attributes(self, attributes):
+        pass
+    
+    def add_event(self, name, attributes=None):
+        pass
+    
+    def record_exception(self, error):
+        pass
+    
+    def headers(self):
+        return None
+    
+    def end(self, end_time=None):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        pass
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+AnySpan = Union[Span, _NonRecordingSpan]
+
+_current_span: contextvars.ContextVar[Optional[AnySpan]] = contextvars.ContextVar(
+    'current_span', default=None)
+
+def current_span() -> Optional[AnySpan]:
+    """The span active in this context, or None outside any trace"""
+    return _current_span.get()
+
+def propagate(function: Callable) -> Callable:
+    """
+    Bind a function to the current context, including the active span.
+    
+    Executors and other threads do not inherit context variables; wrap
+    the function handed to them so its spans join the caller's trace.
+    
+    Args:
+        function (Callable): Function to run later, possibly on another
+            thread
+    
+    Returns:
+        Callable: Function that runs in a copy of the current context
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(function, *args, **kwargs)
+
+class JsonLinesExporter:
+    """Appends finished spans to a local file, one JSON object per line"""
+    
+    def __init__(self, path: str):
+        """
+        Initialize the exporter.
+        
+        Args:
+            path (str): File to append spans to
+        """
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def export(self, spans: List[Span]):
+        """Write a batch of spans"""
+        lines = ''.join(json.dumps(span.to_dict(), default=str) + '\n' for span in spans)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items()]
+
+class OTLPExporter:
+    """
+    Sends finished spans to an OpenTelemetry collector.
+    
+    Spans are posted as OTLP/HTTP JSON, so any OTLP-compatible endpoint
+    works: the OpenTelemetry Collector, Jaeger or Tempo on port 4318, or
+    the stand-in from 'flask trace collect'.
+    """
+    
+    def __init__(self, endpoint: str, service_name: str = 'lmstudio-web-wrapper',
+                 timeout: float = 5):
+        """
+        Initialize the exporter.
+        
+        Args:
+            endpoint (str): Traces URL, e.g. http://localhost:4318/v1/traces
+            service_name (str): service.name resource attribute
+            timeout (float): Request timeout in seconds
+        """
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self.session = requests.Session()
+    
+    def encode(self, spans: List[Span]) -> Dict[str, Any]:
+        """
+        Build an OTLP ExportTraceServiceRequest body.
+        
+        Args:
+            spans (List[Span]): Finished spans
+        
+        Returns:
+            Dict[str, Any]: JSON-serializable request body
+        """
+        return {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': self.service_name})},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [{
+                    'traceId': span.context.trace_id,
+                    'spanId': span.context.span_id,
+                    'parentSpanId': span.parent_id or '',
+                    'name': span.name,
+                    'kind': 1,  # SPAN_KIND_INTERNAL
+                    'startTimeUnixNano': str(span.start_time),
+                    'endTimeUnixNano': str(span.end_time),
+                    'attributes': _otlp_attributes(span.attributes),
+                    'events': [{
+                        'timeUnixNano': str(event['time']),
+                        'name': event['name'],
+                        'attributes': _otlp_attributes(event['attributes']),
+                    } for event in span.events],
+                    'status': {'code': 2 if span.status == 'error' else 1},
+                } for span in spans],
+            }],
+        }]}
+    
+    def export(self, spans: List[Span]):
+        """Post a batch of spans"""
+        response = self.session.post(self.endpoint, json=self.encode(spans), timeout=self.timeout)
+        response.raise_for_status()
+
+class Tracer:
+    """
+    Creates spans, samples traces and exports finished spans.
+    
+    Sampling is decided once per trace, at its root span: a trace is kept
+    with probability sample_rate, and every span under it follows that
+    decision, including spans continued from a traceparent header. An
+    unsampled trace costs a context variable lookup per operation and
+    nothing else, so tracing can stay on in production at a low rate.
+    
+    Finished spans go to a bounded queue that a background thread drains
+    in batches, so exporting never blocks a request; when the queue is
+    full spans are dropped and counted.
+    """
+    
+    def __init__(self, exporter=None, sample_rate: float = 0.0, max_queue: int = 2048,
+                 batch_size: int = 256, export_interval: float = 2.0):
+        """
+        Initialize the tracer.
+        
+        Args:
+            exporter: Object with an export(spans) method; None disables
+                tracing
+            sample_rate (float): Fraction of new traces to record, 0 to 1
+            max_queue (int): Finished spans buffered before dropping
+            batch_size (int): Spans per export call
+            export_interval (float): Seconds between exports
+        """
+        self.exporter = None
+        self.sample_rate = 0.0
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.export_interval = export_interval
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.configure(exporter, sample_rate)
+    
+    def configure(self, exporter, sample_rate: float):
+        """
+        Set the exporter and sample rate.
+        
+        Args:
+            exporter: Span exporter; None disables tracing
+            sample_rate (float): Fraction of new traces to record
+        """
+        self.exporter = exporter
+        self.sample_rate = max(0.0, min(float(sample_rate), 1.0)) if exporter is not None else 0.0
+        if self.sample_rate:
+            self._start()
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether any trace can be sampled"""
+        return self.sample_rate > 0
+    
+    def start_span(self, name: str, parent: Union[AnySpan, SpanContext, None] = None,
+                   attributes: Dict[str, Any] = None, start_time: int = None) -> AnySpan:
+        """
+        Start a span without making it current.
+        
+        Use this for spans that outlive a block, such as one covering a
+        streamed response; end it with end().
+        
+        Args:
+            name (str): Operation name
+            parent (optional): Parent span or remote SpanContext; defaults
+                to the current span, and with neither a new trace starts
+            attributes (Dict[str, Any], optional): Initial attributes
+            start_time (int, optional): Start in ns since the epoch
+        
+        Returns:
+            The span, or a non-recording span if the trace is not sampled
+        """
+        if parent is None:
+            parent = _current_span.get()
+        if parent is None:
+            # A new trace; the sampling decision is made here
+            if not self.sample_rate or random.random() >= self.sample_rate:
+                return NON_RECORDING_SPAN
+            context = SpanContext(f"{random.getrandbits(128):032x}", f"{random.getrandbits(64):016x}")
+            return Span(self, name, context, None, attributes, start_time)
+        
+        parent_context = parent if isinstance(parent, SpanContext) else parent.context
+        if parent_context is None or not parent_context.sampled or not self.enabled:
+            return NON_RECORDING_SPAN
+        context = SpanContext(parent_context.trace_id, f"{random.getrandbits(64):016x}")
+        return Span(self, name, context, parent_context.span_id, attributes, start_time)
+    
+    @contextmanager
+    def span(self, name: str, parent: Union[AnySpan, SpanContext, None] = None,
+             attributes: Dict[str, Any] = None) -> Iterator[AnySpan]:
+        """
+        Run a block in a new current span.
+        
+        Spans started inside the block, on this thread or task, become its
+        children. Do not use across a yield in a generator; use start_span
+        there instead.
+        
+        Args:
+            name (str): Operation name
+            parent (optional): Parent span or remote SpanContext; defaults
+                to the current span
+            attributes (Dict[str, Any], optional): Initial attributes
+        
+        Yields:
+            The span, or a non-recording span if the trace is not sampled
+        """
+        span = self.start_span(name, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            with span:
+                yield span
+        finally:
+            _current_span.reset(token)
+    
+    def _export(self, span: Span):
+        """Queue a finished span for the export thread"""
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _start(self):
+        """Start the export thread if it is not running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='trace-export', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Export thread body"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.export_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._send(batch)
+    
+    def _send(self, batch: List[Span]):
+        """Hand a batch to the exporter, flush markers included"""
+        spans = [span for span in batch if isinstance(span, Span)]
+        if spans and self.exporter is not None:
+            try:
+                self.exporter.export(spans)
+                self.exported += len(spans)
+            except Exception as e:
+                self.export_errors += 1
+                logger.warning(f"Exporting {len(spans)} spans failed: {str(e)}")
+        for marker in batch:
+            if isinstance(marker, threading.Event):
+                marker.set()
+    
+    def flush(self, timeout: float = 5) -> bool:
+        """
+        Export every span finished so far.
+        
+        Args:
+            timeout (float): Seconds to wait
+        
+        Returns:
+            bool: True if the queue was drained in time
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get tracing statistics.
+        
+        Returns:
+            Dict[str, Any]: Sample rate, spans exported, dropped and
+            queued, and failed exports
+        """
+        return {
+            'sample_rate': self.sample_rate,
+            'exported': self.exported,
+            'dropped': self.dropped,
+            'queued': self._queue.qsize(),
+            'export_errors': self.export_errors,
+        }
+
+tracer = Tracer()
+
+def create_exporter(config):
+    """
+    Build the span exporter named by TRACE_EXPORTER.
+    
+    Args:
+        config: Application config
+    
+    Returns:
+        JsonLinesExporter, OTLPExporter or None
+    
+    Raises:
+        Exception: If TRACE_EXPORTER is not 'jsonl', 'otlp' or empty
+    """
+    kind = (config.get('TRACE_EXPORTER') or '').lower()
+    if not kind:
+        return None
+    if kind == 'jsonl':
+        return JsonLinesExporter(os.path.abspath(config.get('TRACE_FILE', 'traces.jsonl')))
+    if kind == 'otlp':
+        return OTLPExporter(
+            config.get('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces'),
+            service_name=config.get('TRACE_SERVICE_NAME', 'lmstudio-web-wrapper')
+        )
+    raise Exception(f"Unknown TRACE_EXPORTER: {kind}")
+
+def init_tracing(app):
+    """
+    Configure the shared tracer and trace HTTP requests.
+    
+    Each request gets a span, continuing the caller's trace when it sends
+    a traceparent header.
+    
+    Args:
+        app: Flask application
+    """
+    tracer.configure(create_exporter(app.config), app.config.get('TRACE_SAMPLE_RATE', 0.0))
+    app.before_request(_start_request_span)
+    app.teardown_request(_end_request_span)
+
+def _start_request_span():
+    if request.endpoint == 'static':
+        return
+    parent = SpanContext.from_traceparent(request.headers.get('traceparent'))
+    rule = request.url_rule.rule if request.url_rule is not None else request.path
+    span = tracer.start_span(f"{request.method} {rule}", parent=parent, attributes={
+        'http.method': request.method,
+        'http.route': rule,
+    })
+    g.trace_span = span
+    g.trace_token = _current_span.set(span)
+
+def _end_request_span(error=None):
+    span = g.pop('trace_span', None)
+    token = g.pop('trace_token', None)
+    if span is None:
+        return
+    if error is not None:
+        span.record_exception(error)
+    if token is not None:
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Torn down in a different context from the one it started in
+            pass
+    span.end()
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    """Accepts OTLP/HTTP JSON trace exports"""
+    
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/traces':
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self.send_error(400)
+            return
+        self.server.collector.receive(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{}')
+    
+    def log_message(self, format, *args):
+        pass
+
+class TraceCollector:
+    """
+    Minimal OTLP/HTTP collector stand-in for development and tests.
+    
+    Receives spans from OTLPExporter (or any OTLP/HTTP JSON exporter)
+    and keeps them in memory, optionally appending them to a JSON-lines
+    file, so traces can be inspected without running a real collector.
+    """
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 4318, path: str = None):
+        """
+        Initialize the collector.
+        
+        Args:
+            host (str): Address to listen on
+            port (int): Port to listen on; 0 picks a free one
+            path (str, optional): JSON-lines file to append spans to
+        """
+        self.path = path
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _CollectorHandler)
+        self.server.daemon_threads = True
+        self.server.collector = self
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def endpoint(self) -> str:
+        """Traces URL to give OTLPExporter"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/traces"
+    
+    def receive(self, body: Dict[str, Any]):
+        """Store the spans of one export request"""
+        spans = []
+        for resource_spans in body.get('resourceSpans', []):
+            for scope_spans in resource_spans.get('scopeSpans', []):
+                spans.extend(scope_spans.get('spans', []))
+        with self._lock:
+            self.spans.extend(spans)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(span) + '\n' for span in spans)
+    
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='trace-collector',
+                                        daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+@click.group('trace')
+def trace_cli():
+    """Tracing commands"""
+    pass
+
+@trace_cli.command('collect')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=4318, show_default=True)
+@click.option('--out', default='collected-traces.jsonl', show_default=True,
+              help='JSON-lines file to append received spans to')
+def collect_command(host, port, out):
+    """Run an OTLP/HTTP collector stand-in that writes spans to a file"""
+    collector = TraceCollector(host, port, out)
+    click.echo(f"Collecting spans at {collector.endpoint} into {out}")
+    try:
+        collector.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.server.server_close()
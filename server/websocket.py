@@ -3,21 +3,88 @@
 from flask_socketio import emit, join_room, leave_room
 from flask_login import current_user
 import asyncio
-import threading
+import time
+from .cache import cache_stats
 from .chat import ChatManager
-from .llm import LMStudioClient
+from .context import ContextBuilder
+from .database import db
+from .engine import AsyncEngine
+from .llm import AsyncLMStudioClient
+from .metrics import ACTIVE_GENERATIONS, CACHE_HIT_RATIO, MUSIC_STAGE_DURATION, WEBSOCKET_CONNECTIONS
 from .music import MusicQueryProcessor
+from .registry import GenerationRegistry, create_registry_backend
+from .scheduler import GenerationScheduler, QueueFullError
+from .search import search_index
+from .streaming import BackgroundWriter, MessageBuffer, ChunkCoalescer
+from .summarizer import ConversationSummarizer, SummaryWorker
+from .tracing import propagate, tracer
 
 class WebSocketHandler:
     """Handles WebSocket connections and message processing"""
     
-    def __init__(self, socketio):
+    def __init__(self, socketio, app=None):
         self.socketio = socketio
-        self.lm_client = LMStudioClient()
+        self.lm_client = AsyncLMStudioClient()
         self.music_processor = MusicQueryProcessor()
-        self.active_generations = set()
+        self.engine = AsyncEngine(app)
+        settings = app.config if app is not None else {}
+        self.scheduler = GenerationScheduler(
+            max_concurrent=settings.get('GENERATION_MAX_CONCURRENT', 4),
+            max_queue_size=settings.get('GENERATION_MAX_QUEUE', 100),
+            max_queue_per_user=settings.get('GENERATION_MAX_QUEUE_PER_USER', 10),
+            on_position=self._notify_queue_position,
+            lane_limits=settings.get('GENERATION_LANE_LIMITS')
+        )
+        self.flush_interval = settings.get('STREAM_FLUSH_INTERVAL', 1.0)
+        self.flush_chars = settings.get('STREAM_FLUSH_CHARS', 2048)
+        self.coalesce_window = settings.get('STREAM_COALESCE_WINDOW', 0.04)
+        self.coalesce_bytes = settings.get('STREAM_COALESCE_BYTES', 1024)
+        self.music_max_rows = settings.get('MUSIC_RESULTS_MAX_ROWS', 200)
+        self.summary_worker = None
+        summarizer = None
+        if (app is not None and settings.get('CONTEXT_STRATEGY') == 'summary'
+                and settings.get('SUMMARY_BACKGROUND', True)):
+            summarizer = ConversationSummarizer(
+                threshold=settings.get('SUMMARY_THRESHOLD_MESSAGES', 30),
+                keep_recent=settings.get('SUMMARY_KEEP_RECENT', 10),
+                batch_size=settings.get('SUMMARY_BATCH_SIZE', 50),
+                max_tokens=settings.get('SUMMARY_MAX_TOKENS', 300)
+            )
+            # Summarize only while no generation is waiting for the model
+            self.summary_worker = SummaryWorker(
+                app, summarizer,
+                is_idle=lambda: (self.scheduler.queue_depth == 0
+                                 and self.scheduler.running < self.scheduler.max_concurrent)
+            )
+        self.context_builder = ContextBuilder(
+            token_budget=settings.get('CONTEXT_TOKEN_BUDGET', 3000),
+            strategy=settings.get('CONTEXT_STRATEGY', 'truncate'),
+            system_prompt=settings.get('CONTEXT_SYSTEM_PROMPT'),
+            summary_provider=summarizer.get_summary if summarizer else None
+        )
+        self.registry = GenerationRegistry(
+            backend=create_registry_backend(settings.get('GENERATION_REGISTRY_URL')),
+            on_cancel=lambda chat_id: self.engine.call_soon(self.scheduler.cancel, chat_id)
+        )
+        ACTIVE_GENERATIONS.set_function(lambda: len(self.active_generations))
+        CACHE_HIT_RATIO.set_function(self._cache_hit_ratios)
         self._setup_handlers()
     
+    @property
+    def active_generations(self):
+        """Chat IDs with a generation running on this worker"""
+        return self.registry.local_generations()
+    
+    def _cache_hit_ratios(self):
+        """Hit ratio per cache, computed when metrics are scraped"""
+        stats = cache_stats()
+        return {
+            ('tiered',): stats['tiered']['hit_ratio'],
+            ('tiered_local',): stats['tiered']['local_hit_ratio'],
+            ('completions',): stats['completions']['hit_ratio'],
+            ('music_sql',): self.music_processor.translation_stats()['hit_ratio'],
+        }
+    
     def _setup_handlers(self):
         """Set up WebSocket event handlers"""
         
@@ -26,11 +93,13 @@ class WebSocketHandler:
             if not current_user.is_authenticated:
                 return False
             join_room(str(current_user.id))
+            WEBSOCKET_CONNECTIONS.inc()
         
         @self.socketio.on('disconnect')
         def handle_disconnect():
             if current_user.is_authenticated:
                 leave_room(str(current_user.id))
+                WEBSOCKET_CONNECTIONS.dec()
         
         @self.socketio.on('join_chat')
         def handle_join_chat(data):
@@ -53,23 +122,29 @@ class WebSocketHandler:
             content = data['content']
             chat_type = data['type']
             
-            # Store user message
-            message = ChatManager.add_message(chat_id, content, is_user=True)
-            
-            # Broadcast user message
-            self._broadcast_message(chat_id, message)
-            
-            # Generate response
-            threading.Thread(
-                target=self._generate_response,
-                args=(chat_id, content, chat_type)
-            ).start()
+            with tracer.span('socketio.send_message', attributes={
+                'chat.id': chat_id,
+                'chat.type': chat_type
+            }) as span:
+                # Store user message
+                message = ChatManager.add_message(chat_id, content, is_user=True)
+                
+                # Broadcast user message
+                self._broadcast_message(chat_id, message)
+                
+                # Queue the response; the scheduler runs it on the engine
+                # loop, in the same trace as this message
+                self.engine.call_soon(
+                    self._schedule_response, current_user.id, chat_id, content, chat_type, span
+                )
         
         @self.socketio.on('stop_generation')
         def handle_stop_generation(data):
             """Handle request to stop response generation"""
             chat_id = data['chat_id']
-            self.active_generations.discard(chat_id)
+            # Drops queued requests and aborts the running generation on
+            # whichever worker owns it
+            self.registry.cancel(chat_id)
     
     def _broadcast_message(self, chat_id, message):
         """Broadcast message to chat room"""
@@ -80,55 +155,196 @@ class WebSocketHandler:
             'is_user': message.is_user
         }, room=f"chat_{chat_id}")
     
-    def _generate_response(self, chat_id, user_message, chat_type):
-        """Generate and stream AI response"""
-        self.active_generations.add(chat_id)
-        
+    def _emit(self, event, data, chat_id):
+        """Emit an event to a chat room from outside a Socket.IO handler"""
+        self.socketio.emit(event, data, room=f"chat_{chat_id}")
+    
+    def _schedule_response(self, user_id, chat_id, user_message, chat_type, trace_parent=None):
+        """Queue a response generation; runs on the engine loop"""
+        queued_at = time.time_ns()
         try:
-            if chat_type == 'music':
-                # Handle music-related query
-                sql_query = self.music_processor.generate_sql(user_message)
-                results = self.music_processor.execute_query(sql_query)
-                prompt = self.music_processor.format_results(results)
-                response_stream = self.lm_client.generate_stream(prompt)
-            else:
-                # Handle general query
-                response_stream = self.lm_client.generate_stream(user_message)
-            
-            # Initialize response message
-            response_message = ChatManager.add_message(chat_id, "", is_user=False)
-            accumulated_text = ""
+            self.scheduler.submit(
+                user_id,
+                chat_id,
+                lambda: self._generate_response(chat_id, user_message, chat_type,
+                                                trace_parent, queued_at),
+                lane='music' if chat_type == 'music' else 'chat'
+            )
+        except QueueFullError as e:
+            self._emit('error', {
+                'chat_id': chat_id,
+                'error': str(e)
+            }, chat_id)
+    
+    def _notify_queue_position(self, job, position):
+        """Tell the chat room where its request stands in the queue"""
+        self._emit('queued', {
+            'chat_id': job.chat_id,
+            'position': position,
+            'queue_depth': self.scheduler.queue_depth
+        }, job.chat_id)
+    
+    async def _music_response_stream(self, chat_id, user_message):
+        """
+        Run a music query and return the stream that summarizes it.
+        
+        The result table is sent to the chat as soon as the query finishes,
+        and the summary comes from a single streamed completion.
+        """
+        loop = asyncio.get_running_loop()
+        # The music processor is blocking; keep it off the event loop
+        started = time.perf_counter()
+        direct = await loop.run_in_executor(
+            None, propagate(self.music_processor.answer_directly), user_message, self.music_max_rows)
+        if direct is not None:
+            # Simple question: answered by a prebuilt query, no LLM calls
+            MUSIC_STAGE_DURATION.labels('direct').observe(time.perf_counter() - started)
+            results, truncated, reply = direct
+            self._emit_music_results(chat_id, results, truncated)
+            return self._static_stream(reply)
+        
+        started = time.perf_counter()
+        sql_query = await loop.run_in_executor(
+            None, propagate(self.music_processor.generate_sql), user_message)
+        MUSIC_STAGE_DURATION.labels('sql_gen').observe(time.perf_counter() - started)
+        started = time.perf_counter()
+        results, truncated = await loop.run_in_executor(
+            None, propagate(self.music_processor.fetch_results), sql_query, self.music_max_rows)
+        MUSIC_STAGE_DURATION.labels('execute').observe(time.perf_counter() - started)
+        self._emit_music_results(chat_id, results, truncated)
+        
+        started = time.perf_counter()
+        with tracer.span('music.format'):
+            prompt = self.music_processor.format_results(results, user_message, truncated)
+        MUSIC_STAGE_DURATION.labels('format').observe(time.perf_counter() - started)
+        if not results:
+            return self._static_stream(prompt)
+        return self.lm_client.generate_stream(prompt, task='format', temperature=0)
+    
+    def _emit_music_results(self, chat_id, results, truncated):
+        """Send a music query's result table to the chat"""
+        columns = list(results[0].keys()) if results else []
+        self._emit('music_results', {
+            'chat_id': chat_id,
+            'columns': columns,
+            'rows': [[row[col] for col in columns] for row in results],
+            'truncated': truncated
+        }, chat_id)
+    
+    @staticmethod
+    async def _run_db(function, *args):
+        """
+        Run blocking database work on an executor thread.
+        
+        SQLite commits can wait on the write lock, which must not stall
+        the other generations on the engine loop. Each executor thread has
+        its own scoped session, ended after every call, so jobs never share
+        one.
+        """
+        def run():
+            try:
+                return function(*args)
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+        return await asyncio.get_running_loop().run_in_executor(None, propagate(run))
+    
+    @staticmethod
+    async def _static_stream(text):
+        """Stream a fixed reply without calling the LLM"""
+        yield text
+    
+    async def _generate_response(self, chat_id, user_message, chat_type, trace_parent=None,
+                                 queued_at=None):
+        """
+        Generate and stream AI response.
+        
+        Args:
+            chat_id: ID of the chat to reply in
+            user_message (str): The user's message
+            chat_type (str): 'music' or a general chat
+            trace_parent (optional): Span of the send_message handler;
+                the generation's spans join its trace
+            queued_at (int, optional): When the job was queued, in ns
+                since the epoch, to show the scheduler wait in the trace
+        """
+        with tracer.span('generate_response', parent=trace_parent, attributes={
+            'chat.id': chat_id,
+            'chat.type': chat_type
+        }) as span:
+            if queued_at is not None:
+                tracer.start_span('scheduler.queued', parent=span, start_time=queued_at).end()
+            loop = asyncio.get_running_loop()
+            task = asyncio.current_task()
+            job_id = self.registry.register(
+                chat_id, lambda: loop.call_soon_threadsafe(task.cancel)
+            )
             
-            # Stream response
-            for chunk in response_stream:
-                if chat_id not in self.active_generations:
-                    break
-                    
-                accumulated_text += chunk
-                response_message.content = accumulated_text
-                db.session.commit()
+            try:
+                if chat_type == 'music':
+                    response_stream = await self._music_response_stream(chat_id, user_message)
+                else:
+                    # Handle general query with the conversation so far
+                    messages = await self._run_db(self.context_builder.build, chat_id)
+                    response_stream = self.lm_client.generate_stream(
+                        user_message, messages=messages, task='chat')
+                
+                # Initialize response message; only its ID outlives the session
+                message_id = await self._run_db(
+                    lambda: ChatManager.add_message(chat_id, "", is_user=False).id)
+                writer = BackgroundWriter(
+                    lambda message_id, text: self._run_db(ChatManager.update_message, message_id, text))
+                buffer = MessageBuffer(
+                    message_id,
+                    writer,
+                    flush_interval=self.flush_interval,
+                    flush_chars=self.flush_chars
+                )
+                coalescer = ChunkCoalescer(
+                    lambda text: self._emit('response_chunk', {
+                        'chat_id': chat_id,
+                        'message_id': message_id,
+                        'chunk': text
+                    }, chat_id),
+                    window=self.coalesce_window,
+                    max_bytes=self.coalesce_bytes
+                )
                 
-                emit('response_chunk', {
+                # Stream response
+                started = time.perf_counter()
+                stream_span = tracer.start_span('response.stream', parent=span)
+                try:
+                    async for chunk in response_stream:
+                        buffer.append(chunk)
+                        coalescer.append(chunk)
+                finally:
+                    stream_span.end()
+                    if chat_type == 'music':
+                        MUSIC_STAGE_DURATION.labels('stream').observe(time.perf_counter() - started)
+                    # Close the upstream stream even when cancelled so LM Studio
+                    # stops generating, and deliver and persist what was received
+                    await response_stream.aclose()
+                    coalescer.flush()
+                    buffer.flush()
+                    await writer.wait()
+                    # Index the reply once, as finally persisted
+                    await self._run_db(search_index.mark, message_id)
+                
+                self._emit('response_complete', {
                     'chat_id': chat_id,
-                    'message_id': response_message.id,
-                    'chunk': chunk
-                }, room=f"chat_{chat_id}")
+                    'message_id': message_id
+                }, chat_id)
+                if self.summary_worker is not None:
+                    self.summary_worker.request(chat_id)
             
-            # Final update
-            if chat_id in self.active_generations:
-                response_message.content = accumulated_text
-                db.session.commit()
-                
-                emit('response_complete', {
+            except Exception as e:
+                span.record_exception(e)
+                self._emit('error', {
                     'chat_id': chat_id,
-                    'message_id': response_message.id
-                }, room=f"chat_{chat_id}")
-        
-        except Exception as e:
-            emit('error', {
-                'chat_id': chat_id,
-                'error': str(e)
-            }, room=f"chat_{chat_id}")
-        
-        finally:
-            self.active_generations.discard(chat_id)
+                    'error': str(e)
+                }, chat_id)
+            
+            finally:
+                self.registry.unregister(chat_id, job_id)
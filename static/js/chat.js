@@ -6,6 +6,17 @@ class ChatApp {
         this.currentChatId = null;
         this.isGenerating = false;
         
+        // Message history paging
+        this.nextBeforeId = null;
+        this.loadingOlder = false;
+        
+        // Sidebar paging
+        this.loadingChats = false;
+        
+        // Message search
+        this.searchTimer = null;
+        this.searchSeq = 0;
+        
         // Cache DOM elements
         this.elements = {
             messageForm: document.getElementById('message-form'),
@@ -19,8 +30,11 @@ class ChatApp {
             newChatTitleInput: document.getElementById('new-chat-title'),
             confirmRenameButton: document.getElementById('confirm-rename'),
             cancelRenameButton: document.getElementById('cancel-rename'),
-            logoutButton: document.getElementById('logout')
+            logoutButton: document.getElementById('logout'),
+            searchInput: document.getElementById('search-input'),
+            searchResults: document.getElementById('search-results')
         };
+        this.nextChatsBeforeId = this.elements.chatList.dataset.nextBeforeId || null;
         
         this.setupEventListeners();
         this.setupSocketHandlers();
@@ -77,6 +91,35 @@ class ChatApp {
             window.location.href = '/logout';
         });
         
+        // Load more chats when the sidebar is scrolled to the bottom
+        this.elements.chatList.addEventListener('scroll', () => {
+            const list = this.elements.chatList;
+            if (list.scrollHeight - list.scrollTop - list.clientHeight < 100) {
+                this.loadMoreChats();
+            }
+        });
+        
+        // Search messages as the user types
+        this.elements.searchInput.addEventListener('input', () => {
+            clearTimeout(this.searchTimer);
+            this.searchTimer = setTimeout(() => this.searchMessages(), 250);
+        });
+        
+        this.elements.searchResults.addEventListener('click', (e) => {
+            const result = e.target.closest('.search-result');
+            if (!result) return;
+            this.elements.searchInput.value = '';
+            this.showSearchResults(false);
+            this.loadChat(result.dataset.chatId);
+        });
+        
+        // Load older messages when scrolled to the top
+        this.elements.messagesContainer.addEventListener('scroll', () => {
+            if (this.elements.messagesContainer.scrollTop < 100) {
+                this.loadOlderMessages();
+            }
+        });
+        
         // Auto-resize message input
         this.elements.messageInput.addEventListener('input', () => {
             this.elements.messageInput.style.height = 'auto';
@@ -93,8 +136,21 @@ class ChatApp {
             this.appendMessage(message);
         });
         
+        this.socket.on('queued', (data) => {
+            if (data.chat_id === this.currentChatId) {
+                this.updateQueueStatus(data.position);
+            }
+        });
+        
+        this.socket.on('music_results', (data) => {
+            if (data.chat_id === this.currentChatId) {
+                this.appendResultsTable(data);
+            }
+        });
+        
         this.socket.on('response_chunk', (data) => {
             if (data.chat_id === this.currentChatId) {
+                this.updateQueueStatus(0);
                 this.updateStreamingMessage(data);
             }
         });
@@ -135,15 +191,16 @@ class ChatApp {
     async loadChat(chatId) {
         try {
             const response = await fetch(`/api/chats/${chatId}/messages`);
-            const messages = await response.json();
+            const page = await response.json();
             
             this.currentChatId = chatId;
+            this.nextBeforeId = page.next_before_id;
             localStorage.setItem('lastChatId', chatId);
             
             // Update UI
             this.updateActiveChatItem(chatId);
             this.elements.messagesContainer.innerHTML = '';
-            messages.forEach(message => this.appendMessage(message));
+            page.messages.forEach(message => this.appendMessage(message));
             this.scrollToBottom();
             
             // Join chat room
@@ -153,6 +210,113 @@ class ChatApp {
         }
     }
     
+    async loadMoreChats() {
+        if (!this.nextChatsBeforeId || this.loadingChats) return;
+        
+        this.loadingChats = true;
+        try {
+            const response = await fetch(`/api/chats?before_id=${this.nextChatsBeforeId}`);
+            const page = await response.json();
+            page.chats.forEach(chat => {
+                this.elements.chatList.appendChild(this.createChatItem(chat));
+            });
+            this.nextChatsBeforeId = page.next_before_id;
+        } catch (error) {
+            console.error('Error loading chats:', error);
+        } finally {
+            this.loadingChats = false;
+        }
+    }
+    
+    async searchMessages() {
+        const query = this.elements.searchInput.value.trim();
+        const seq = ++this.searchSeq;
+        if (!query) {
+            this.showSearchResults(false);
+            return;
+        }
+        
+        try {
+            const response = await fetch(`/api/search?q=${encodeURIComponent(query)}`);
+            const data = await response.json();
+            if (seq !== this.searchSeq) return;  // a newer search is running
+            
+            const container = this.elements.searchResults;
+            container.innerHTML = '';
+            (data.results || []).forEach(result => {
+                container.appendChild(this.createSearchResult(result));
+            });
+            if (!container.firstChild) {
+                container.textContent = data.error || 'No messages found';
+            }
+            this.showSearchResults(true);
+        } catch (error) {
+            console.error('Error searching messages:', error);
+        }
+    }
+    
+    showSearchResults(visible) {
+        this.elements.searchResults.style.display = visible ? '' : 'none';
+        this.elements.chatList.style.display = visible ? 'none' : '';
+    }
+    
+    createSearchResult(result) {
+        const item = document.createElement('div');
+        item.className = 'search-result';
+        item.dataset.chatId = result.chat_id;
+        
+        const title = document.createElement('div');
+        title.className = 'search-result-title';
+        title.textContent = result.chat_title;
+        item.appendChild(title);
+        
+        // Snippets mark matches with \x02...\x03; build highlights as
+        // elements so message text is never parsed as HTML
+        const snippet = document.createElement('div');
+        snippet.className = 'search-result-snippet';
+        result.snippet.split(/(\x02[^\x03]*\x03)/).forEach(part => {
+            if (part.startsWith('\x02')) {
+                const mark = document.createElement('mark');
+                mark.textContent = part.slice(1, -1);
+                snippet.appendChild(mark);
+            } else if (part) {
+                snippet.appendChild(document.createTextNode(part));
+            }
+        });
+        item.appendChild(snippet);
+        return item;
+    }
+    
+    async loadOlderMessages() {
+        if (!this.currentChatId || !this.nextBeforeId || this.loadingOlder) return;
+        
+        this.loadingOlder = true;
+        const chatId = this.currentChatId;
+        try {
+            const response = await fetch(
+                `/api/chats/${chatId}/messages?before_id=${this.nextBeforeId}`
+            );
+            const page = await response.json();
+            if (chatId !== this.currentChatId) return;
+            
+            // Prepend while keeping the visible messages in place
+            const container = this.elements.messagesContainer;
+            const previousHeight = container.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            page.messages.forEach(message => {
+                fragment.appendChild(this.createMessageElement(message));
+            });
+            container.insertBefore(fragment, container.firstChild);
+            container.scrollTop += container.scrollHeight - previousHeight;
+            
+            this.nextBeforeId = page.next_before_id;
+        } catch (error) {
+            console.error('Error loading older messages:', error);
+        } finally {
+            this.loadingOlder = false;
+        }
+    }
+    
     async renameChat() {
         const chatId = this.elements.renameModal.dataset.chatId;
         const newTitle = this.elements.newChatTitleInput.value.trim();
@@ -192,6 +356,7 @@ class ChatApp {
                 
                 if (this.currentChatId === chatId) {
                     this.currentChatId = null;
+                    this.nextBeforeId = null;
                     this.elements.messagesContainer.innerHTML = '';
                     localStorage.removeItem('lastChatId');
                 }
@@ -228,6 +393,11 @@ class ChatApp {
     }
     
     appendMessage(message) {
+        this.elements.messagesContainer.appendChild(this.createMessageElement(message));
+        this.scrollToBottom();
+    }
+    
+    createMessageElement(message) {
         const messageElement = document.createElement('div');
         messageElement.className = `message ${message.is_user ? 'user' : 'assistant'}`;
         messageElement.dataset.messageId = message.id;
@@ -242,8 +412,41 @@ class ChatApp {
         
         messageElement.appendChild(contentElement);
         messageElement.appendChild(timestampElement);
+        return messageElement;
+    }
+    
+    appendResultsTable(data) {
+        if (!data.columns.length) return;
+        
+        const wrapper = document.createElement('div');
+        wrapper.className = 'message assistant results';
+        
+        const table = document.createElement('table');
+        table.className = 'results-table';
+        const headerRow = table.createTHead().insertRow();
+        data.columns.forEach(column => {
+            const cell = document.createElement('th');
+            cell.textContent = column;
+            headerRow.appendChild(cell);
+        });
         
-        this.elements.messagesContainer.appendChild(messageElement);
+        const body = table.createTBody();
+        data.rows.forEach(row => {
+            const tableRow = body.insertRow();
+            row.forEach(value => {
+                tableRow.insertCell().textContent = value === null ? '' : value;
+            });
+        });
+        wrapper.appendChild(table);
+        
+        if (data.truncated) {
+            const note = document.createElement('div');
+            note.className = 'message-timestamp';
+            note.textContent = `Showing the first ${data.rows.length} results`;
+            wrapper.appendChild(note);
+        }
+        
+        this.elements.messagesContainer.appendChild(wrapper);
         this.scrollToBottom();
     }
     
@@ -256,7 +459,27 @@ class ChatApp {
         }
     }
     
+    updateQueueStatus(position) {
+        // Position 0 means the request has left the queue and started
+        let statusElement = this.elements.messagesContainer.querySelector('.queue-status');
+        if (position <= 0) {
+            if (statusElement) statusElement.remove();
+            return;
+        }
+        
+        if (!statusElement) {
+            statusElement = document.createElement('div');
+            statusElement.className = 'queue-status';
+            this.elements.messagesContainer.appendChild(statusElement);
+        }
+        statusElement.textContent = position === 1
+            ? 'Your request is next in line...'
+            : `Waiting in line: position ${position}`;
+        this.scrollToBottom();
+    }
+    
     completeStreamingMessage(data) {
+        this.updateQueueStatus(0);
         this.isGenerating = false;
         this.updateGeneratingUI(false);
     }
@@ -291,6 +514,7 @@ class ChatApp {
     
 handleError(error) {
         console.error('Server error:', error);
+        this.updateQueueStatus(0);
         this.isGenerating = false;
         this.updateGeneratingUI(false);
 
@@ -305,12 +529,17 @@ handleError(error) {
     }
 
     addChatToList(chat) {
+        this.elements.chatList.insertBefore(this.createChatItem(chat), this.elements.chatList.firstChild);
+    }
+    
+    createChatItem(chat) {
         const chatItem = document.createElement('div');
         chatItem.className = 'chat-item';
         chatItem.dataset.chatId = chat.id;
+        if (chat.type) chatItem.dataset.chatType = chat.type;
 
         chatItem.innerHTML = `
-            <div class="chat-item-title">${chat.title}</div>
+            <div class="chat-item-title"></div>
             <div class="chat-item-actions">
                 <button class="rename-chat" title="Rename">
                     <i class="fas fa-edit"></i>
@@ -320,8 +549,9 @@ handleError(error) {
                 </button>
             </div>
         `;
+        chatItem.querySelector('.chat-item-title').textContent = chat.title;
 
-        this.elements.chatList.insertBefore(chatItem, this.elements.chatList.firstChild);
+        return chatItem;
     }
 }
 
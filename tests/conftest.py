@@ -32,3 +32,49 @@ def authenticated_user(db, client):
         'password': 'password123'
     })
     return user
+
+@pytest.fixture
+def seeded_db(db):
+    """
+    Seed users, chats and messages for query plan and latency checks.
+    
+    Volume defaults to a size that runs quickly; set BENCH_USERS,
+    BENCH_CHATS and BENCH_MESSAGES (per user / per chat) to seed realistic
+    volumes, e.g. 10000 x 100 x 200.
+    """
+    import os
+    from datetime import datetime, timedelta
+    from server.database import User, Chat, Message
+    
+    users = int(os.getenv('BENCH_USERS', 20))
+    chats_per_user = int(os.getenv('BENCH_CHATS', 10))
+    messages_per_chat = int(os.getenv('BENCH_MESSAGES', 20))
+    start = datetime(2024, 1, 1)
+    
+    db.session.execute(User.__table__.insert(), [
+        {'id': u, 'username': f'bench{u}', 'password_hash': ''}
+        for u in range(1, users + 1)
+    ])
+    chat_id = 0
+    message_rows = []
+    for u in range(1, users + 1):
+        chat_rows = []
+        for c in range(chats_per_user):
+            chat_id += 1
+            chat_rows.append({
+                'id': chat_id, 'title': f'Chat {c}', 'user_id': u,
+                'chat_type': 'general', 'created_at': start + timedelta(hours=chat_id)
+            })
+            for m in range(messages_per_chat):
+                message_rows.append({
+                    'chat_id': chat_id, 'content': f'message {m} of chat {chat_id}',
+                    'is_user': m % 2 == 0, 'timestamp': start + timedelta(hours=chat_id, seconds=m)
+                })
+            if len(message_rows) >= 50000:
+                db.session.execute(Message.__table__.insert(), message_rows)
+                message_rows = []
+        db.session.execute(Chat.__table__.insert(), chat_rows)
+    if message_rows:
+        db.session.execute(Message.__table__.insert(), message_rows)
+    db.session.commit()
+    return {'users': users, 'chats': chat_id, 'messages': chat_id * messages_per_chat}
@@ -0,0 +1,218 @@
+# tests/test_backends.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from server.backends import BackendPool
+from server.llm import LMStudioClient
+from server.model_router import ModelRouter
+
+class FakeLMStudio:
+    """Local LM Studio stand-in that streams a fixed reply over SSE"""
+    
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.status = 200
+        self.requests = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def _handler(self):
+        fake = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def log_message(self, *args):
+                pass
+            
+            def _reply(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def do_GET(self):
+                self._reply(fake.status, b'{"data": []}')
+            
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                with fake._lock:
+                    fake.requests += 1
+                    fake.active += 1
+                    fake.peak = max(fake.peak, fake.active)
+                try:
+                    if fake.status != 200:
+                        self._reply(fake.status, b'{"error": "unavailable"}')
+                        return
+                    time.sleep(fake.delay)
+                    if not request.get('stream'):
+                        reply = {'choices': [{'message': {'content': fake.name}}]}
+                        self._reply(200, json.dumps(reply).encode())
+                        return
+                    body = b''.join(
+                        b'data: ' + json.dumps({'choices': [{'delta': {'content': piece}}]}).encode() + b'\n\n'
+                        for piece in (fake.name, '!')
+                    ) + b'data: [DONE]\n\n'
+                    self._reply(200, body, 'text/event-stream')
+                finally:
+                    with fake._lock:
+                        fake.active -= 1
+        
+        return Handler
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def fakes():
+    servers = []
+    
+    def start(count, **kwargs):
+        for i in range(count):
+            servers.append(FakeLMStudio(f"b{i}", **kwargs))
+        return servers
+    
+    yield start
+    for server in servers:
+        server.stop()
+
+def test_least_outstanding_spreads_load(fakes):
+    """Test concurrent requests are spread across all backends"""
+    servers = fakes(3, delay=0.2)
+    pool = BackendPool([s.url for s in servers])
+    client = LMStudioClient(backends=pool, model_router=ModelRouter(default_limit=6))
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(''.join(client.generate_stream("hi"))))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(results) == 6
+    assert [s.requests for s in servers] == [2, 2, 2]
+    assert all(s.peak <= 2 for s in servers)
+    assert all(b['outstanding'] == 0 for b in pool.stats())
+
+def test_failover_before_first_token(fakes):
+    """Test a 5xx or unreachable backend is retried on another"""
+    servers = fakes(2)
+    servers[0].status = 503
+    pool = BackendPool([s.url for s in servers], max_failures=2)
+    client = LMStudioClient(backends=pool)
+    
+    replies = [''.join(client.generate_stream("hi")) for _ in range(4)]
+    assert replies == ['b1!'] * 4
+    # The failing backend is ejected after two failures and then skipped
+    assert servers[0].requests == 2
+    assert pool.stats()[0]['ejected']
+    
+    # Unreachable backends fail over too, for complete generations as well
+    dead = BackendPool(['http://127.0.0.1:9/v1', servers[1].url])
+    assert LMStudioClient(backends=dead, retries=1).generate("hi") == 'b1'
+    assert dead.stats()[0]['errors'] == 1
+
+def test_client_errors_are_not_retried(fakes):
+    """Test a 4xx reply is raised without trying another backend"""
+    servers = fakes(2)
+    servers[0].status = servers[1].status = 400
+    pool = BackendPool([s.url for s in servers])
+    with pytest.raises(Exception, match="LM Studio API error"):
+        list(LMStudioClient(backends=pool).generate_stream("hi"))
+    assert servers[0].requests + servers[1].requests == 1
+    assert not any(b['ejected'] for b in pool.stats())
+
+def test_all_backends_failing_raises(fakes):
+    """Test the error surfaces once every backend has been tried"""
+    servers = fakes(2)
+    servers[0].status = servers[1].status = 500
+    pool = BackendPool([s.url for s in servers])
+    with pytest.raises(Exception, match="LM Studio API error"):
+        list(LMStudioClient(backends=pool).generate_stream("hi"))
+    assert servers[0].requests == servers[1].requests == 1
+
+def test_ejection_and_readmission(fakes):
+    """Test active health checks eject a backend and readmit it on recovery"""
+    servers = fakes(2)
+    pool = BackendPool([s.url for s in servers], eject_seconds=0.2)
+    client = LMStudioClient(backends=pool)
+    
+    servers[0].status = 500
+    assert pool.check_all() == {servers[0].url: False, servers[1].url: True}
+    for _ in range(3):
+        assert ''.join(client.generate_stream("hi")) == 'b1!'
+    assert servers[0].requests == 0
+    
+    # Recovered backends come back after the ejection lapses
+    servers[0].status = 200
+    time.sleep(0.25)
+    replies = {''.join(client.generate_stream("hi")) for _ in range(4)}
+    assert replies == {'b0!', 'b1!'}
+    assert not pool.stats()[0]['ejected']
+    
+    # A probe readmits a backend before its ejection lapses
+    servers[0].status = 500
+    pool.check(pool.backends[0])
+    servers[0].status = 200
+    assert pool.check(pool.backends[0])
+    assert not pool.stats()[0]['ejected']
+
+def test_repeat_ejections_back_off():
+    """Test each repeat ejection lasts longer, up to the maximum"""
+    pool = BackendPool(['http://a/v1'], max_failures=1, eject_seconds=10, max_eject_seconds=25)
+    backend = pool.backends[0]
+    periods = []
+    for _ in range(3):
+        pool.release(pool.acquire(), ok=False)
+        periods.append(round(backend.ejected_until - time.monotonic()))
+    assert periods == [10, 20, 25]
+    # With every backend ejected, requests still go somewhere
+    assert pool.acquire() is backend
+
+def test_async_client_fails_over(fakes):
+    """Test the async client retries on another backend and spreads load"""
+    import asyncio
+    from server.llm import AsyncLMStudioClient
+    servers = fakes(3, delay=0.1)
+    servers[0].status = 502
+    pool = BackendPool([s.url for s in servers], max_failures=1)
+    
+    async def run():
+        client = AsyncLMStudioClient(backends=pool)
+        try:
+            async def one():
+                return ''.join([chunk async for chunk in client.generate_stream("hi")])
+            return await asyncio.gather(*[one() for _ in range(4)])
+        finally:
+            await client.close()
+    
+    replies = asyncio.run(run())
+    assert sorted(replies) == ['b1!', 'b1!', 'b2!', 'b2!']
+    assert servers[0].requests >= 1
+
+def test_shared_pool_from_app_config():
+    """Test the app builds the shared pool from LM_STUDIO_URLS"""
+    from server import create_app
+    from server import llm
+    from config.settings import TestingConfig
+    original = TestingConfig.LM_STUDIO_URLS
+    TestingConfig.LM_STUDIO_URLS = ['http://one:1234/v1', 'http://two:1234/v1']
+    try:
+        create_app('testing')
+        assert [b['url'] for b in llm.get_backend_pool().stats()] == TestingConfig.LM_STUDIO_URLS
+        assert LMStudioClient().backends is llm.get_backend_pool()
+    finally:
+        TestingConfig.LM_STUDIO_URLS = original
+        llm.backend_pool = None
@@ -0,0 +1,98 @@
+# tests/test_cache.py
+import threading
+import time
+from unittest.mock import MagicMock
+from server.cache import tiered_cache, cached_with_key, cache_stats
+from server.chat import ChatManager
+
+def test_shared_tier_refills_local_tier(app):
+    """Test reads fall through to the shared tier and are kept locally"""
+    with app.app_context():
+        tiered_cache.backend.set('k', {'v': 1})
+        before = dict(tiered_cache.counts)
+        assert tiered_cache.get('k') == {'v': 1}
+        assert tiered_cache.get('k') == {'v': 1}
+        assert tiered_cache.counts['shared_hits'] == before['shared_hits'] + 1
+        assert tiered_cache.counts['local_hits'] == before['local_hits'] + 1
+        assert 0 < cache_stats()['tiered']['hit_ratio'] <= 1
+
+def test_concurrent_misses_load_once(app):
+    """Test that a stampede on one key runs the loader once"""
+    loader = MagicMock(side_effect=lambda: time.sleep(0.1) or ['rows'])
+    results = []
+    
+    def read():
+        with app.app_context():
+            results.append(tiered_cache.get_or_set('stampede', loader))
+    
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [['rows']] * 8
+    assert loader.call_count == 1
+
+def test_waiter_that_times_out_keeps_the_other_loaders_lock(app, monkeypatch):
+    """Test that only the caller holding the shared-tier lock deletes it"""
+    with app.app_context():
+        tiered_cache.backend.add('lock:held-elsewhere', 1, timeout=60)
+        monkeypatch.setattr(tiered_cache, 'lock_timeout', 0.1)
+        try:
+            assert tiered_cache.get_or_set('held-elsewhere', lambda: ['rows']) == ['rows']
+            assert tiered_cache.backend.get('lock:held-elsewhere') == 1
+        finally:
+            tiered_cache.delete('held-elsewhere')
+            tiered_cache.backend.delete('lock:held-elsewhere')
+
+def test_counters_are_exact_under_concurrency(app):
+    """Test that hit counters do not lose increments across threads"""
+    with app.app_context():
+        tiered_cache.set('counted', ['rows'])
+        before = tiered_cache.counts['local_hits']
+        
+        def read():
+            for _ in range(2000):
+                tiered_cache.get('counted')
+        
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert tiered_cache.counts['local_hits'] - before == 16000
+
+def test_cached_with_key_builds_key_once(app, monkeypatch):
+    """Test the decorator caches per function and arguments"""
+    import server.cache as cache_module
+    key_builder = MagicMock(wraps=cache_module.cache_key)
+    monkeypatch.setattr(cache_module, 'cache_key', key_builder)
+    calls = []
+    
+    @cached_with_key(timeout=60)
+    def square(n):
+        calls.append(n)
+        return n * n
+    
+    with app.app_context():
+        assert square(3) == 9 and square(3) == 9 and square(4) == 16
+    assert calls == [3, 4]
+    assert key_builder.call_count == 3
+
+def test_chat_list_cache_is_invalidated_by_writes(db, authenticated_user):
+    """Test that create, rename, delete and new messages refresh the list"""
+    chat = ChatManager.create_chat(authenticated_user.id, title='First')
+    chats, _ = ChatManager.get_recent_chats(authenticated_user.id)
+    assert [c['title'] for c in chats] == ['First']
+    
+    ChatManager.rename_chat(chat.id, authenticated_user.id, 'Renamed')
+    assert ChatManager.get_recent_chats(authenticated_user.id)[0][0]['title'] == 'Renamed'
+    
+    ChatManager.add_message(chat.id, "hello", is_user=True)
+    activity = ChatManager.get_recent_chats(authenticated_user.id)[0][0]['last_activity']
+    assert activity != chats[0]['last_activity']
+    
+    other = ChatManager.create_chat(authenticated_user.id, title='Second')
+    assert len(ChatManager.get_recent_chats(authenticated_user.id)[0]) == 2
+    ChatManager.delete_chat(other.id, authenticated_user.id)
+    assert [c['title'] for c in ChatManager.get_recent_chats(authenticated_user.id)[0]] == ['Renamed']
@@ -19,3 +19,35 @@ def test_delete_chat(db, authenticated_user):
     chat = ChatManager.create_chat(authenticated_user.id)
     assert ChatManager.delete_chat(chat.id, authenticated_user.id)
     assert ChatManager.get_chat(chat.id, authenticated_user.id) is None
+
+def test_message_pagination(db, authenticated_user, client):
+    """Test keyset pagination of message history"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    ids = [ChatManager.add_message(chat.id, f"message {i}").id for i in range(7)]
+    
+    page = client.get(f'/api/chats/{chat.id}/messages?limit=3').get_json()
+    assert [m['id'] for m in page['messages']] == ids[4:]
+    assert page['has_more']
+    
+    page = client.get(f"/api/chats/{chat.id}/messages?limit=3&before_id={page['next_before_id']}").get_json()
+    assert [m['id'] for m in page['messages']] == ids[1:4]
+    
+    page = client.get(f"/api/chats/{chat.id}/messages?limit=3&before_id={page['next_before_id']}").get_json()
+    assert [m['id'] for m in page['messages']] == ids[:1]
+    assert not page['has_more']
+    assert page['next_before_id'] is None
+
+def test_chat_summaries_pagination(db, authenticated_user, client):
+    """Test sidebar pages are newest-first summaries with last activity"""
+    chats = [ChatManager.create_chat(authenticated_user.id, title=f"Chat {i}") for i in range(5)]
+    ChatManager.add_message(chats[0].id, "hello")
+    ChatManager.rename_chat(chats[0].id, authenticated_user.id, "Renamed")
+    
+    page = client.get('/api/chats?limit=3').get_json()
+    assert [c['id'] for c in page['chats']] == [c.id for c in chats[:1:-1]]
+    assert set(page['chats'][0]) == {'id', 'title', 'type', 'created_at', 'last_activity'}
+    
+    page = client.get(f"/api/chats?limit=3&before_id={page['next_before_id']}").get_json()
+    assert [c['title'] for c in page['chats']] == ['Chat 1', 'Renamed']
+    assert page['chats'][1]['last_activity'] >= page['chats'][1]['created_at']
+    assert not page['has_more']
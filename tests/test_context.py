@@ -0,0 +1,81 @@
+# tests/test_context.py
+from unittest.mock import patch
+from server.chat import ChatManager
+from server.context import ContextBuilder, estimate_tokens
+
+def test_history_is_role_tagged_and_budgeted(db, authenticated_user):
+    """Test that history fits the budget, newest turns first"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    for i in range(20):
+        ChatManager.add_message(chat.id, f"question {i} " + "x" * 80, is_user=True)
+        ChatManager.add_message(chat.id, f"answer {i} " + "y" * 80, is_user=False)
+    ChatManager.add_message(chat.id, "latest question", is_user=True)
+    
+    builder = ContextBuilder(token_budget=200, system_prompt="Be brief.")
+    messages = builder.build(chat.id)
+    
+    assert messages[0] == {'role': 'system', 'content': 'Be brief.'}
+    assert messages[-1] == {'role': 'user', 'content': 'latest question'}
+    assert messages[-2]['role'] == 'assistant'
+    assert sum(estimate_tokens(m['content']) + 4 for m in messages) <= 200
+    assert not any('question 0 ' in m['content'] for m in messages)
+
+def test_later_turns_only_read_the_delta(db, authenticated_user):
+    """Test that the cached prefix is extended rather than rebuilt"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    ChatManager.add_message(chat.id, "hi", is_user=True)
+    builder = ContextBuilder(token_budget=1000, strategy='summary')
+    builder.build(chat.id)
+    
+    reply = ChatManager.add_message(chat.id, "", is_user=False)
+    ChatManager.update_message(reply.id, "hello there")
+    ChatManager.add_message(chat.id, "how are you?", is_user=True)
+    with patch.object(builder, '_load_recent') as load_recent:
+        messages = builder.build(chat.id)
+    load_recent.assert_not_called()
+    assert [m['content'] for m in messages] == ['hi', 'hello there', 'how are you?']
+
+def test_summary_strategy_folds_dropped_turns(db, authenticated_user):
+    """Test that turns outside the budget survive as a rolling summary"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    ChatManager.add_message(chat.id, "My name is Ada. " + "z" * 400, is_user=True)
+    ChatManager.add_message(chat.id, "Nice to meet you, Ada.", is_user=False)
+    ChatManager.add_message(chat.id, "What is my name?", is_user=True)
+    
+    messages = ContextBuilder(token_budget=100, strategy='summary').build(chat.id)
+    assert messages[0]['role'] == 'system'
+    assert 'User: My name is Ada.' in messages[0]['content']
+    assert messages[-1]['content'] == 'What is my name?'
+
+def test_reused_chat_id_does_not_see_old_history(db):
+    """Test a chat reusing a deleted chat's ID gets only its own history"""
+    from server.auth import AuthManager
+    from server.context import _builders
+    alice = AuthManager.create_user('alice', 'password123')
+    bob = AuthManager.create_user('bob', 'password123')
+    local = ContextBuilder(token_budget=1000)
+    # Stands in for another worker, which the delete does not reach
+    remote = ContextBuilder(token_budget=1000)
+    _builders.discard(remote)
+    
+    chat_id = ChatManager.create_chat(alice.id).id
+    ChatManager.add_message(chat_id, "alice's secret", is_user=True)
+    local.build(chat_id)
+    remote.build(chat_id)
+    ChatManager.delete_chat(chat_id, alice.id)
+    
+    assert ChatManager.create_chat(bob.id).id == chat_id
+    ChatManager.add_message(chat_id, "bob's question", is_user=True)
+    for builder in (local, remote):
+        assert [m['content'] for m in builder.build(chat_id)] == ["bob's question"]
+
+def test_editing_older_messages_drops_the_cache(db, authenticated_user):
+    """Test edits to already cached turns are not served stale"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    first = ChatManager.add_message(chat.id, "first", is_user=True)
+    ChatManager.add_message(chat.id, "second", is_user=False)
+    builder = ContextBuilder(token_budget=1000)
+    builder.build(chat.id)
+    
+    ChatManager.update_message(first.id, "edited")
+    assert [m['content'] for m in builder.build(chat.id)] == ['edited', 'second']
@@ -0,0 +1,89 @@
+# tests/test_engine.py
+import asyncio
+import threading
+from server.engine import AsyncEngine
+
+def test_coroutines_share_one_loop_thread():
+    """Test that submitted coroutines all run on the engine thread"""
+    engine = AsyncEngine()
+    
+    async def whoami():
+        await asyncio.sleep(0.01)
+        return threading.current_thread().name
+    
+    try:
+        futures = [engine.submit(whoami()) for _ in range(50)]
+        names = {future.result(timeout=5) for future in futures}
+        assert names == {'async-engine'}
+    finally:
+        engine.stop()
+    assert not engine.running
+
+def test_failed_commit_does_not_poison_later_generations(app, db):
+    """Test a job whose commit fails leaves later jobs' sessions usable"""
+    from unittest.mock import MagicMock
+    from server.auth import AuthManager
+    from server.chat import ChatManager
+    from server.database import Message
+    from server.websocket import WebSocketHandler
+    handler = WebSocketHandler(MagicMock(), app)
+    handler._emit = MagicMock()
+    
+    async def reply(prompt, **kwargs):
+        yield "hello"
+    handler.lm_client.generate_stream = reply
+    handler.context_builder.build = lambda chat_id: []
+    chat_id = ChatManager.create_chat(AuthManager.create_user('engine', 'password123').id).id
+    
+    # message.chat_id is NOT NULL, so storing the reply fails to commit
+    asyncio.run(handler._generate_response(None, "hi", 'general'))
+    assert handler._emit.call_args[0][0] == 'error'
+    
+    asyncio.run(handler._generate_response(chat_id, "hi", 'general'))
+    assert handler._emit.call_args[0][0] == 'response_complete'
+    assert Message.query.filter_by(chat_id=chat_id).one().content == "hello"
+
+def test_slow_database_write_does_not_stall_other_generations(app, db, monkeypatch):
+    """Test that generation database work runs off the engine loop"""
+    from unittest.mock import MagicMock
+    from server.auth import AuthManager
+    from server.chat import ChatManager
+    from server.websocket import WebSocketHandler
+    handler = WebSocketHandler(MagicMock(), app)
+    handler._emit = MagicMock()
+    
+    async def reply(prompt, **kwargs):
+        yield prompt
+    handler.lm_client.generate_stream = reply
+    handler.context_builder.build = lambda chat_id: []
+    user_id = AuthManager.create_user('engine', 'password123').id
+    slow, fast = (ChatManager.create_chat(user_id).id for _ in range(2))
+    
+    blocked, release = threading.Event(), threading.Event()
+    writers = set()
+    update_message = ChatManager.update_message
+    def blocking_update(message_id, content):
+        writers.add(threading.current_thread())
+        if content == 'slow':
+            blocked.set()
+            release.wait(5)
+        return update_message(message_id, content)
+    monkeypatch.setattr(ChatManager, 'update_message', blocking_update)
+    
+    async def both():
+        first = asyncio.ensure_future(handler._generate_response(slow, 'slow', 'general'))
+        # The test database is one in-memory connection shared by all
+        # threads, so start the second job once the first holds no session
+        await asyncio.get_running_loop().run_in_executor(None, blocked.wait, 5)
+        await handler._generate_response(fast, 'fast', 'general')
+        completed = [call[0][2] for call in handler._emit.call_args_list
+                     if call[0][0] == 'response_complete']
+        release.set()
+        await first
+        return completed, threading.current_thread()
+    
+    completed, loop_thread = asyncio.run(both())
+    assert completed == [fast]
+    assert loop_thread not in writers
+    assert [call[0][2] for call in handler._emit.call_args_list
+            if call[0][0] == 'response_complete'] == [fast, slow]
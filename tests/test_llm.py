@@ -0,0 +1,132 @@
+# tests/test_llm.py
+import pytest
+from unittest.mock import MagicMock
+from server.llm import LMStudioClient
+
+class FakeResponse:
+    """Minimal stand-in for a streamed requests.Response"""
+    
+    def __init__(self, lines=None, payload=None):
+        self.lines = lines or []
+        self.payload = payload
+        self.closed = False
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_lines(self):
+        return iter(self.lines)
+    
+    def json(self):
+        return self.payload
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.closed = True
+
+def test_clients_share_pooled_session():
+    """Test that all clients reuse one keep-alive session"""
+    first = LMStudioClient()
+    second = LMStudioClient("http://other:1234/v1")
+    assert first.session is second.session
+    adapter = first.session.get_adapter('http://localhost')
+    assert adapter._pool_block is True
+
+def test_generate_stream_uses_timeouts(monkeypatch):
+    """Test streaming parses SSE deltas and passes connect/read timeouts"""
+    client = LMStudioClient(timeout=12, connect_timeout=3)
+    response = FakeResponse(lines=[
+        b'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+        b'',
+        b'data: {"choices": [{"delta": {"content": "lo"}}]}',
+        b'data: [DONE]',
+        b'data: {"choices": [{"delta": {"content": "ignored"}}]}',
+    ])
+    post = MagicMock(return_value=response)
+    monkeypatch.setattr(client.session, 'post', post)
+    
+    assert list(client.generate_stream("hi")) == ["Hel", "lo"]
+    assert post.call_args.kwargs['timeout'] == (3, 12)
+    assert post.call_args.kwargs['json']['stream'] is True
+    assert response.closed
+
+def test_generate_requests_non_streamed(monkeypatch):
+    """Test complete generation asks for a non-streamed body"""
+    client = LMStudioClient()
+    response = FakeResponse(payload={'choices': [{'message': {'content': 'SELECT 1'}}]})
+    post = MagicMock(return_value=response)
+    monkeypatch.setattr(client.session, 'post', post)
+    
+    assert client.generate("q") == 'SELECT 1'
+    assert post.call_args.kwargs['json']['stream'] is False
+
+def test_async_generate_stream():
+    """Test the async client parses the same SSE stream as the sync one"""
+    import asyncio
+    from aiohttp import web
+    from server.llm import AsyncLMStudioClient
+    
+    async def completions(request):
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for piece in ('Hel', 'lo'):
+            line = '{"choices": [{"delta": {"content": "%s"}}]}' % piece
+            await response.write(f"data: {line}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+    
+    async def run():
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        
+        client = AsyncLMStudioClient(f"http://127.0.0.1:{port}/v1")
+        try:
+            return [chunk async for chunk in client.generate_stream("hi")]
+        finally:
+            await client.close()
+            await runner.cleanup()
+    
+    assert asyncio.run(run()) == ["Hel", "lo"]
+
+def test_completion_cache_replays_stream(monkeypatch):
+    """Test that a deterministic stream is served from cache the second time"""
+    from server.cache import CompletionCache
+    client = LMStudioClient(cache=CompletionCache(max_entries=4, ttl=60))
+    post = MagicMock(side_effect=lambda *args, **kwargs: FakeResponse(lines=[
+        b'data: {"choices": [{"delta": {"content": "SELECT"}}]}',
+        b'data: {"choices": [{"delta": {"content": " 1"}}]}',
+        b'data: [DONE]',
+    ]))
+    monkeypatch.setattr(client.session, 'post', post)
+    
+    assert list(client.generate_stream("count  albums", temperature=0)) == ["SELECT", " 1"]
+    assert list(client.generate_stream(" count albums ", temperature=0)) == ["SELECT", " 1"]
+    assert post.call_count == 1
+    
+    # Sampled requests bypass the cache unless forced
+    list(client.generate_stream("count albums", temperature=0.7))
+    list(client.generate_stream("count albums", temperature=0.7))
+    assert post.call_count == 3
+    list(client.generate_stream("count albums", temperature=0.7, force_cache=True))
+    list(client.generate_stream("count albums", temperature=0.7, force_cache=True))
+    assert post.call_count == 4
+
+def test_lru_cache_evicts_and_expires():
+    """Test LRU eviction order and TTL expiry"""
+    from server.cache import LRUCache
+    cache = LRUCache(max_entries=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    cache.set('d', 4, ttl=-1)
+    assert cache.get('d') is None
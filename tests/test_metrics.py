@@ -0,0 +1,186 @@
+# tests/test_metrics.py
+import logging
+import os
+import time
+from unittest.mock import MagicMock
+import pytest
+from server.metrics import MetricsRegistry, metrics
+
+class FakeResponse:
+    """Streamed response with a fixed number of SSE lines"""
+    
+    def __init__(self, lines):
+        self.lines = lines
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_lines(self):
+        return iter(self.lines)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+
+def _sse(count):
+    return [b'data: {"choices": [{"delta": {"content": "tok "}}]}'] * count + [b'data: [DONE]']
+
+def _sample(text, line_start):
+    """Value of the first exposition line starting with line_start"""
+    for line in text.splitlines():
+        if line.startswith(line_start):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+def test_registry_renders_text_format():
+    """Test counters, gauges and histograms in the Prometheus text format"""
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ('path',))
+    requests.labels('/a"b').inc(2)
+    registry.gauge('connections', 'Connections').set(3)
+    registry.gauge('ratio', 'Ratio', ('cache',)).set_function(lambda: {('x',): 0.5})
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        latency.observe(value)
+    
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{path="/a\\"b"} 2' in text
+    assert 'connections 3' in text
+    assert 'ratio{cache="x"} 0.5' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'latency_seconds_sum 5.55' in text
+    
+    registry.enabled = False
+    latency.observe(1)
+    assert 'latency_seconds_count 3' in registry.render()
+
+def test_llm_stream_is_measured(monkeypatch):
+    """Test time-to-first-token, token rate and per-backend latency"""
+    from server.backends import BackendPool
+    from server.llm import LMStudioClient
+    client = LMStudioClient(backends=BackendPool(['http://metrics-backend:1234/v1']))
+    monkeypatch.setattr(client.session, 'post', MagicMock(return_value=FakeResponse(_sse(20))))
+    before = _sample(metrics.render(), 'llm_time_to_first_token_seconds_count{task="sql"}') or 0
+    
+    assert len(list(client.generate_stream("q", task='sql'))) == 20
+    text = metrics.render()
+    assert _sample(text, 'llm_time_to_first_token_seconds_count{task="sql"}') == before + 1
+    assert _sample(text, 'llm_tokens_per_second_count{task="sql"}') >= 1
+    assert _sample(text, 'llm_request_duration_seconds_count{backend="http://metrics-backend:1234/v1",outcome="ok"}') == 1
+
+def test_metrics_endpoint(app, db):
+    """Test /metrics exposes app measurements and honours METRICS_TOKEN"""
+    from server.chat import ChatManager
+    from server.auth import AuthManager
+    user = AuthManager.create_user('metrics', 'password123')
+    chat = ChatManager.create_chat(user.id)
+    before = _sample(metrics.render(), 'db_commit_duration_seconds_count{operation="add_message"}') or 0
+    ChatManager.add_message(chat.id, "hello")
+    
+    client = app.test_client()
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert _sample(text, 'db_commit_duration_seconds_count{operation="add_message"}') == before + 1
+    assert _sample(text, 'active_generations') == 0
+    assert _sample(text, 'cache_hit_ratio{cache="music_sql"}') is not None
+    assert '# TYPE music_stage_duration_seconds histogram' in text
+    assert '# TYPE websocket_connections gauge' in text
+    
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+def test_log_file_is_configured(tmp_path):
+    """Test LOG_FILE and LOG_FORMAT are applied"""
+    from flask import Flask
+    from server import init_logging
+    app = Flask(__name__)
+    app.config.update(LOG_FILE=str(tmp_path / 'app.log'), LOG_FORMAT='%(levelname)s|%(message)s',
+                      LOG_LEVEL='INFO')
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    try:
+        init_logging(app)
+        init_logging(app)
+        added = [handler for handler in root.handlers if handler not in handlers]
+        assert len(added) == 1
+        logging.getLogger('server.test').info('written')
+        added[0].flush()
+        assert 'INFO|written' in (tmp_path / 'app.log').read_text()
+    finally:
+        for handler in root.handlers[:]:
+            if handler not in handlers:
+                root.removeHandler(handler)
+                handler.close()
+
+def test_streaming_records_per_generation_not_per_chunk(monkeypatch):
+    """Test that the number of metric updates does not grow with chunks"""
+    from server.backends import BackendPool
+    from server.llm import LMStudioClient
+    from server.metrics import _HistogramValue, _Value
+    client = LMStudioClient(backends=BackendPool(['http://structure:1234/v1']))
+    calls = []
+    observe, inc = _HistogramValue.observe, _Value.inc
+    monkeypatch.setattr(_HistogramValue, 'observe', lambda self, value: calls.append(value) or observe(self, value))
+    monkeypatch.setattr(_Value, 'inc', lambda self, amount=1: calls.append(amount) or inc(self, amount))
+    
+    updates = []
+    for chunks in (10, 1000):
+        monkeypatch.setattr(client.session, 'post', MagicMock(return_value=FakeResponse(_sse(chunks))))
+        calls.clear()
+        assert len(list(client.generate_stream("q"))) == chunks
+        updates.append(len(calls))
+    assert updates[0] == updates[1] > 0
+
+@pytest.mark.skipif('BENCH_CHUNKS' not in os.environ,
+                    reason="wall-clock benchmark; set BENCH_CHUNKS to run")
+def test_streaming_overhead_benchmark(monkeypatch):
+    """Benchmark: metrics add negligible time to the streaming loop"""
+    from server.backends import BackendPool
+    from server.llm import LMStudioClient
+    chunks = int(os.environ['BENCH_CHUNKS'])
+    client = LMStudioClient(backends=BackendPool(['http://bench:1234/v1']))
+    lines = _sse(chunks)
+    monkeypatch.setattr(client.session, 'post', lambda *args, **kwargs: FakeResponse(lines))
+    
+    def best_of(runs=5):
+        best = float('inf')
+        for _ in range(runs):
+            started = time.perf_counter()
+            for _ in client.generate_stream("bench"):
+                pass
+            best = min(best, time.perf_counter() - started)
+        return best
+    
+    try:
+        metrics.enabled = False
+        baseline = best_of()
+        metrics.enabled = True
+        instrumented = best_of()
+    finally:
+        metrics.enabled = True
+    
+    # Per-generation observations only; nothing is recorded per chunk
+    overhead = instrumented / baseline
+    assert overhead <= 1.1, (f"{chunks} chunks: {baseline * 1e3:.1f} ms without metrics, "
+                             f"{instrumented * 1e3:.1f} ms with ({overhead:.2f}x)")
+    
+    histogram = MetricsRegistry().histogram('bench_seconds', 'Benchmark')
+    started = time.perf_counter()
+    for _ in range(100000):
+        histogram.observe(0.3)
+    assert (time.perf_counter() - started) / 100000 < 5e-6
+
+def test_metric_types_must_define_their_values():
+    """Test that the metric base cannot be used without a value type"""
+    from server.metrics import _Metric
+    with pytest.raises(TypeError):
+        _Metric(MetricsRegistry(), 'untyped', 'No value type')
@@ -0,0 +1,137 @@
+# tests/test_model_router.py
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+from server.llm import LMStudioClient, AsyncLMStudioClient
+from server.model_router import ModelRouter, ModelSlots
+
+class FakeResponse:
+    """Streamed response that takes a while to finish"""
+    
+    def __init__(self, delay=0.0):
+        self.delay = delay
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_lines(self):
+        time.sleep(self.delay)
+        return iter([b'data: {"choices": [{"delta": {"content": "ok"}}]}', b'data: [DONE]'])
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+
+def test_payload_names_task_model(monkeypatch):
+    """Test each task's model is sent, and unset tasks send none"""
+    router = ModelRouter({'chat': 'llama-70b', 'sql': 'qwen-1.5b', 'format': None})
+    client = LMStudioClient(model_router=router)
+    post = MagicMock(side_effect=lambda *args, **kwargs: FakeResponse())
+    monkeypatch.setattr(client.session, 'post', post)
+    
+    list(client.generate_stream("hi"))
+    list(client.generate_stream("count albums", task='sql'))
+    list(client.generate_stream("summarize", task='format'))
+    models = [call.kwargs['json'].get('model') for call in post.call_args_list]
+    assert models == ['llama-70b', 'qwen-1.5b', None]
+
+def test_sql_calls_do_not_wait_behind_chat(monkeypatch):
+    """Test a model at its limit only queues requests for that model"""
+    router = ModelRouter({'chat': 'big', 'sql': 'small'}, limits={'big': 1, 'small': 2})
+    client = LMStudioClient(model_router=router)
+    
+    def post(url, json, **kwargs):
+        return FakeResponse(delay=0.5 if json['model'] == 'big' else 0.0)
+    monkeypatch.setattr(client.session, 'post', post)
+    
+    chats = [threading.Thread(target=lambda: list(client.generate_stream("hi"))) for _ in range(2)]
+    for thread in chats:
+        thread.start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    assert list(client.generate_stream("count albums", task='sql')) == ['ok']
+    assert time.monotonic() - started < 0.2
+    
+    stats = router.stats()
+    assert stats['big']['active'] == 1 and stats['big']['waiting'] == 1
+    assert stats['small']['tasks'] == ['sql']
+    for thread in chats:
+        thread.join()
+    assert router.stats()['big']['queued'] == 1
+
+def test_tasks_sharing_a_model_share_slots():
+    """Test tasks on one model share its limit and unset tasks get their own"""
+    router = ModelRouter({'sql': 'small', 'format': 'small'}, limits={'sql': 8, 'format': 2})
+    assert router.slots('sql') is router.slots('format')
+    assert router.slots('sql').limit == 8
+    assert router.slots('chat') is not router.slots('summary')
+    assert router.slots('chat').limit == 4
+
+def test_slots_serve_threads_and_coroutines_in_order():
+    """Test waiters are served FIFO whether they block or await"""
+    slots = ModelSlots('m', limit=1)
+    order = []
+    
+    async def run():
+        slots.acquire()
+        waiter = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        thread = threading.Thread(target=lambda: (slots.acquire(), order.append('thread'), slots.release()))
+        thread.start()
+        while slots.waiting < 2:
+            await asyncio.sleep(0.01)
+        
+        # A cancelled waiter gives up its place
+        cancelled = asyncio.ensure_future(slots.acquire_async())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        
+        slots.release()
+        await waiter
+        order.append('coroutine')
+        slots.release()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+    
+    asyncio.run(run())
+    assert order == ['coroutine', 'thread']
+    assert slots.stats()['active'] == 0
+    assert slots.stats()['waiting'] == 0
+
+def test_async_client_holds_a_slot_per_stream():
+    """Test the async client queues streams beyond the model's limit"""
+    from aiohttp import web
+    router = ModelRouter({'chat': 'big'}, limits={'big': 1})
+    peak = []
+    
+    async def completions(request):
+        peak.append(router.stats()['big']['active'])
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep(0.05)
+        await response.write(b'data: {"choices": [{"delta": {"content": "ok"}}]}\n\ndata: [DONE]\n\n')
+        return response
+    
+    async def run():
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        client = AsyncLMStudioClient(f"http://127.0.0.1:{port}/v1", model_router=router)
+        try:
+            async def one():
+                return [chunk async for chunk in client.generate_stream("hi")]
+            return await asyncio.gather(*[one() for _ in range(3)])
+        finally:
+            await client.close()
+            await runner.cleanup()
+    
+    assert asyncio.run(run()) == [['ok']] * 3
+    assert peak == [1, 1, 1]
+    assert router.stats()['big']['queued'] == 2
@@ -2,17 +2,134 @@
 import pytest
 from server.music import MusicQueryProcessor
 
-def test_sql_generation(db):
+def _catalogue(tmp_path):
+    import sqlite3
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE music (album TEXT, artist TEXT, composer TEXT, year INTEGER, genre TEXT)")
+    return db_path
+
+def test_sql_generation(db, tmp_path):
     """Test SQL query generation"""
-    processor = MusicQueryProcessor()
+    processor = MusicQueryProcessor(_catalogue(tmp_path))
     query = "Find albums by Beatles"
     sql = processor.generate_sql(query)
     assert 'SELECT' in sql.upper()
     assert 'FROM music' in sql.lower()
     assert 'beatles' in sql.lower()
 
-def test_sql_validation(db):
+def test_sql_validation(db, tmp_path):
     """Test SQL query validation"""
-    processor = MusicQueryProcessor()
+    processor = MusicQueryProcessor(_catalogue(tmp_path))
     with pytest.raises(Exception):
         processor._validate_and_clean_sql("DROP TABLE music")
+
+def test_sql_translation_cache_and_templates(tmp_path):
+    """Test that repeated and same-shaped questions skip the LLM"""
+    from unittest.mock import MagicMock
+    processor = MusicQueryProcessor(_catalogue(tmp_path))
+    processor.llm_client.generate = MagicMock(side_effect=lambda prompt, **kwargs: (
+        "SELECT album FROM music WHERE LOWER(artist) LIKE '%beatles%'"
+        if 'Beatles' in prompt else
+        "SELECT album FROM music WHERE LOWER(artist) LIKE '%abba%'"
+    ))
+    
+    processor.generate_sql("Albums by Beatles")
+    processor.generate_sql("albums by  beatles?")
+    processor.generate_sql("Albums by ABBA")
+    sql = processor.generate_sql("Albums by Queen")
+    
+    assert sql == "SELECT album FROM music WHERE LOWER(artist) LIKE '%queen%'"
+    assert processor.llm_client.generate.call_count == 2
+    stats = processor.translation_stats()
+    assert stats['cache_hits'] == 1
+    assert stats['template_hits'] == 1
+    assert stats['llm_calls_saved'] == 2
+
+def test_results_are_capped_for_prompt(tmp_path):
+    """Test that large result sets are capped before reaching the LLM"""
+    import sqlite3
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE music (album TEXT, artist TEXT, year INTEGER)")
+        conn.executemany("INSERT INTO music VALUES (?, ?, ?)",
+                         [(f"Album {i}", "Artist", 2000 + i % 20) for i in range(500)])
+    
+    processor = MusicQueryProcessor(db_path)
+    results, truncated = processor.fetch_results("SELECT album, year FROM music", max_rows=100)
+    assert len(results) == 100
+    assert truncated
+    
+    prompt = processor.format_results(results, "list albums", truncated)
+    assert 'The user asked: list albums' in prompt
+    assert 'Album 29 |' in prompt
+    assert 'Album 30 |' not in prompt
+    assert 'partial' in prompt
+
+def test_nl_to_sql_uses_the_completion_cache(tmp_path, monkeypatch):
+    """Test that NL-to-SQL requests are deterministic and cacheable"""
+    from unittest.mock import MagicMock
+    from server.cache import CompletionCache
+    cache = CompletionCache(max_entries=4, ttl=60)
+    post = MagicMock()
+    post.return_value.json.return_value = {
+        'choices': [{'message': {'content': "SELECT album FROM music WHERE artist LIKE '%abba%'"}}]
+    }
+    # Separate processors, so their SQL caches cannot answer for each other
+    db_path = _catalogue(tmp_path)
+    for _ in range(2):
+        processor = MusicQueryProcessor(db_path)
+        processor.llm_client.cache = cache
+        monkeypatch.setattr(processor.llm_client.session, 'post', post)
+        assert processor.generate_sql("albums by abba") == "SELECT album FROM music WHERE artist LIKE '%abba%'"
+    assert post.call_count == 1
+    assert post.call_args.kwargs['json']['temperature'] == 0
+    assert cache.hits == 1
+
+def test_speculative_sql_first_valid_wins(tmp_path):
+    """Test racing candidates: bad SQL is rejected and the slow one cancelled"""
+    import threading
+    import time
+    processor = MusicQueryProcessor(_catalogue(tmp_path), sql_candidates=3)
+    closed = threading.Event()
+    
+    temperatures = []
+    
+    def generate_stream(prompt, temperature=None, **kwargs):
+        temperatures.append(temperature)
+        if temperature == 0:
+            # The plain prompt answers first, naming a missing column
+            yield "SELECT title FROM music WHERE artist LIKE '%abba%'"
+        elif temperature < 0.3:
+            time.sleep(0.1)
+            yield "SELECT album FROM music WHERE artist LIKE '%abba%'"
+        else:
+            try:
+                for _ in range(50):
+                    time.sleep(0.02)
+                    yield "SELECT "
+            finally:
+                closed.set()
+    processor.llm_client.generate_stream = generate_stream
+    
+    started = time.monotonic()
+    sql = processor.generate_sql("albums by abba")
+    assert sql == "SELECT album FROM music WHERE artist LIKE '%abba%'"
+    assert time.monotonic() - started < 0.5
+    assert closed.wait(1)
+    # The plain candidate is deterministic; the hinted ones sample
+    assert sorted(temperatures) == [0, 0.2, 0.4]
+    
+    stats = processor.translation_stats()['speculative']
+    assert stats['runs'] == 1
+    assert stats['winner_not_first'] == 1
+    assert stats['first_finished_rejected'] == 1
+    assert stats['winner_not_first_ratio'] == 1.0
+
+def test_speculative_sql_all_invalid(tmp_path):
+    """Test the music request fails only when every candidate is invalid"""
+    processor = MusicQueryProcessor(_catalogue(tmp_path), sql_candidates=2)
+    processor.llm_client.generate_stream = lambda prompt, **kwargs: (chunk for chunk in ["DROP TABLE music"])
+    with pytest.raises(Exception, match="none of 2 candidates.*Must start with SELECT"):
+        processor.generate_sql("delete everything")
+    assert processor.translation_stats()['speculative']['failed'] == 1
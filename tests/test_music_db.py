@@ -0,0 +1,50 @@
+# tests/test_music_db.py
+import sqlite3
+import pytest
+from server.music_db import MusicDataSource, QueryTimeoutError
+
+@pytest.fixture
+def music_db(tmp_path):
+    """Create a small music database file"""
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE music (album TEXT, artist TEXT, year INTEGER)")
+        conn.executemany("INSERT INTO music VALUES (?, ?, ?)",
+                         [(f"Album {i}", f"Artist {i % 7}", 1990 + i % 30) for i in range(1000)])
+    return db_path
+
+def test_connections_are_pooled_and_read_only(music_db):
+    """Test connection reuse, WAL mode and that writes are refused"""
+    source = MusicDataSource(music_db, pool_size=2)
+    list(source.stream("SELECT * FROM music LIMIT 1"))
+    with source.connection() as first:
+        pass
+    with source.connection() as second:
+        assert second is first
+        assert second.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    
+    with pytest.raises(sqlite3.Error):
+        list(source.stream("DELETE FROM music"))
+    source.close()
+
+def test_row_cap_and_timeout(music_db):
+    """Test the hard row cap and the per-query time budget"""
+    source = MusicDataSource(music_db, max_rows=50)
+    assert len(list(source.stream("SELECT * FROM music"))) == 50
+    assert len(list(source.stream("SELECT * FROM music", max_rows=10))) == 10
+    
+    runaway = ("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) "
+               "SELECT count(*) FROM n")
+    with pytest.raises(QueryTimeoutError):
+        list(source.stream(runaway, timeout=0.05))
+    # The pool still works after an interrupted query
+    assert len(list(source.stream("SELECT * FROM music", max_rows=3))) == 3
+
+def test_missing_database_is_not_created(tmp_path):
+    """Test a wrong path fails instead of creating an empty catalogue"""
+    db_path = tmp_path / 'missing.db'
+    source = MusicDataSource(str(db_path))
+    with pytest.raises(sqlite3.Error):
+        list(source.stream("SELECT 1"))
+    assert not db_path.exists()
+    assert not (tmp_path / 'missing.db-wal').exists()
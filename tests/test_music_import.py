@@ -0,0 +1,74 @@
+# tests/test_music_import.py
+import io
+import json
+import sqlite3
+from server.music_db import MusicDataSource
+from server.music_import import MusicImporter
+from server.music_index import MusicCatalogIndex
+
+CSV_DATA = """album,artist,composer,year,genre
+Kind of Blue,Miles Davis,,1959,Jazz
+Abbey Road,The Beatles,Lennon-McCartney,1969,Rock
+Kind of Blue,Miles Davis,,1959,Jazz
+,Nobody,,2000,Pop
+"""
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT album, artist, year, genre FROM music ORDER BY album").fetchall()
+
+def test_csv_import_dedupes_and_indexes(tmp_path):
+    """Test batched import, dedupe on (album, artist) and index rebuild"""
+    db_path = str(tmp_path / 'music.db')
+    stats = MusicImporter(db_path, batch_size=2).import_stream(io.StringIO(CSV_DATA), 'csv')
+    assert stats['rows'] == 3 and stats['skipped'] == 1
+    assert stats['rows_per_sec'] > 0
+    assert _rows(db_path) == [('Abbey Road', 'The Beatles', 1969, 'Rock'),
+                              ('Kind of Blue', 'Miles Davis', 1959, 'Jazz')]
+    
+    with sqlite3.connect(db_path) as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_music_year', 'ix_music_genre', 'ix_music_artist', 'ux_music_album_artist'} <= indexes
+    catalog = MusicCatalogIndex(MusicDataSource(db_path))
+    assert [r['album'] for r in catalog.search('beatles')] == ['Abbey Road']
+    catalog.data_source.close()
+
+def test_reimport_only_writes_changes(tmp_path):
+    """Test that re-importing a catalogue upserts incrementally"""
+    db_path = str(tmp_path / 'music.db')
+    importer = MusicImporter(db_path)
+    importer.import_stream(io.StringIO(CSV_DATA), 'csv')
+    
+    lines = [
+        {'album': 'Kind of Blue', 'artist': 'Miles Davis', 'year': 1959, 'genre': 'Modal Jazz'},
+        {'album': 'Abbey Road', 'artist': 'The Beatles', 'composer': 'Lennon-McCartney',
+         'year': 1969, 'genre': 'Rock'},
+        {'album': 'Blue Train', 'artist': 'John Coltrane', 'year': '1958'},
+    ]
+    data = '\n'.join(json.dumps(line) for line in lines) + '\nnot json\n'
+    stats = importer.import_stream(io.StringIO(data), 'jsonl')
+    assert stats == {**stats, 'rows': 3, 'written': 2, 'unchanged': 1, 'skipped': 1}
+    assert ('Kind of Blue', 'Miles Davis', 1959, 'Modal Jazz') in _rows(db_path)
+    assert ('Blue Train', 'John Coltrane', 1958, None) in _rows(db_path)
+
+def test_import_api_streams_request_body(client, authenticated_user, app, tmp_path):
+    """Test importing through the API from a raw request body"""
+    app.config['MUSIC_DB_PATH'] = str(tmp_path / 'music.db')
+    app.config['MUSIC_IMPORT_ADMINS'] = ['testuser']
+    response = client.post('/api/music/import?format=csv', data=CSV_DATA.encode(),
+                           content_type='text/csv')
+    assert response.status_code == 200
+    assert response.json['rows'] == 3
+    assert client.post('/api/music/import?format=xml', data=b'').status_code == 400
+
+def test_import_api_requires_admin(client, authenticated_user, app, tmp_path):
+    """Test that users not listed as import admins are refused"""
+    db_path = tmp_path / 'music.db'
+    app.config['MUSIC_DB_PATH'] = str(db_path)
+    response = client.post('/api/music/import?format=csv', data=CSV_DATA.encode(),
+                           content_type='text/csv')
+    assert response.status_code == 403
+    app.config['MUSIC_IMPORT_ADMINS'] = ['someone-else']
+    assert client.post('/api/music/import?format=csv', data=CSV_DATA.encode(),
+                       content_type='text/csv').status_code == 403
+    assert not db_path.exists()
@@ -0,0 +1,71 @@
+# tests/test_music_index.py
+import sqlite3
+import pytest
+from server.music_db import MusicDataSource
+from server.music_index import MusicCatalogIndex, match_expression
+
+@pytest.fixture
+def catalog(tmp_path):
+    """Create and index a small music catalogue"""
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        MusicCatalogIndex.ensure_schema(conn)
+        conn.executemany(
+            "INSERT INTO music (album, artist, composer, year, genre) VALUES (?, ?, ?, ?, ?)",
+            [("Kind of Blue", "Miles Davis", None, 1959, "Jazz"),
+             ("Bitches Brew", "Miles Davis", None, 1970, "Jazz"),
+             ("Café Tacvba", "Café Tacvba", None, 1992, "Rock"),
+             ("Abbey Road", "The Beatles", "Lennon-McCartney", 1969, "Rock")])
+    assert MusicCatalogIndex.rebuild(db_path) == {'rows': 4, 'facet_values': 10}
+    source = MusicDataSource(db_path)
+    yield MusicCatalogIndex(source)
+    source.close()
+
+def test_match_expression():
+    """Test that search text becomes quoted, prefix-matched terms"""
+    assert match_expression('Miles "Dav') == '"miles" "dav"*'
+    assert match_expression('beatles', 'artist') == 'artist: ("beatles"*)'
+
+def test_search_folds_case_and_diacritics(catalog):
+    """Test direct lookups by text, genre and year"""
+    assert [r['album'] for r in catalog.search('cafe')] == ['Café Tacvba']
+    assert {r['album'] for r in catalog.search('MILES', genre='jazz')} == {'Kind of Blue', 'Bitches Brew'}
+    assert [r['album'] for r in catalog.search(genre='ROCK', year=1969)] == ['Abbey Road']
+    assert catalog.search() == []
+
+def test_facets_are_precomputed(catalog):
+    """Test facet counts, most common first"""
+    assert catalog.facets('genre') == [{'value': 'Jazz', 'count': 2}, {'value': 'Rock', 'count': 2}]
+    with pytest.raises(ValueError):
+        catalog.facets('album')
+
+def test_generated_sql_is_rewritten_to_use_indexes(catalog):
+    """Test that LIKE scans become index lookups with the same answers"""
+    sql = catalog.optimize_sql(
+        "SELECT album FROM music WHERE LOWER(artist) LIKE '%miles davis%' AND LOWER(genre) = 'jazz'")
+    assert 'music_fts MATCH' in sql and "genre = 'jazz' COLLATE NOCASE" in sql
+    assert {r['album'] for r in catalog.data_source.stream(sql)} == {'Kind of Blue', 'Bitches Brew'}
+    
+
+def test_rewritten_sql_plans_use_indexes(tmp_path):
+    """Test query plans once the catalogue is large enough to matter"""
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        MusicCatalogIndex.ensure_schema(conn)
+        conn.executemany(
+            "INSERT INTO music (album, artist, year, genre) VALUES (?, ?, ?, ?)",
+            [(f"Album {i}", f"Artist {i}", 1950 + i % 70, ('Jazz', 'Rock', 'Pop')[i % 3])
+             for i in range(3000)])
+    MusicCatalogIndex.rebuild(db_path)
+    catalog = MusicCatalogIndex(MusicDataSource(db_path))
+    
+    for question_sql, index in [
+        ("SELECT album FROM music WHERE LOWER(artist) LIKE '%artist 12%'", 'INTEGER PRIMARY KEY'),
+        ("SELECT album FROM music WHERE LOWER(genre) = 'jazz'", 'ix_music_genre'),
+        ("SELECT album FROM music WHERE year = 1960", 'ix_music_year'),
+    ]:
+        sql = catalog.optimize_sql(question_sql)
+        plan = [row['detail'] for row in catalog.data_source.stream(f"EXPLAIN QUERY PLAN {sql}")]
+        assert any(index in step for step in plan), plan
+        assert 'SCAN music' not in plan
+    catalog.data_source.close()
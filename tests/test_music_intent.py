@@ -0,0 +1,67 @@
+# tests/test_music_intent.py
+import sqlite3
+import pytest
+from server.music import MusicQueryProcessor
+from server.music_index import MusicCatalogIndex
+
+@pytest.fixture
+def processor(tmp_path):
+    """Create a music processor over a small indexed catalogue"""
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        MusicCatalogIndex.ensure_schema(conn)
+        conn.executemany(
+            "INSERT INTO music (album, artist, composer, year, genre) VALUES (?, ?, ?, ?, ?)",
+            [("Kind of Blue", "Miles Davis", None, 1959, "Jazz"),
+             ("Bitches Brew", "Miles Davis", None, 1970, "Jazz"),
+             ("Abbey Road", "The Beatles", "Lennon-McCartney", 1969, "Rock")])
+    MusicCatalogIndex.rebuild(db_path)
+    processor = MusicQueryProcessor(db_path)
+    yield processor
+    processor.data_source.close()
+
+@pytest.mark.parametrize('question, intent, reply', [
+    ("How many albums do we have?", 'count', "There are 3 albums in the catalogue."),
+    ("how many jazz albums", 'count', "There are 2 albums in the jazz genre in the catalogue."),
+    ("How many artists are there", 'count', "There are 2 artists in the catalogue."),
+    ("how many albums by miles davis?", 'count', "There are 2 albums by miles davis in the catalogue."),
+    ("List genres", 'list', "Found 2 genres:\n- Jazz\n- Rock"),
+    ("show me albums from 1969", 'filter', "Found 1 album from 1969:\n- Abbey Road (The Beatles, 1969)"),
+    ("albums by the beatles", 'filter', "Found 1 album by the beatles:\n- Abbey Road (The Beatles, 1969)"),
+    ("albums of the beatles", 'filter', "Found 1 album by the beatles:\n- Abbey Road (The Beatles, 1969)"),
+    ("albums of jazz", 'filter',
+     "Found 2 albums in the jazz genre:\n- Kind of Blue (Miles Davis, 1959)\n- Bitches Brew (Miles Davis, 1970)"),
+    ("how many albums of miles davis", 'count', "There are 2 albums by miles davis in the catalogue."),
+])
+def test_simple_questions_skip_the_llm(processor, question, intent, reply):
+    """Test that fast-path questions are answered by prebuilt queries"""
+    assert processor.router.route(question).intent == intent
+    results, truncated, text = processor.answer_directly(question, max_rows=10)
+    assert text == reply
+    assert not truncated
+
+def test_other_questions_fall_back_to_the_llm(processor):
+    """Test that unmatched or multi-field questions are left to the LLM"""
+    assert processor.answer_directly("how many great albums", 10) is None
+    assert processor.answer_directly("which jazz album is the longest", 10) is None
+    assert processor.answer_directly("jazz albums from 1959", 10) is None
+    processor.answer_directly("list genres", 10)
+    
+    stats = processor.translation_stats()
+    assert stats['fast_path'] == 1 and stats['fallback'] == 3
+    assert stats['fast_path_ratio'] == 0.25
+
+def test_ambiguous_filters_fall_back_to_the_llm(processor):
+    """Test that multi-field values and unmatched names are left to the LLM"""
+    assert processor.router.route("albums by beatles in 1969") is None
+    assert processor.router.route("how many albums by miles davis composed by someone") is None
+    
+    # Routed, but a name that matches nothing may have been misread
+    assert processor.router.route("albums by the rolling stones").field == 'artist'
+    assert processor.answer_directly("albums by the rolling stones", 10) is None
+    assert processor.answer_directly("how many albums of the rolling stones", 10) is None
+    # A year is taken as asked, so an empty answer is still an answer
+    assert processor.answer_directly("albums from 1990", 10)[2] == "No albums from 1990 found in the catalogue."
+    
+    stats = processor.translation_stats()
+    assert stats['fallback'] == 4 and stats['fast_path'] == 2
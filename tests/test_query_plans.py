@@ -0,0 +1,90 @@
+# tests/test_query_plans.py
+import time
+from sqlalchemy import inspect, text
+from server.chat import ChatManager
+from server.database import Chat, Message
+from server.migrations import current_version, MIGRATIONS
+
+def explain(db, query):
+    """Get SQLite's query plan for an ORM query"""
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+    return ' / '.join(row[-1] for row in rows)
+
+def test_schema_is_migrated(db):
+    """Test that a fresh database records the latest migration"""
+    assert current_version(db.engine) == MIGRATIONS[-1][0]
+
+def test_search_index_is_created_once_fts5_is_available(db, monkeypatch):
+    """Test that a database migrated without FTS5 gets the index later"""
+    from server.migrations import upgrade
+    from server.search import SearchIndex
+    fts5 = {'compiled': False}
+    monkeypatch.setattr(SearchIndex, '_probe_fts5', staticmethod(lambda bind: fts5['compiled']))
+    db.session.execute(text(f"DROP TABLE {SearchIndex.TABLE}"))
+    db.session.commit()
+    
+    monkeypatch.setattr(SearchIndex, '_fts5', {})
+    assert upgrade(db.engine) == []
+    assert not inspect(db.engine).has_table(SearchIndex.TABLE)
+    
+    # Same database on a build with FTS5
+    fts5['compiled'] = True
+    monkeypatch.setattr(SearchIndex, '_fts5', {})
+    assert upgrade(db.engine) == []
+    assert inspect(db.engine).has_table(SearchIndex.TABLE)
+
+def test_user_chats_use_index(seeded_db, db):
+    """Test that the sidebar query is an index range scan in order"""
+    query = Chat.query.filter_by(user_id=seeded_db['users']).order_by(Chat.created_at.desc())
+    plan = explain(db, query)
+    assert 'ix_chat_user_id_created_at' in plan
+    assert 'TEMP B-TREE' not in plan
+    
+    started = time.perf_counter()
+    chats = ChatManager.get_user_chats(seeded_db['users'])
+    elapsed = time.perf_counter() - started
+    assert chats[0].created_at > chats[-1].created_at
+    print(f"get_user_chats over {seeded_db['chats']} chats: {elapsed * 1000:.2f} ms")
+
+def test_chat_messages_use_index(seeded_db, db):
+    """Test that loading a chat's messages is an ordered index range scan"""
+    query = Message.query.filter_by(chat_id=1).order_by(Message.timestamp, Message.id)
+    plan = explain(db, query)
+    assert 'ix_message_chat_id_timestamp' in plan
+    assert 'TEMP B-TREE' not in plan
+    
+    started = time.perf_counter()
+    messages = ChatManager.get_chat(1, 1).messages
+    elapsed = time.perf_counter() - started
+    assert [m.timestamp for m in messages] == sorted(m.timestamp for m in messages)
+    print(f"chat.messages over {seeded_db['messages']} messages: {elapsed * 1000:.2f} ms")
+
+def test_message_pages_use_index(seeded_db, db):
+    """Test that older-history pages are ordered index range scans"""
+    from sqlalchemy import tuple_
+    cursor = db.session.query(Message.timestamp, Message.id).filter_by(chat_id=1).all()[-1]
+    query = (Message.query.filter(Message.chat_id == 1)
+             .filter(tuple_(Message.timestamp, Message.id) < tuple_(*cursor))
+             .order_by(Message.timestamp.desc(), Message.id.desc())
+             .limit(51))
+    plan = explain(db, query)
+    assert 'ix_message_chat_id_timestamp' in plan
+    assert 'TEMP B-TREE' not in plan
+    
+    page, has_more = ChatManager.get_messages(1, before_id=cursor.id, limit=5)
+    assert len(page) == 5
+    assert page[-1].id < cursor.id
+
+def test_chat_summaries_use_index(seeded_db, db):
+    """Test that sidebar pages and their last-activity lookups use indexes"""
+    summaries, has_more = ChatManager.get_chat_summaries(seeded_db['users'], limit=5)
+    assert len(summaries) == 5
+    
+    sql = ("SELECT chat.id, (SELECT max(message.timestamp) FROM message "
+           "WHERE message.chat_id = chat.id) FROM chat WHERE chat.user_id = 1 "
+           "ORDER BY chat.created_at DESC, chat.id DESC LIMIT 31")
+    plan = ' / '.join(row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+    assert 'ix_chat_user_id_created_at' in plan
+    assert 'ix_message_chat_id_timestamp' in plan
+    assert 'TEMP B-TREE' not in plan
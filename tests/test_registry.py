@@ -0,0 +1,52 @@
+# tests/test_registry.py
+from server.registry import GenerationRegistry, LocalRegistryBackend
+
+def test_cancel_reaches_owning_worker():
+    """Test that a stop handled by one worker cancels another's generation"""
+    backend = LocalRegistryBackend()
+    dropped = []
+    worker_a = GenerationRegistry(backend, instance_id='a')
+    worker_b = GenerationRegistry(backend, instance_id='b', on_cancel=dropped.append)
+    cancelled = []
+    
+    job = worker_a.register(42, lambda: cancelled.append(42))
+    assert worker_b.live() == {'42': 'a'}
+    assert not worker_b.is_active(42)
+    
+    worker_b.cancel(42)
+    assert cancelled == [42]
+    assert '42' in dropped
+    
+    worker_a.unregister(42, job)
+    assert worker_a.live() == {}
+    assert worker_a.local_generations() == set()
+
+def test_unregister_keeps_other_owner():
+    """Test that a stale worker cannot remove a newer owner's entry"""
+    backend = LocalRegistryBackend()
+    worker_a = GenerationRegistry(backend, instance_id='a')
+    worker_b = GenerationRegistry(backend, instance_id='b')
+    job_a = worker_a.register(1, lambda: None)
+    worker_b.register(1, lambda: None)
+    worker_a.unregister(1, job_a)
+    assert backend.live() == {'1': 'b'}
+    # A job ID from another worker removes nothing
+    backend.remove('1', job_a, 'b')
+    assert backend.live() == {'1': 'b'}
+
+def test_overlapping_generations_in_one_chat():
+    """Test that finishing one job leaves a newer job in the chat stoppable"""
+    registry = GenerationRegistry(LocalRegistryBackend(), instance_id='a')
+    cancelled = []
+    first = registry.register(7, lambda: cancelled.append('first'))
+    second = registry.register(7, lambda: cancelled.append('second'))
+    
+    registry.unregister(7, first)
+    assert registry.is_active(7)
+    assert registry.live() == {'7': 'a'}
+    registry.cancel(7)
+    assert cancelled == ['second']
+    
+    registry.unregister(7, second)
+    assert not registry.is_active(7)
+    assert registry.live() == {}
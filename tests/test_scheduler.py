@@ -0,0 +1,160 @@
+# tests/test_scheduler.py
+import asyncio
+import pytest
+from server.scheduler import GenerationScheduler, QueueFullError
+
+def test_round_robin_across_users():
+    """Test that a burst from one user does not starve another"""
+    started = []
+    
+    async def run():
+        release = asyncio.Event()
+        scheduler = GenerationScheduler(max_concurrent=1)
+        
+        def job(name):
+            async def work():
+                started.append(name)
+                await release.wait()
+            return work
+        
+        for i in range(3):
+            scheduler.submit('alice', f'a{i}', job(f'a{i}'))
+        scheduler.submit('bob', 'b0', job('b0'))
+        
+        assert [job.chat_id for job, _ in scheduler.positions()] == ['a1', 'b0', 'a2']
+        release.set()
+        while scheduler.running or scheduler.queue_depth:
+            await asyncio.sleep(0)
+        return scheduler.stats()
+    
+    stats = asyncio.run(run())
+    assert started == ['a0', 'a1', 'b0', 'a2']
+    assert stats['started'] == 4
+    assert stats['queue_depth'] == 0
+
+def test_bounded_queue_and_positions():
+    """Test queue limits and position notifications"""
+    notified = []
+    
+    async def run():
+        scheduler = GenerationScheduler(
+            max_concurrent=1, max_queue_size=2, max_queue_per_user=5,
+            on_position=lambda job, position: notified.append((job.chat_id, position))
+        )
+        release = asyncio.Event()
+        for chat_id in (1, 2, 3):
+            scheduler.submit('alice', chat_id, release.wait)
+        with pytest.raises(QueueFullError):
+            scheduler.submit('bob', 4, release.wait)
+        assert scheduler.cancel(2) == 1
+        seen = list(notified)
+        release.set()
+        while scheduler.running or scheduler.queue_depth:
+            await asyncio.sleep(0)
+        return seen, scheduler.stats()
+    
+    seen, stats = asyncio.run(run())
+    assert (1, 0) in seen
+    assert (3, 2) in seen
+    assert seen[-1] == (3, 1)
+    assert stats['rejected'] == 1
+
+def test_lanes_have_separate_caps():
+    """Test a full chat lane does not hold back music jobs"""
+    started = []
+    
+    async def run():
+        release = asyncio.Event()
+        scheduler = GenerationScheduler(max_concurrent=3, lane_limits={'chat': 1})
+        
+        def job(name):
+            async def work():
+                started.append(name)
+                await release.wait()
+            return work
+        
+        scheduler.submit('alice', 'c0', job('c0'))
+        scheduler.submit('bob', 'c1', job('c1'))
+        for i in range(3):
+            scheduler.submit('carol', f'm{i}', job(f'm{i}'), lane='music')
+        await asyncio.sleep(0)
+        running = list(started)
+        positions = {job.chat_id: position for job, position in scheduler.positions()}
+        lanes = scheduler.stats()['lanes']
+        release.set()
+        while scheduler.running or scheduler.queue_depth:
+            await asyncio.sleep(0)
+        return running, positions, lanes
+    
+    running, positions, lanes = asyncio.run(run())
+    assert running == ['c0', 'm0', 'm1']
+    assert positions == {'c1': 1, 'm2': 1}
+    assert lanes == {'chat': {'running': 1, 'limit': 1}, 'music': {'running': 2, 'limit': 3}}
+    assert sorted(started) == ['c0', 'c1', 'm0', 'm1', 'm2']
+
+def test_lane_limits_stay_within_the_global_cap():
+    """Test that a lane's own limit never raises the total above max_concurrent"""
+    async def run():
+        release = asyncio.Event()
+        scheduler = GenerationScheduler(max_concurrent=2, lane_limits={'music': 8})
+        scheduler.submit('alice', 'c0', release.wait)
+        for i in range(3):
+            scheduler.submit('bob', f'm{i}', release.wait, lane='music')
+        await asyncio.sleep(0)
+        stats = scheduler.stats()
+        release.set()
+        while scheduler.running or scheduler.queue_depth:
+            await asyncio.sleep(0)
+        return stats
+    
+    stats = asyncio.run(run())
+    assert stats['running'] == 2
+    assert stats['queue_depth'] == 2
+    assert stats['lanes']['music']['limit'] == 2
+
+def test_stats_can_be_read_from_other_threads():
+    """Test that stats are a published snapshot, not a view of loop state"""
+    import threading
+    scheduler = GenerationScheduler(max_concurrent=2)
+    errors = []
+    done = threading.Event()
+    
+    def read():
+        while not done.is_set():
+            try:
+                scheduler.stats()
+                scheduler.queue_depth + scheduler.running
+            except Exception as e:
+                errors.append(e)
+    
+    async def run():
+        for i in range(500):
+            scheduler.submit(f'user{i % 7}', i, lambda: asyncio.sleep(0))
+            await asyncio.sleep(0)
+        while scheduler.running or scheduler.queue_depth:
+            await asyncio.sleep(0)
+    
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        asyncio.run(run())
+    finally:
+        done.set()
+        reader.join()
+    assert errors == []
+    stats = scheduler.stats()
+    assert stats['started'] == 500
+    # Callers get a copy they can change freely
+    stats['lanes']['chat'] = None
+    assert scheduler.stats()['lanes'] == {}
+
+def test_queue_stats_endpoint_requires_admin(app, client, authenticated_user):
+    """Test that server-wide queue statistics are only shown to admins"""
+    response = client.get('/api/generation/queue')
+    assert response.status_code == 403
+    assert 'backends' not in response.json
+    
+    app.config['GENERATION_STATS_ADMINS'] = ['testuser']
+    response = client.get('/api/generation/queue')
+    assert response.status_code == 200
+    assert 'queue_depth' in response.json
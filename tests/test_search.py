@@ -0,0 +1,100 @@
+# tests/test_search.py
+import time
+from server.chat import ChatManager
+from server.search import search_index, build_match_query, HIGHLIGHT_START, HIGHLIGHT_END
+
+def test_match_query_quotes_user_input():
+    """Test that FTS5 syntax in search text is treated as plain words"""
+    assert build_match_query('jazz OR "blues', 7) == 'owner:u7 AND content:("jazz" "or" "blues"*)'
+    assert build_match_query('  ?! ', 7) == ''
+
+def test_search_is_ranked_and_scoped_to_user(db, authenticated_user):
+    """Test that users find only their own messages, with highlights"""
+    from server.auth import AuthManager
+    other = AuthManager.create_user('other', 'password123')
+    mine = ChatManager.create_chat(authenticated_user.id, title='Mine')
+    theirs = ChatManager.create_chat(other.id, title='Theirs')
+    ChatManager.add_message(mine.id, "I like jazz piano", is_user=True)
+    ChatManager.add_message(mine.id, "jazz jazz jazz everywhere", is_user=False)
+    ChatManager.add_message(theirs.id, "jazz for them", is_user=True)
+    
+    results = search_index.search(authenticated_user.id, 'jaz')
+    assert [r['chat_title'] for r in results] == ['Mine', 'Mine']
+    assert results[0]['snippet'].startswith(f"{HIGHLIGHT_START}jazz{HIGHLIGHT_END}")
+    assert not search_index.pending
+
+def test_streamed_reply_is_indexed_once_on_completion(db, authenticated_user):
+    """Test that chunk writes do not reindex until the reply is marked"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    reply = ChatManager.add_message(chat.id, "", is_user=False)
+    ChatManager.update_message(reply.id, "partial saxophone")
+    assert search_index.search(authenticated_user.id, 'saxophone') == []
+    
+    search_index.mark(reply.id)
+    assert len(search_index.search(authenticated_user.id, 'saxophone')) == 1
+
+def test_deleted_chat_leaves_index(db, authenticated_user):
+    """Test that deleting a chat removes its messages from results"""
+    chat = ChatManager.create_chat(authenticated_user.id)
+    ChatManager.add_message(chat.id, "trumpet", is_user=True)
+    assert search_index.search(authenticated_user.id, 'trumpet')
+    ChatManager.delete_chat(chat.id, authenticated_user.id)
+    assert search_index.search(authenticated_user.id, 'trumpet') == []
+
+def test_search_api(client, authenticated_user):
+    """Test the search endpoint"""
+    chat = ChatManager.create_chat(authenticated_user.id, title='Music')
+    ChatManager.add_message(chat.id, "recommend some bebop", is_user=True)
+    response = client.get('/api/search?q=bebop')
+    assert response.status_code == 200
+    assert response.json['results'][0]['chat_id'] == chat.id
+    assert client.get('/api/search').status_code == 400
+
+def test_search_api_hides_database_errors(client, authenticated_user, monkeypatch):
+    """Test that a failing search returns a generic error, not the exception"""
+    def fail(*args, **kwargs):
+        raise Exception("no such table: message_fts")
+    monkeypatch.setattr(search_index, 'search', fail)
+    response = client.get('/api/search?q=bebop')
+    assert response.status_code == 503
+    assert 'message_fts' not in response.get_data(as_text=True)
+
+def test_search_latency(seeded_db, db):
+    """Benchmark ranked search over the seeded messages"""
+    from server.search import SearchIndex
+    with db.engine.begin() as conn:
+        SearchIndex.rebuild(conn)
+    
+    started = time.perf_counter()
+    results = search_index.search(1, 'of chat 3', limit=20)
+    elapsed = time.perf_counter() - started
+    assert results and all(r['chat_id'] <= seeded_db['chats'] // seeded_db['users'] for r in results)
+    # ~170 ms at 1M messages; the bound leaves room for slow CI machines
+    assert elapsed < 1.0, f"search over {seeded_db['messages']} messages took {elapsed * 1000:.0f} ms"
+
+def test_search_falls_back_to_like_without_fts5(db, authenticated_user, monkeypatch):
+    """Test that SQLite builds without FTS5 are searched with LIKE"""
+    from server.search import SearchIndex
+    chat = ChatManager.create_chat(authenticated_user.id, title='Music')
+    ChatManager.add_message(chat.id, "Some Bebop records", is_user=True)
+    ChatManager.add_message(chat.id, "more bebop and swing", is_user=False)
+    ChatManager.add_message(chat.id, "only swing", is_user=True)
+    
+    monkeypatch.setattr(SearchIndex, '_fts5', {})
+    monkeypatch.setattr(SearchIndex, '_probe_fts5', staticmethod(lambda bind: False))
+    assert not SearchIndex.available(db.engine)
+    results = search_index.search(authenticated_user.id, 'bebop')
+    assert [r['snippet'] for r in results] == [
+        f"more {HIGHLIGHT_START}bebop{HIGHLIGHT_END} and swing",
+        f"Some {HIGHLIGHT_START}Bebop{HIGHLIGHT_END} records"
+    ]
+    assert search_index.search(authenticated_user.id + 1, 'bebop') == []
+
+def test_fts5_probe_is_cached(db):
+    """Test that FTS5 support is probed once per database"""
+    from server.search import SearchIndex
+    SearchIndex._fts5.clear()
+    assert SearchIndex.available(db.engine)
+    with db.engine.connect() as conn:
+        assert SearchIndex.available(conn)
+    assert list(SearchIndex._fts5.values()) == [True]
@@ -0,0 +1,90 @@
+# tests/test_streaming.py
+import asyncio
+import pytest
+from server.streaming import BackgroundWriter, MessageBuffer, ChunkCoalescer
+
+def test_message_buffer_batches_writes():
+    """Test that chunks are written in batches, not one write per chunk"""
+    writes = []
+    buffer = MessageBuffer(7, lambda message_id, text: writes.append((message_id, text)),
+                           flush_interval=3600, flush_chars=10)
+    for chunk in ['ab', 'cd', 'ef', 'gh', 'ij', 'kl']:
+        buffer.append(chunk)
+    
+    assert writes == [(7, 'abcdefghij')]
+    buffer.flush()
+    assert writes[-1] == (7, 'abcdefghijkl')
+    buffer.flush()
+    assert len(writes) == 2
+
+def test_message_buffer_flushes_on_interval():
+    """Test that a slow stream is still persisted periodically"""
+    writes = []
+    buffer = MessageBuffer(1, lambda message_id, text: writes.append(text),
+                           flush_interval=0, flush_chars=10000)
+    buffer.append('a')
+    buffer.append('b')
+    assert writes == ['a', 'ab']
+
+def test_background_writer_keeps_only_the_newest_pending_text():
+    """Test that writes run in order and superseded texts are skipped"""
+    writes = []
+    
+    async def write(message_id, text):
+        await asyncio.sleep(0.01)
+        writes.append(text)
+    
+    async def run():
+        writer = BackgroundWriter(write)
+        writer(1, 'a')
+        await asyncio.sleep(0)
+        # Queued while 'a' is being written; only the newest survives
+        for text in ['ab', 'abc', 'abcd']:
+            writer(1, text)
+        await writer.wait()
+        return writer
+    
+    writer = asyncio.run(run())
+    assert writes == ['a', 'abcd']
+    assert writer.writes == 2
+
+def test_background_writer_reports_errors():
+    """Test that a failed write is raised by wait()"""
+    async def write(message_id, text):
+        raise ValueError("locked")
+    
+    async def run():
+        writer = BackgroundWriter(write)
+        writer(1, 'a')
+        await writer.wait()
+    
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+def test_chunk_coalescer_sends_first_token_immediately():
+    """Test that the first delta is its own frame and the rest are grouped"""
+    frames = []
+    coalescer = ChunkCoalescer(frames.append, window=3600, max_bytes=8)
+    for chunk in ['Hi', ' th', 'er', 'e ', 'you', '!']:
+        coalescer.append(chunk)
+    
+    assert frames == ['Hi', ' there you']
+    coalescer.flush()
+    assert frames == ['Hi', ' there you', '!']
+    assert coalescer.chunks_in == 6
+    assert coalescer.frames_out == 3
+
+def test_chunk_coalescer_timer_flushes_stalled_stream():
+    """Test that pending deltas are sent when the window closes"""
+    import asyncio
+    frames = []
+    
+    async def run():
+        coalescer = ChunkCoalescer(frames.append, window=0.01, max_bytes=1024)
+        for chunk in ['a', 'b', 'c']:
+            coalescer.append(chunk)
+        assert frames == ['a']
+        await asyncio.sleep(0.05)
+    
+    asyncio.run(run())
+    assert frames == ['a', 'bc']
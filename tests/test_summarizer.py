@@ -0,0 +1,54 @@
+# tests/test_summarizer.py
+from unittest.mock import MagicMock
+from server.chat import ChatManager
+from server.context import ContextBuilder
+from server.summarizer import ConversationSummarizer
+
+def _chat_with_turns(user_id, turns):
+    chat = ChatManager.create_chat(user_id)
+    for i in range(turns):
+        ChatManager.add_message(chat.id, f"question {i}", is_user=True)
+        ChatManager.add_message(chat.id, f"answer {i}", is_user=False)
+    return chat
+
+def test_summary_is_extended_incrementally(db, authenticated_user):
+    """Test that each fold sends the previous summary plus only new turns"""
+    chat = _chat_with_turns(authenticated_user.id, 10)
+    llm = MagicMock()
+    llm.generate.side_effect = ["first summary", "second summary"]
+    summarizer = ConversationSummarizer(llm, threshold=4, keep_recent=4)
+    
+    assert summarizer.needs_summary(chat.id)
+    assert summarizer.summarize(chat.id)
+    summary, through_id = summarizer.get_summary(chat.id)
+    assert summary == "first summary"
+    assert not summarizer.needs_summary(chat.id)
+    
+    for i in range(10, 13):
+        ChatManager.add_message(chat.id, f"question {i}", is_user=True)
+        ChatManager.add_message(chat.id, f"answer {i}", is_user=False)
+    assert summarizer.summarize(chat.id)
+    prompt = llm.generate.call_args[0][0]
+    assert "first summary" in prompt
+    assert "question 8" in prompt and "question 7" not in prompt
+    assert "question 11" not in prompt  # still among the kept recent turns
+    assert summarizer.get_summary(chat.id)[1] > through_id
+
+def test_builder_skips_turns_covered_by_stored_summary(db, authenticated_user):
+    """Test that summarized turns are replaced by the stored summary"""
+    chat = _chat_with_turns(authenticated_user.id, 3)
+    covered = chat.messages[3].id  # through "answer 1"
+    builder = ContextBuilder(token_budget=1000, strategy='summary',
+                             summary_provider=lambda chat_id: ("earlier stuff", covered))
+    messages = builder.build(chat.id)
+    assert messages[0]['content'].endswith("earlier stuff")
+    assert [m['content'] for m in messages[1:]] == ["question 2", "answer 2"]
+
+def test_deleting_chat_deletes_summary(db, authenticated_user):
+    """Test that a chat's summary goes with it"""
+    from server.database import ChatSummary
+    chat = ChatManager.create_chat(authenticated_user.id)
+    db.session.add(ChatSummary(chat_id=chat.id, content="x", through_message_id=1))
+    db.session.commit()
+    ChatManager.delete_chat(chat.id, authenticated_user.id)
+    assert ChatSummary.query.count() == 0
@@ -0,0 +1,207 @@
+# tests/test_tracing.py
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import pytest
+from server.tracing import (JsonLinesExporter, NON_RECORDING_SPAN, OTLPExporter, SpanContext,
+                            TraceCollector, Tracer, propagate, tracer)
+
+class ListExporter:
+    """Keeps exported spans in memory"""
+    
+    def __init__(self):
+        self.spans = []
+    
+    def export(self, spans):
+        self.spans.extend(spans)
+    
+    def by_name(self):
+        return {span.name: span for span in self.spans}
+
+@pytest.fixture
+def exported():
+    """Trace every request into a list, restoring the shared tracer after"""
+    exporter = ListExporter()
+    tracer.configure(exporter, 1.0)
+    yield exporter
+    tracer.flush()
+    tracer.configure(None, 0.0)
+
+class FakeResponse:
+    """Streamed response with fixed SSE lines"""
+    
+    def __init__(self, text):
+        self.lines = [f'data: {{"choices": [{{"delta": {{"content": "{part} "}}}}]}}'.encode()
+                      for part in text.split()] + [b'data: [DONE]']
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_lines(self):
+        return iter(self.lines)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        pass
+
+def test_traceparent_round_trip():
+    """Test W3C traceparent parsing and formatting"""
+    header = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+    context = SpanContext.from_traceparent(header)
+    assert context == SpanContext('4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7', True)
+    assert context.traceparent() == header
+    assert not SpanContext.from_traceparent(header[:-2] + '00').sampled
+    assert SpanContext.from_traceparent('garbage') is None
+    assert SpanContext.from_traceparent(None) is None
+
+def test_nested_spans_and_sampling():
+    """Test parent links, propagation to threads and per-trace sampling"""
+    exporter = ListExporter()
+    local = Tracer(exporter, sample_rate=1.0)
+    with local.span('root') as root:
+        with local.span('child'):
+            with ThreadPoolExecutor(1) as pool:
+                pool.submit(propagate(lambda: local.span('in_thread').__enter__().end())).result()
+    assert local.flush()
+    spans = exporter.by_name()
+    assert {span.context.trace_id for span in exporter.spans} == {root.context.trace_id}
+    assert spans['root'].parent_id is None
+    assert spans['child'].parent_id == root.context.span_id
+    assert spans['in_thread'].parent_id == spans['child'].context.span_id
+    
+    # Unsampled traces record nothing, and their children are not resampled
+    local.configure(exporter, 0.0)
+    assert local.start_span('root') is NON_RECORDING_SPAN
+    local.configure(exporter, 1.0)
+    with local.span('child', parent=NON_RECORDING_SPAN) as span:
+        assert span is NON_RECORDING_SPAN
+        assert local.start_span('grandchild') is NON_RECORDING_SPAN
+    
+    local.configure(exporter, 0.25)
+    sampled = sum(local.start_span('root').is_recording for _ in range(4000))
+    assert 800 < sampled < 1200
+
+def test_unsampled_tracing_is_cheap():
+    """Benchmark: an unsampled span costs about a microsecond"""
+    local = Tracer(ListExporter(), sample_rate=0.0)
+    started = time.perf_counter()
+    for _ in range(100000):
+        with local.span('op'):
+            pass
+    assert (time.perf_counter() - started) / 100000 < 1e-5
+
+def test_llm_calls_are_traced(exported):
+    """Test LLM request spans, retry attempts and traceparent propagation"""
+    import requests
+    from server.backends import BackendPool
+    from server.llm import LMStudioClient
+    client = LMStudioClient(backends=BackendPool(['http://a:1234/v1', 'http://b:1234/v1']))
+    post = MagicMock(side_effect=[requests.exceptions.ConnectionError("refused"),
+                                  FakeResponse("one two three")])
+    client.session.post = post
+    
+    with tracer.span('root') as root:
+        assert ''.join(client.generate_stream("q", task='format')) == "one two three "
+    tracer.flush()
+    
+    request = exported.by_name()['lm_studio.format']
+    assert request.parent_id == root.context.span_id
+    assert request.attributes['llm.tokens'] == 3
+    assert [event['name'] for event in request.events] == ['slot_acquired', 'first_token']
+    attempts = [span for span in exported.spans if span.name == 'lm_studio.request']
+    assert [span.attributes['outcome'] for span in attempts] == ['error', 'ok']
+    assert attempts[0].status == 'error'
+    assert all(span.parent_id == request.context.span_id for span in attempts)
+    # Each attempt tells LM Studio (or a proxy in front of it) its span
+    sent = post.call_args_list[1].kwargs['headers']['traceparent']
+    assert SpanContext.from_traceparent(sent).span_id == attempts[1].context.span_id
+
+def test_music_response_is_traced(app, db, tmp_path, exported):
+    """Test a music reply traces every stage under the send_message span"""
+    import asyncio
+    import sqlite3
+    from server.auth import AuthManager
+    from server.chat import ChatManager
+    from server.music import MusicQueryProcessor
+    from server.websocket import WebSocketHandler
+    db_path = str(tmp_path / 'music.db')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE music (album TEXT, artist TEXT, composer TEXT, year INTEGER, genre TEXT)")
+        conn.execute("INSERT INTO music VALUES ('Arrival', 'ABBA', 'Andersson', 1976, 'Pop')")
+    
+    handler = WebSocketHandler(MagicMock(), app)
+    handler._emit = MagicMock()
+    handler.music_processor = MusicQueryProcessor(db_path, sql_candidates=2)
+    handler.music_processor.llm_client.session.post = MagicMock(
+        return_value=FakeResponse("SELECT album FROM music WHERE artist LIKE '%ABBA%'"))
+    
+    async def summary(prompt, **kwargs):
+        yield "You have Arrival."
+    handler.lm_client.generate_stream = summary
+    chat = ChatManager.create_chat(AuthManager.create_user('tracer', 'password123').id)
+    
+    with tracer.span('socketio.send_message') as root:
+        pass
+    asyncio.run(handler._generate_response(chat.id, "which albums do I have by the band", 'music',
+                                           root, time.time_ns()))
+    tracer.flush()
+    
+    spans = exported.by_name()
+    assert {span.context.trace_id for span in exported.spans} == {root.context.trace_id}
+    response = spans['generate_response']
+    assert response.parent_id == root.context.span_id
+    for name in ('scheduler.queued', 'music.answer_directly', 'music.generate_sql',
+                 'music.execute', 'music.format', 'response.stream'):
+        assert spans[name].parent_id == response.context.span_id, name
+    assert spans['music.generate_sql'].attributes['music.sql_source'] == 'llm'
+    assert spans['music.execute'].attributes['music.rows'] == 1
+    # Speculative candidates run on executor threads and still join the trace
+    candidates = [span for span in exported.spans if span.name == 'music.sql_candidate']
+    assert candidates
+    assert all(span.parent_id == spans['music.generate_sql'].context.span_id for span in candidates)
+    llm = [span for span in exported.spans if span.name == 'lm_studio.sql']
+    assert {span.parent_id for span in llm} <= {span.context.span_id for span in candidates}
+
+def test_jsonl_and_otlp_exporters(tmp_path):
+    """Test the JSON-lines file and OTLP export to the collector stand-in"""
+    path = tmp_path / 'traces.jsonl'
+    collector = TraceCollector(port=0, path=str(tmp_path / 'collected.jsonl'))
+    collector.start()
+    try:
+        exporters = [JsonLinesExporter(str(path)), OTLPExporter(collector.endpoint)]
+        for exporter in exporters:
+            local = Tracer(exporter, sample_rate=1.0)
+            with local.span('root', attributes={'chat.id': 7}):
+                with pytest.raises(ValueError), local.span('failing'):
+                    raise ValueError("boom")
+            assert local.flush()
+            assert local.stats()['exported'] == 2
+    finally:
+        collector.stop()
+    
+    written = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span['name'] for span in written] == ['failing', 'root']
+    assert written[0]['status'] == 'error'
+    assert written[0]['parent_id'] == written[1]['span_id']
+    assert written[1]['attributes'] == {'chat.id': 7}
+    
+    received = {span['name']: span for span in collector.spans}
+    assert received['failing']['parentSpanId'] == received['root']['spanId']
+    assert received['failing']['status'] == {'code': 2}
+    assert received['root']['attributes'] == [{'key': 'chat.id', 'value': {'intValue': '7'}}]
+    assert len((tmp_path / 'collected.jsonl').read_text().splitlines()) == 2
+
+def test_http_request_continues_incoming_trace(client, exported):
+    """Test HTTP requests get a span under the caller's traceparent"""
+    parent = '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'
+    client.get('/', headers={'traceparent': parent})
+    client.get('/', headers={'traceparent': parent[:-2] + '00'})
+    tracer.flush()
+    
+    spans = [span for span in exported.spans if span.name == 'GET /']
+    assert len(spans) == 1
+    assert spans[0].context.trace_id == '4bf92f3577b34da6a3ce929d0e0e4736'
+    assert spans[0].parent_id == '00f067aa0ba902b7'